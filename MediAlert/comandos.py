@@ -0,0 +1,151 @@
+# medialert/comandos.py
+# Comandos de mantenimiento, ejecutables con: flask --app main <comando>
+
+import click
+
+def registrar_comandos(app):
+    """Registra los comandos de mantenimiento en la CLI de Flask."""
+
+    @app.cli.command('auditoria-mantenimiento')
+    @click.option('--meses-adelante', type=int, default=None, help='Particiones futuras a crear.')
+    @click.option('--meses-retencion', type=int, default=None, help='Meses de auditoría que se conservan en línea.')
+    @click.option('--destino', default=None, help='Carpeta donde se guardan los archivos comprimidos.')
+    def auditoria_mantenimiento(meses_adelante, meses_retencion, destino):
+        """Crea particiones de auditoría futuras y archiva/separa las que superan la retención."""
+        from services.audit_service import ejecutar_mantenimiento_auditoria
+        resumen = ejecutar_mantenimiento_auditoria(
+            meses_adelante if meses_adelante is not None else app.config['AUDIT_PARTITION_MONTHS_AHEAD'],
+            meses_retencion if meses_retencion is not None else app.config['AUDIT_RETENTION_MONTHS'],
+            destino or app.config['AUDIT_ARCHIVE_PATH']
+        )
+        click.echo(f"Particiones creadas: {resumen['particiones_creadas']}")
+        for ruta in resumen['archivos']:
+            click.echo(f"Archivada: {ruta}")
+
+    @app.cli.command('receta-snapshot-verificar')
+    @click.option('--reparar', is_flag=True, help='Recalcula o borra los snapshots con diferencias.')
+    def receta_snapshot_verificar(reparar):
+        """Detecta diferencias entre receta_snapshot y los datos en vivo de las alertas."""
+        from services.alert_service import verificar_receta_snapshot
+        resultado = verificar_receta_snapshot(reparar)
+        for tipo in ('faltantes', 'sobrantes', 'diferentes'):
+            ids = resultado[tipo]
+            click.echo(f"{tipo.capitalize()}: {len(ids)}" + (f" (alertas {', '.join(map(str, ids[:20]))}{' ...' if len(ids) > 20 else ''})" if ids else ''))
+        if reparar:
+            click.echo(f"Filas reparadas: {resultado['reparadas']}")
+        elif any(resultado[tipo] for tipo in ('faltantes', 'sobrantes', 'diferentes')):
+            raise SystemExit(1)
+
+    @app.cli.command('contadores-verificar')
+    @click.option('--reparar', is_flag=True, help='Recalcula los contadores desde las alertas y usuarios.')
+    def contadores_verificar(reparar):
+        """Detecta diferencias entre los contadores mantenidos por trigger y los datos reales."""
+        from services.alert_service import verificar_contadores_alertas
+        from services.stats_service import verificar_estadisticas
+        hay_diferencias = False
+        for titulo, verificar in (('Clientes con contadores diferentes', verificar_contadores_alertas),
+                                  ('Estadísticas diferentes', verificar_estadisticas)):
+            resultado = verificar(reparar)
+            ids = resultado['diferentes']
+            hay_diferencias = hay_diferencias or bool(ids)
+            click.echo(f"{titulo}: {len(ids)}" + (f" ({', '.join(map(str, ids[:20]))}{' ...' if len(ids) > 20 else ''})" if ids else ''))
+            if reparar:
+                click.echo(f"Filas recalculadas: {resultado['reparadas']}")
+        if hay_diferencias and not reparar:
+            raise SystemExit(1)
+
+    @app.cli.command('recordatorios')
+    @click.option('--zona', default=None, help='Zona horaria de hora_preferida (por defecto RECORDATORIOS_ZONA_HORARIA).')
+    def recordatorios(zona):
+        """Ejecuta el programador de recordatorios de alertas hasta recibir Ctrl+C."""
+        import logging
+        from services.alert_service import contar_frecuencias_pendientes
+        from services.reminder_service import ReminderScheduler
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
+        app.logger.setLevel(logging.INFO)
+        programador = ReminderScheduler(
+            zona=zona,
+            tamano_pagina=app.config['RECORDATORIOS_TAMANO_PAGINA'],
+            tamano_lote=app.config['RECORDATORIOS_TAMANO_LOTE'],
+            recuperacion=app.config['RECORDATORIOS_RECUPERACION'],
+            ventana=app.config['RECORDATORIOS_VENTANA']
+        )
+        click.echo(f"Programador de recordatorios iniciado (zona {programador.zona.key}).")
+        pendientes = contar_frecuencias_pendientes()
+        if pendientes:
+            click.echo(f"Aviso: {pendientes} alertas activas sin frecuencia estructurada no tendrán "
+                       f"recordatorios (ejecute 'flask frecuencias-normalizar').")
+        try:
+            programador.ejecutar()
+        except KeyboardInterrupt:
+            pass
+        click.echo(f"Programador detenido: {programador.stats()}")
+
+    @app.cli.command('frecuencias-normalizar')
+    @click.option('--todas', is_flag=True, help='Vuelve a interpretar todas las alertas, no solo las pendientes.')
+    @click.option('--lote', type=int, default=1000, help='Alertas por transacción.')
+    def frecuencias_normalizar(todas, lote):
+        """Rellena la frecuencia estructurada (y con ella proxima_toma) a partir del texto de frecuencia."""
+        from services.alert_service import normalizar_frecuencias
+        resultado = normalizar_frecuencias(todas, lote)
+        click.echo(f"Alertas revisadas: {resultado['revisadas']}")
+        click.echo(f"Alertas actualizadas: {resultado['actualizadas']}")
+        for texto, cantidad in sorted(resultado['sin_reconocer'].items(), key=lambda t: -t[1]):
+            click.echo(f"Sin reconocer: '{texto}' ({cantidad})")
+
+    @app.cli.command('notificaciones-worker')
+    @click.option('--hilos', type=int, default=1, help='Workers en este proceso.')
+    @click.option('--lote', type=int, default=None, help='Notificaciones por transacción (por defecto NOTIFICACIONES_TAMANO_LOTE).')
+    @click.option('--una-vez', is_flag=True, help='Termina cuando no quedan notificaciones listas.')
+    def notificaciones_worker(hilos, lote, una_vez):
+        """Entrega las notificaciones pendientes de la outbox hasta recibir Ctrl+C."""
+        import logging
+        import threading
+        from services.notification_service import NotificationWorker, crear_canal
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
+        app.logger.setLevel(logging.INFO)
+        canales = [crear_canal(nombre, app.config) for nombre in app.config['NOTIFICACIONES_CANALES']]
+        workers = [
+            NotificationWorker(
+                canales,
+                tamano_lote=lote or app.config['NOTIFICACIONES_TAMANO_LOTE'],
+                max_intentos=app.config['NOTIFICACIONES_MAX_INTENTOS'],
+                reintento_base=app.config['NOTIFICACIONES_REINTENTO_BASE'],
+                reintento_maximo=app.config['NOTIFICACIONES_REINTENTO_MAXIMO'],
+                espera_inactiva=app.config['NOTIFICACIONES_ESPERA_INACTIVA']
+            )
+            for _ in range(hilos)
+        ]
+
+        def ejecutar(worker):
+            with app.app_context():
+                worker.ejecutar(una_vez)
+
+        click.echo(f"Workers de notificaciones: {hilos} (canales: {', '.join(c.nombre for c in canales)}).")
+        hilos_worker = [threading.Thread(target=ejecutar, args=(w,), daemon=True) for w in workers]
+        for hilo in hilos_worker:
+            hilo.start()
+        try:
+            for hilo in hilos_worker:
+                while hilo.is_alive():
+                    hilo.join(0.5)
+        except KeyboardInterrupt:
+            for worker in workers:
+                worker.detener()
+            for hilo in hilos_worker:
+                hilo.join()
+        for i, worker in enumerate(workers):
+            click.echo(f"Worker {i}: {worker.stats()}")
+
+    @app.cli.command('notificaciones-fallidas')
+    @click.option('--reintentar', is_flag=True, help='Devuelve todas las notificaciones fallidas a la cola.')
+    @click.option('--limite', type=int, default=20, help='Fallidas que se listan.')
+    def notificaciones_fallidas(reintentar, limite):
+        """Lista las notificaciones que agotaron sus intentos o fueron rechazadas."""
+        from services.notification_service import get_notificaciones_fallidas, reintentar_notificaciones_fallidas
+        if reintentar:
+            click.echo(f"Notificaciones devueltas a la cola: {reintentar_notificaciones_fallidas()}")
+            return
+        for n in get_notificaciones_fallidas(limite):
+            click.echo(f"{n['id']} alerta {n['alerta_id']} [{n['canal']}] {n['programada_para']:%Y-%m-%d %H:%M} "
+                       f"intentos {n['intentos']}: {n['ultimo_error']}")
@@ -13,6 +13,96 @@ PG_USER = os.getenv('PG_USER')
 PG_PASS = os.getenv('PG_PASS')
 PG_PORT = os.getenv('PG_PORT')
 
+# --- Configuración del Pool de Conexiones ---
+# PG_POOL_MAX_SIZE = 0 desactiva el pool (se abre una conexión nueva en cada llamada).
+PG_POOL_MIN_SIZE = int(os.getenv('PG_POOL_MIN_SIZE', 1))
+PG_POOL_MAX_SIZE = int(os.getenv('PG_POOL_MAX_SIZE', 10))
+PG_POOL_TIMEOUT = float(os.getenv('PG_POOL_TIMEOUT', 5))                    # Segundos de espera por una conexión libre
+PG_POOL_MAX_AGE = float(os.getenv('PG_POOL_MAX_AGE', 1800))                 # Segundos antes de reciclar una conexión
+PG_POOL_HEALTHCHECK_IDLE = float(os.getenv('PG_POOL_HEALTHCHECK_IDLE', 30)) # Verificar con SELECT 1 si estuvo ociosa más de esto
+
+# --- Réplicas de Lectura (opcional) ---
+# DSN libpq separados por ';', p. ej. "host=replica1 port=5432 dbname=MediAlert user=app password=x".
+# Las funciones de servicio marcadas con @solo_lectura leen de ellas (requiere el pool activo).
+# Prueba local con dos instancias: pg_basebackup -D <dir> -R -h localhost -p 5432 -U postgres,
+# arrancar <dir> con pg_ctl -o '-p 5433' y usar PG_REPLICA_DSNS="host=localhost port=5433 dbname=...".
+PG_REPLICA_DSNS = [dsn.strip() for dsn in os.getenv('PG_REPLICA_DSNS', '').split(';') if dsn.strip()]
+PG_REPLICA_STICKY_SECONDS = float(os.getenv('PG_REPLICA_STICKY_SECONDS', 10))  # Tras escribir, la sesión lee del primario
+PG_REPLICA_RETRY_SECONDS = float(os.getenv('PG_REPLICA_RETRY_SECONDS', 30))    # Pausa antes de reintentar una réplica caída
+PG_REPLICA_CONNECT_TIMEOUT = int(os.getenv('PG_REPLICA_CONNECT_TIMEOUT', 2))   # Segundos para conectar a una réplica
+
+# --- Caché de Catálogos (medicamentos, EPS) ---
+# Caché en memoria de cada proceso, invalidada por LISTEN/NOTIFY desde los triggers de la BD.
+CATALOG_CACHE_ENABLED = os.getenv('CATALOG_CACHE_ENABLED', 'true').lower() == 'true'
+
+# --- Caché de Lecturas de Servicios (services/cache.py) ---
+# La clave incluye la versión de las tablas consultadas (versiones_tabla), así que nunca sirve
+# datos anteriores a la última escritura confirmada que pueda ver la consulta.
+# 'memoria' (por proceso) | 'archivo' (compartida en el servidor) | 'redis' | 'ninguno'
+SERVICE_CACHE_BACKEND = os.getenv('SERVICE_CACHE_BACKEND', 'memoria')
+SERVICE_CACHE_MAX_ENTRIES = int(os.getenv('SERVICE_CACHE_MAX_ENTRIES', 1000))
+SERVICE_CACHE_TTL = int(os.getenv('SERVICE_CACHE_TTL', 300))              # Segundos
+SERVICE_CACHE_DIR = os.getenv('SERVICE_CACHE_DIR')                        # Por defecto instance/service_cache
+SERVICE_CACHE_REDIS_URL = os.getenv('SERVICE_CACHE_REDIS_URL', 'redis://localhost:6379/0')
+
+# --- Programador de Recordatorios (flask --app main recordatorios) ---
+# hora_preferida y las fechas de las alertas se interpretan en esta zona horaria. El trigger que
+# mantiene alertas.proxima_toma usa la configuración de BD medialert.zona_horaria (por defecto la misma).
+RECORDATORIOS_ZONA_HORARIA = os.getenv('RECORDATORIOS_ZONA_HORARIA', 'America/Bogota')
+RECORDATORIOS_TAMANO_PAGINA = int(os.getenv('RECORDATORIOS_TAMANO_PAGINA', 5000))       # Alertas por consulta en la carga
+RECORDATORIOS_TAMANO_LOTE = int(os.getenv('RECORDATORIOS_TAMANO_LOTE', 1000))           # Recordatorios por entrega
+RECORDATORIOS_RECUPERACION = int(os.getenv('RECORDATORIOS_RECUPERACION', 900))          # Segundos: tomas vencidas que se envían al arrancar
+RECORDATORIOS_VENTANA = int(os.getenv('RECORDATORIOS_VENTANA', 3600))                  # Segundos de tomas futuras que se tienen en memoria
+
+# --- Outbox de Notificaciones (flask --app main notificaciones-worker) ---
+# El programador deja una notificación por toma y canal; los workers (uno o varios procesos, en
+# cualquier servidor) las reclaman por lotes y las entregan. 'archivo' escribe líneas JSON en
+# NOTIFICACIONES_DIR (por defecto instance/notificaciones); 'smtp' envía correo.
+NOTIFICACIONES_CANALES = [c.strip() for c in os.getenv('NOTIFICACIONES_CANALES', 'archivo').split(',') if c.strip()]
+NOTIFICACIONES_DIR = os.getenv('NOTIFICACIONES_DIR')
+NOTIFICACIONES_SMTP_HOST = os.getenv('NOTIFICACIONES_SMTP_HOST', 'localhost')
+NOTIFICACIONES_SMTP_PORT = int(os.getenv('NOTIFICACIONES_SMTP_PORT', 25))
+NOTIFICACIONES_SMTP_USUARIO = os.getenv('NOTIFICACIONES_SMTP_USUARIO')
+NOTIFICACIONES_SMTP_CONTRASENA = os.getenv('NOTIFICACIONES_SMTP_CONTRASENA')
+NOTIFICACIONES_SMTP_STARTTLS = os.getenv('NOTIFICACIONES_SMTP_STARTTLS', 'false').lower() == 'true'
+NOTIFICACIONES_REMITENTE = os.getenv('NOTIFICACIONES_REMITENTE', 'MediAlert <no-responder@medialert.co>')
+NOTIFICACIONES_TAMANO_LOTE = int(os.getenv('NOTIFICACIONES_TAMANO_LOTE', 100))          # Notificaciones que reclama un worker por transacción
+NOTIFICACIONES_MAX_INTENTOS = int(os.getenv('NOTIFICACIONES_MAX_INTENTOS', 5))          # Después pasan a 'fallida'
+NOTIFICACIONES_REINTENTO_BASE = int(os.getenv('NOTIFICACIONES_REINTENTO_BASE', 30))     # Segundos; se duplica en cada intento
+NOTIFICACIONES_REINTENTO_MAXIMO = int(os.getenv('NOTIFICACIONES_REINTENTO_MAXIMO', 3600))
+NOTIFICACIONES_ESPERA_INACTIVA = float(os.getenv('NOTIFICACIONES_ESPERA_INACTIVA', 5.0))  # Segundos entre revisiones sin avisos
+
+# --- Eventos de Toma (confirmaciones del paciente) ---
+# Activado por defecto: las confirmaciones se encolan y un hilo de fondo por proceso las inserta
+# por lotes, así un pico de confirmaciones no genera una transacción por evento. Con la cola
+# llena se aplica EVENTOS_TOMA_BACKPRESSURE (ver AUDIT_ASYNC_BACKPRESSURE).
+EVENTOS_TOMA_ASYNC_ENABLED = os.getenv('EVENTOS_TOMA_ASYNC_ENABLED', 'true').lower() == 'true'
+EVENTOS_TOMA_QUEUE_SIZE = int(os.getenv('EVENTOS_TOMA_QUEUE_SIZE', 50000))
+EVENTOS_TOMA_BATCH_SIZE = int(os.getenv('EVENTOS_TOMA_BATCH_SIZE', 1000))
+EVENTOS_TOMA_FLUSH_INTERVAL = float(os.getenv('EVENTOS_TOMA_FLUSH_INTERVAL', 0.5))  # Segundos
+EVENTOS_TOMA_BACKPRESSURE = os.getenv('EVENTOS_TOMA_BACKPRESSURE', 'sincrono')
+
+# --- Modo de Auditoría ---
+# 'dual': cada escritura deja la fila del trigger (INSERT/UPDATE/DELETE) y otra de la aplicación
+#         (EDICION_ALERTA, ...), como hasta ahora.
+# 'unificado': la aplicación anota su acción en la transacción y el trigger escribe una sola fila
+#         con la acción semántica, la operación SQL y los detalles de la aplicación.
+AUDIT_MODE = os.getenv('AUDIT_MODE', 'dual')
+
+# --- Auditoría de Aplicación Asíncrona ---
+# Desactivada por defecto: en modo síncrono la fila de auditoría se confirma en la misma
+# transacción que los datos. Al activarla la auditoría sale del camino de la petición y se
+# escribe en lotes desde un hilo de fondo, a cambio de perder esa atomicidad.
+AUDIT_ASYNC_ENABLED = os.getenv('AUDIT_ASYNC_ENABLED', 'false').lower() == 'true'
+AUDIT_ASYNC_QUEUE_SIZE = int(os.getenv('AUDIT_ASYNC_QUEUE_SIZE', 10000))
+AUDIT_ASYNC_BATCH_SIZE = int(os.getenv('AUDIT_ASYNC_BATCH_SIZE', 500))
+AUDIT_ASYNC_FLUSH_INTERVAL = float(os.getenv('AUDIT_ASYNC_FLUSH_INTERVAL', 1.0))  # Segundos
+AUDIT_ASYNC_BACKPRESSURE = os.getenv('AUDIT_ASYNC_BACKPRESSURE', 'sincrono')      # 'sincrono' | 'bloquear' | 'descartar'
+
+# --- Particionado y Retención de Auditoría ---
+AUDIT_PARTITION_MONTHS_AHEAD = int(os.getenv('AUDIT_PARTITION_MONTHS_AHEAD', 3))
+AUDIT_RETENTION_MONTHS = int(os.getenv('AUDIT_RETENTION_MONTHS', 12))
+
 # --- Configuración de Flask ---
 SECRET_KEY = os.getenv('FLASK_SECRET_KEY', 'super_secret_key_dev_only') # Use a strong key in production
 
@@ -25,9 +115,11 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 # y la carpeta 'instance' está en la raíz del proyecto
 INSTANCE_FOLDER_NAME = 'instance'
 REPORTS_SUBDIRECTORY = 'generated_reports'
+AUDIT_ARCHIVE_SUBDIRECTORY = 'audit_archive'
 
 INSTANCE_FOLDER_PATH = os.path.join(BASE_DIR, '..', INSTANCE_FOLDER_NAME)
 REPORTS_STORAGE_PATH = os.path.join(INSTANCE_FOLDER_PATH, REPORTS_SUBDIRECTORY)
+AUDIT_ARCHIVE_PATH = os.path.join(INSTANCE_FOLDER_PATH, AUDIT_ARCHIVE_SUBDIRECTORY)
 
 ALLOWED_EXTENSIONS = {'pdf'}
 
@@ -1,9 +1,31 @@
 # medialert/database.py
 
+import atexit
+import contextvars
+import json
+import os
+import threading
+import time as reloj
+from functools import partial, wraps
+
 import psycopg2
-from psycopg2.extras import RealDictCursor, Json
-from flask import current_app, session
-from datetime import date, time, datetime
+from psycopg2.extras import RealDictCursor, Json, execute_values
+from flask import current_app, session, g, has_request_context, jsonify
+from datetime import date, time, datetime, timezone
+from decimal import Decimal, InvalidOperation
+
+from utils.db_pool import ConnectionPool, ReplicaSet
+from utils.batch_writer import BatchWriter
+from utils.catalog_cache import CatalogCache
+from utils.db_listener import NotifyListener
+
+_pool_lock = threading.Lock()
+# Canal de NOTIFY por el que los triggers de medicamentos/eps avisan de cambios en los catálogos.
+CANAL_CATALOGOS = 'medialert_catalogos'
+# Activo mientras se ejecuta una función de servicio decorada con @solo_lectura.
+_solo_lectura = contextvars.ContextVar('medialert_solo_lectura', default=False)
+# Última conexión de réplica entregada en el contexto actual (para reintentar en el primario).
+_replica_en_uso = contextvars.ContextVar('medialert_replica_en_uso', default=None)
 
 def _serialize_data_for_jsonb(obj):
     if isinstance(obj, dict):
@@ -14,57 +36,621 @@ def _serialize_data_for_jsonb(obj):
         return obj.isoformat()
     return obj
 
+def _mismo_valor(anterior, nuevo):
+    """
+    Compara un valor leído de la BD con el recibido en la petición, que suele venir como texto:
+    el nuevo se interpreta con el tipo del anterior ('08:00' y time(8, 0), '1.5' y
+    Decimal('1.50') son el mismo valor). Si no se puede interpretar se comparan como texto.
+    """
+    if anterior == '': anterior = None
+    if nuevo == '': nuevo = None
+    if anterior is None or nuevo is None:
+        return anterior is None and nuevo is None
+    try:
+        if isinstance(anterior, bool) or isinstance(nuevo, bool):
+            return str(anterior).lower() == str(nuevo).lower()
+        if isinstance(anterior, (int, float, Decimal)):
+            return Decimal(str(anterior)) == Decimal(str(nuevo))
+        if isinstance(anterior, datetime):
+            return anterior == (nuevo if isinstance(nuevo, datetime) else datetime.fromisoformat(str(nuevo)))
+        if isinstance(anterior, (date, time)):
+            return anterior == (nuevo if isinstance(nuevo, type(anterior)) else type(anterior).fromisoformat(str(nuevo)))
+    except (ValueError, TypeError, InvalidOperation):
+        pass
+    return str(anterior) == str(nuevo)
+
+def _delta_auditoria(datos_anteriores, datos_nuevos):
+    """
+    Reduce un par antes/después a las claves cuyo valor cambió. Se compara antes de serializar,
+    con el tipo de la BD (ver _mismo_valor), porque los datos de la BD (int, time, Decimal) y
+    los del cuerpo de la petición (str) no tienen el mismo tipo ni la misma forma de texto.
+    """
+    cambiadas = [
+        k for k, v in datos_nuevos.items()
+        if k not in datos_anteriores or not _mismo_valor(datos_anteriores[k], v)
+    ]
+    return ({k: datos_anteriores.get(k) for k in cambiadas},
+            {k: datos_nuevos[k] for k in cambiadas})
+
+def _connect_kwargs(config):
+    return dict(
+        host=config['PG_HOST'],
+        database=config['PG_DB'],
+        user=config['PG_USER'],
+        password=config['PG_PASS'],
+        port=config['PG_PORT'],
+        client_encoding='UTF8'
+    )
+
+def get_db_pool():
+    """
+    Devuelve el pool de conexiones de la aplicación, creándolo en el primer uso.
+    Retorna None si el pool está desactivado (PG_POOL_MAX_SIZE = 0).
+    """
+    config = current_app.config
+    if not config.get('PG_POOL_MAX_SIZE'):
+        return None
+    pool = current_app.extensions.get('medialert_db_pool')
+    if pool is None:
+        with _pool_lock:
+            pool = current_app.extensions.get('medialert_db_pool')
+            if pool is None:
+                pool = ConnectionPool(
+                    _connect_kwargs(config),
+                    minconn=config['PG_POOL_MIN_SIZE'],
+                    maxconn=config['PG_POOL_MAX_SIZE'],
+                    timeout=config['PG_POOL_TIMEOUT'],
+                    max_age=config['PG_POOL_MAX_AGE'],
+                    healthcheck_idle=config['PG_POOL_HEALTHCHECK_IDLE'],
+                    logger=current_app.logger
+                )
+                current_app.extensions['medialert_db_pool'] = pool
+    return pool
+
+def get_replica_set():
+    """
+    Devuelve las réplicas de lectura configuradas (PG_REPLICA_DSNS), creándolas en el primer uso.
+    Retorna None si no hay réplicas o si el pool está desactivado.
+    """
+    config = current_app.config
+    if not config.get('PG_REPLICA_DSNS') or not config.get('PG_POOL_MAX_SIZE'):
+        return None
+    replicas = current_app.extensions.get('medialert_db_replicas')
+    if replicas is None:
+        with _pool_lock:
+            replicas = current_app.extensions.get('medialert_db_replicas')
+            if replicas is None:
+                # minconn=0: una réplica caída no impide arrancar la aplicación.
+                pools = [
+                    ConnectionPool(
+                        dict(dsn=dsn, connect_timeout=config['PG_REPLICA_CONNECT_TIMEOUT'], client_encoding='UTF8'),
+                        minconn=0,
+                        maxconn=config['PG_POOL_MAX_SIZE'],
+                        timeout=config['PG_POOL_TIMEOUT'],
+                        max_age=config['PG_POOL_MAX_AGE'],
+                        healthcheck_idle=config['PG_POOL_HEALTHCHECK_IDLE'],
+                        logger=current_app.logger
+                    )
+                    for dsn in config['PG_REPLICA_DSNS']
+                ]
+                replicas = ReplicaSet(pools, retry_seconds=config['PG_REPLICA_RETRY_SECONDS'],
+                                      logger=current_app.logger)
+                current_app.extensions['medialert_db_replicas'] = replicas
+    return replicas
+
+def solo_lectura(func):
+    """
+    Marca una función de servicio que solo lee. Sus llamadas a get_db_connection() se envían a
+    una réplica, salvo que la petición ya haya abierto la conexión del primario, que la sesión
+    haya escrito hace menos de PG_REPLICA_STICKY_SECONDS (leer lo propio recién escrito) o que
+    no haya réplicas disponibles. Si la conexión a la réplica falla durante la consulta, la
+    réplica se marca como caída y la función se repite una vez contra el primario.
+    """
+    @wraps(func)
+    def envoltura(*args, **kwargs):
+        token = _solo_lectura.set(True)
+        token_replica = _replica_en_uso.set(None)
+        try:
+            return func(*args, **kwargs)
+        except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+            conn = _replica_en_uso.get()
+            if conn is None:
+                raise
+            _descartar_replica(conn, e)
+            _solo_lectura.set(False)
+            return func(*args, **kwargs)
+        finally:
+            _solo_lectura.reset(token)
+            _replica_en_uso.reset(token_replica)
+    return envoltura
+
+def _descartar_replica(conn, error):
+    current_app.logger.warning(f"Lectura en réplica fallida, se repite en el primario: {error}".strip())
+    get_replica_set().report_failure(conn, error)
+    if has_request_context() and g.get('_db_replica') is not None:
+        g.pop('_db_replica')
+    try:
+        conn.close()
+    except psycopg2.Error:
+        pass
+
+def _sesion_escribio_recientemente():
+    if not has_request_context():
+        return False
+    ultima = session.get('_db_ultima_escritura')
+    return ultima is not None and reloj.time() - ultima < current_app.config['PG_REPLICA_STICKY_SECONDS']
+
+def _checkout_replica_connection():
+    """Conexión a una réplica para la lectura en curso, o None si debe usarse el primario."""
+    if not _solo_lectura.get():
+        return None
+    replicas = get_replica_set()
+    if replicas is None or _sesion_escribio_recientemente():
+        return None
+    conn = replicas.getconn()
+    _replica_en_uso.set(conn)
+    return conn
+
+class RequestConnection:
+    """
+    Unidad de trabajo de una petición HTTP: una única conexión compartida por todas las
+    llamadas a servicios de la petición (incluida la auditoría de aplicación).
+
+    commit() y close() de los servicios se difieren: el commit real se hace una sola vez
+    al terminar la petición, salvo que la respuesta sea un error 5xx. rollback() sí se ejecuta
+    de inmediato y marca la unidad de trabajo para que no se confirme nada más en esa petición.
+    """
+
+    def __init__(self, conn):
+        self._conn = conn
+        self.rollback_only = False
+
+    def commit(self):
+        # Tras un rollback() nada de la petición se confirma: lo escrito después (p. ej. la
+        # auditoría de un error) se perdería sin rastro, así que al menos queda en el log.
+        if self.rollback_only:
+            current_app.logger.warning(
+                "Commit ignorado: la transacción de la petición ya se revirtió y los cambios posteriores se descartan."
+            )
+
+    def close(self):
+        pass
+
+    def rollback(self):
+        self.rollback_only = True
+        self._conn.rollback()
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.rollback()
+
+    def finish(self, commit):
+        """Confirma (o revierte) la transacción de la petición y libera la conexión."""
+        try:
+            if commit and not self.rollback_only:
+                self._conn.commit()
+            else:
+                self._conn.rollback()
+        finally:
+            self._conn.close()
+
+def _checkout_connection():
+    pool = get_db_pool()
+    conn = pool.getconn() if pool else psycopg2.connect(**_connect_kwargs(current_app.config))
+    # IMPORTANTE: Establecer el ID del usuario de la sesión para la auditoría a nivel de BD
+    # Esto es usado por los triggers de la base de datos.
+    if has_request_context() and 'user_id' in session:
+        with conn.cursor() as cur:
+            cur.execute("SELECT set_config('medialert.app_user_id', %s, true);", (str(session['user_id']),))
+    return conn
+
 def get_db_connection():
-    """Establece y devuelve una conexión a la base de datos PostgreSQL."""
+    """
+    Devuelve una conexión a la base de datos PostgreSQL tomada del pool.
+    Dentro de una petición HTTP devuelve siempre la misma conexión (RequestConnection,
+    guardada en flask.g), que se confirma una sola vez al terminar la petición.
+    Fuera de una petición (comandos, hilos de fondo) devuelve una conexión propia;
+    conn.close() la devuelve al pool.
+    Las funciones decoradas con @solo_lectura pueden recibir una conexión a una réplica.
+    """
     try:
-        conn = psycopg2.connect(
-            host=current_app.config['PG_HOST'],
-            database=current_app.config['PG_DB'],
-            user=current_app.config['PG_USER'],
-            password=current_app.config['PG_PASS'],
-            port=current_app.config['PG_PORT'],
-            client_encoding='UTF8'
-        )
-        # IMPORTANTE: Establecer el ID del usuario de la sesión para la auditoría a nivel de BD
-        # Esto es usado por los triggers de la base de datos.
-        if 'user_id' in session:
-            with conn.cursor() as cur:
-                cur.execute("SELECT set_config('medialert.app_user_id', %s, true);", (str(session['user_id']),))
-        return conn
+        if has_request_context():
+            uow = g.get('_db_uow')
+            if uow is None and _solo_lectura.get():
+                replica = g.get('_db_replica')
+                if replica is None:
+                    conn = _checkout_replica_connection()
+                    if conn is not None:
+                        replica = g._db_replica = RequestConnection(conn)
+                else:
+                    _replica_en_uso.set(replica._conn)
+                if replica is not None:
+                    return replica
+            if uow is None:
+                uow = g._db_uow = RequestConnection(_checkout_connection())
+            return uow
+        return _checkout_replica_connection() or _checkout_connection()
+    except psycopg2.Error as e:
+        current_app.logger.error(f"Error al conectar con la base de datos: {e}")
+        raise
+
+def get_dedicated_db_connection(solo_lectura=False):
+    """
+    Devuelve una conexión propia del pool aunque haya una petición en curso.
+    Las respuestas en streaming siguen leyendo después de que la unidad de trabajo de la
+    petición se confirmó en after_request, así que no pueden usar la conexión compartida.
+    Con solo_lectura=True se aplica el mismo enrutamiento a réplicas que con @solo_lectura.
+    El llamador debe cerrarla con conn.close().
+    """
+    try:
+        if solo_lectura:
+            token = _solo_lectura.set(True)
+            try:
+                conn = _checkout_replica_connection()
+            finally:
+                _solo_lectura.reset(token)
+            if conn is not None:
+                return conn
+        return _checkout_connection()
     except psycopg2.Error as e:
         current_app.logger.error(f"Error al conectar con la base de datos: {e}")
         raise
 
+def fetch_rows_as_json(conn, query, params=None):
+    """
+    Ejecuta 'query' y devuelve el resultado como texto JSON (arreglo de objetos) generado por
+    PostgreSQL con row_to_json, sin construir un dict por fila en Python. Fechas y horas salen
+    en ISO 8601, igual que con MediAlertJSONProvider. 'query' no debe terminar en ';'.
+    """
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT row_to_json(q)::text FROM ({query}) q", params)
+        return '[' + ','.join(fila[0] for fila in cur) + ']'
+
+def contar_filas(conn, query, params=None, exacto=False):
+    """
+    Número de filas que devuelve 'query': exacto con COUNT(*) o estimado con el plan de
+    PostgreSQL (EXPLAIN), que no recorre la tabla y cuesta lo mismo con cualquier volumen.
+    """
+    with conn.cursor() as cur:
+        if exacto:
+            cur.execute(f"SELECT count(*) FROM ({query}) q", params)
+            return cur.fetchone()[0]
+        cur.execute(f"EXPLAIN (FORMAT JSON) {query}", params)
+        plan = cur.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+
+@solo_lectura
+def obtener_versiones_tablas(tablas):
+    """
+    Devuelve {tabla: versión} desde versiones_tabla (mantenida por triggers en cada cambio).
+    Dentro de una petición usa la misma conexión que las lecturas @solo_lectura posteriores
+    (la réplica de la petición, o el primario si ya está abierto o la sesión escribió hace
+    poco) y guarda el resultado en g, para que obtener_catalogo() no sirva datos anteriores a
+    esa versión.
+    """
+    conn = None
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        cur.execute("SELECT tabla, version FROM versiones_tabla WHERE tabla = ANY(%s::name[]);", (list(tablas),))
+        versiones = {tabla: 0 for tabla in tablas}
+        versiones.update(dict(cur.fetchall()))
+    except psycopg2.Error as e:
+        current_app.logger.error(f"Error de BD al leer versiones de tablas: {e}")
+        raise
+    finally:
+        if conn:
+            conn.close()
+    if has_request_context():
+        g._versiones_tabla = {**g.get('_versiones_tabla', {}), **versiones}
+    return versiones
+
+def _transaccion_escribio(uow):
+    """Indica si la transacción de la petición modificó datos (tiene un xid asignado)."""
+    if uow.rollback_only:
+        return False
+    with uow.cursor() as cur:
+        cur.execute("SELECT txid_current_if_assigned() IS NOT NULL;")
+        return cur.fetchone()[0]
+
+def ejecutar_al_confirmar(callback):
+    """
+    Ejecuta callback() cuando los cambios de la operación actual ya están confirmados: dentro
+    de una petición, después del commit de la unidad de trabajo (y nunca si se revierte);
+    fuera de una petición, de inmediato, porque el commit del servicio ya fue real.
+    """
+    if has_request_context():
+        g.setdefault('_al_confirmar', []).append(callback)
+    else:
+        callback()
+
+def _ejecutar_callbacks_confirmacion(callbacks):
+    for callback in callbacks:
+        try:
+            callback()
+        except Exception as e:
+            current_app.logger.error(f"Error en acción posterior al commit: {e!r}")
+
+def _commit_request_connection(response):
+    """
+    Confirma la unidad de trabajo antes de enviar la respuesta, para poder informar un fallo.
+    Flask también llama a after_request tras una excepción no manejada (respuesta 500), así que
+    las respuestas 5xx no confirman nada: la unidad de trabajo se revierte.
+    """
+    replica = g.pop('_db_replica', None)
+    if replica is not None:
+        try:
+            replica.finish(commit=False)
+        except psycopg2.Error as e:
+            current_app.logger.error(f"Error al liberar la conexión de réplica: {e}")
+    uow = g.pop('_db_uow', None)
+    if uow is None:
+        return response
+    if response.status_code >= 500:
+        try:
+            uow.finish(commit=False)
+        except psycopg2.Error as e:
+            current_app.logger.error(f"Error al revertir la transacción de la petición: {e}")
+        return response
+    try:
+        # Con réplicas, se recuerda cuándo escribió la sesión para leer del primario un tiempo.
+        escribio = get_replica_set() is not None and _transaccion_escribio(uow)
+        confirma = not uow.rollback_only
+        uow.finish(commit=True)
+        if escribio:
+            session['_db_ultima_escritura'] = reloj.time()
+        if confirma:
+            _ejecutar_callbacks_confirmacion(g.pop('_al_confirmar', []))
+    except psycopg2.Error as e:
+        current_app.logger.error(f"Error al confirmar la transacción de la petición: {e}")
+        response = jsonify({'error': f'Error al confirmar los cambios en la base de datos: {e}'})
+        response.status_code = 500
+    return response
+
+def _release_request_connection(exc):
+    """Red de seguridad: si la petición terminó con una excepción no manejada, revierte."""
+    replica = g.pop('_db_replica', None)
+    if replica is not None:
+        try:
+            replica.finish(commit=False)
+        except psycopg2.Error as e:
+            current_app.logger.error(f"Error al liberar la conexión de réplica: {e}")
+    uow = g.pop('_db_uow', None)
+    if uow is not None:
+        try:
+            uow.finish(commit=False)
+        except psycopg2.Error as e:
+            current_app.logger.error(f"Error al liberar la conexión de la petición: {e}")
+
+def _escribir_lote_auditoria(app, filas):
+    """Inserta un lote de filas de auditoría con un único INSERT multi-fila."""
+    with app.app_context():
+        conn = get_db_connection()
+        try:
+            with conn.cursor() as cur:
+                execute_values(
+                    cur,
+                    """
+                    INSERT INTO auditoria (
+                        usuario_id_app, accion, tabla_afectada, registro_id_afectado,
+                        datos_anteriores, datos_nuevos, detalles_adicionales, fecha_hora
+                    ) VALUES %s
+                    """,
+                    filas,
+                    page_size=len(filas)
+                )
+            conn.commit()
+        except psycopg2.Error:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+def _shutdown(app):
+    """Al terminar el proceso cierra el pool (los escritores por lotes ya vaciaron su cola)."""
+    pool = app.extensions.get('medialert_db_pool')
+    if pool is not None:
+        pool.closeall()
+    replicas = app.extensions.get('medialert_db_replicas')
+    if replicas is not None:
+        replicas.closeall()
+    catalogos = app.extensions.get('medialert_catalog_cache')
+    if catalogos is not None:
+        catalogos[1].stop()
+
+def init_app(app):
+    """Registra la unidad de trabajo por petición y el cierre de los recursos del proceso."""
+    app.after_request(_commit_request_connection)
+    app.teardown_request(_release_request_connection)
+    atexit.register(_shutdown, app)
+
+def get_catalog_cache():
+    """
+    Devuelve la caché de catálogos del proceso, o None si está desactivada o si su listener
+    de NOTIFY no está conectado (sin avisos no se puede garantizar que esté al día).
+    El listener se arranca en el primer uso de cada proceso, así cada worker tiene el suyo.
+    """
+    app = current_app._get_current_object()
+    if not app.config.get('CATALOG_CACHE_ENABLED'):
+        return None
+    entrada = app.extensions.get('medialert_catalog_cache')
+    if entrada is None or entrada[2] != os.getpid():
+        with _pool_lock:
+            entrada = app.extensions.get('medialert_catalog_cache')
+            if entrada is None or entrada[2] != os.getpid():
+                cache = CatalogCache()
+                listener = NotifyListener(
+                    'catalogos', _connect_kwargs(app.config), [CANAL_CATALOGOS],
+                    callback=lambda canal, tabla: cache.invalidate(tabla),
+                    on_connect=cache.invalidate_all,
+                    logger=app.logger
+                ).start()
+                entrada = app.extensions['medialert_catalog_cache'] = (cache, listener, os.getpid())
+    cache, listener, _ = entrada
+    return cache if listener.conectado else None
+
+def obtener_catalogo(nombre, clave, cargar):
+    """Devuelve cargar() pasando por la caché del catálogo 'nombre' (tabla de la BD) si está activa."""
+    cache = get_catalog_cache()
+    if cache is None:
+        return cargar()
+    # Si la petición ya leyó la versión de la tabla (ETag), la entrada debe ser de esa versión:
+    # así un NOTIFY aún en camino no deja datos viejos asociados a un ETag nuevo.
+    version_bd = g.get('_versiones_tabla', {}).get(nombre) if has_request_context() else None
+    if version_bd is not None:
+        clave = (clave, version_bd)
+    return cache.get(nombre, clave, cargar)
+
+def invalidar_catalogo(nombre):
+    """
+    Invalida el catálogo en este proceso cuando la escritura se confirme. El resto de procesos
+    se entera por el NOTIFY que emiten los triggers de la tabla al confirmar.
+    """
+    def invalidar():
+        cache = get_catalog_cache()
+        if cache is not None:
+            cache.invalidate(nombre)
+    ejecutar_al_confirmar(invalidar)
+
+def get_audit_writer():
+    """
+    Devuelve el escritor de auditoría asíncrono de este proceso, o None si está desactivado.
+    Se arranca en el primer uso de cada proceso (un hilo iniciado antes del fork no existe en
+    los workers), y al terminar el proceso vacía su cola antes de que se cierre el pool.
+    """
+    app = current_app._get_current_object()
+    if not app.config.get('AUDIT_ASYNC_ENABLED'):
+        return None
+    entrada = app.extensions.get('medialert_audit_writer')
+    if entrada is None or entrada[1] != os.getpid():
+        with _pool_lock:
+            entrada = app.extensions.get('medialert_audit_writer')
+            if entrada is None or entrada[1] != os.getpid():
+                writer = BatchWriter(
+                    'auditoria',
+                    partial(_escribir_lote_auditoria, app),
+                    max_queue=app.config['AUDIT_ASYNC_QUEUE_SIZE'],
+                    batch_size=app.config['AUDIT_ASYNC_BATCH_SIZE'],
+                    flush_interval=app.config['AUDIT_ASYNC_FLUSH_INTERVAL'],
+                    politica=app.config['AUDIT_ASYNC_BACKPRESSURE'],
+                    logger=app.logger
+                ).start()
+                # atexit ejecuta en orden inverso: la cola se vacía antes de _shutdown.
+                atexit.register(writer.stop)
+                entrada = app.extensions['medialert_audit_writer'] = (writer, os.getpid())
+    return entrada[0]
+
+def establecer_contexto_auditoria(conn, accion, tabla_afectada, detalles_adicionales=None):
+    """
+    Modo de auditoría unificado (AUDIT_MODE = 'unificado'): anota en la transacción la acción
+    semántica que se va a ejecutar sobre tabla_afectada, para que el trigger de auditoría la
+    registre en su propia fila. La siguiente llamada a registrar_auditoria_aplicacion con esa
+    acción y tabla se omite y borra la anotación, de modo que cada escritura deja una sola fila
+    de auditoría y las siguientes escrituras de la petición no heredan la acción.
+    Debe llamarse con la misma conexión y antes de la escritura. En modo 'dual' no hace nada.
+    """
+    if current_app.config.get('AUDIT_MODE') != 'unificado':
+        return
+    detalles = json.dumps(_serialize_data_for_jsonb(detalles_adicionales)) if detalles_adicionales else ''
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT set_config('medialert.app_accion', %s, true),
+                   set_config('medialert.app_tabla', %s, true),
+                   set_config('medialert.app_detalles', %s, true);
+            """,
+            (accion, tabla_afectada, detalles)
+        )
+    if has_request_context():
+        g.setdefault('_auditoria_pendiente_trigger', {})[tabla_afectada] = accion
+
+def _limpiar_contexto_auditoria(conn):
+    """Borra la acción anotada para el trigger: la transacción de la petición sigue abierta."""
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT set_config('medialert.app_accion', '', true),
+                   set_config('medialert.app_tabla', '', true),
+                   set_config('medialert.app_detalles', '', true);
+            """
+        )
+
 def registrar_auditoria_aplicacion(accion, tabla_afectada=None, registro_id=None,
                                      datos_anteriores=None, datos_nuevos=None, detalles_adicionales=None):
     """
     Registra una acción en la tabla de auditoría.
     Obtiene el ID del usuario directamente de la sesión para máxima fiabilidad.
+    Si se pasan datos_anteriores y datos_nuevos, solo se guardan las claves que cambiaron.
+    Dentro de una petición se escribe en la misma transacción que los datos, protegida por
+    un SAVEPOINT: un fallo de auditoría no revierte la operación principal.
+    Con AUDIT_ASYNC_ENABLED la fila se encola y la escribe en lote un hilo de fondo; si la
+    cola está llena se aplica la política de contrapresión configurada.
+    En modo unificado no se escribe nada si la acción ya quedó anotada para el trigger
+    (ver establecer_contexto_auditoria); la anotación se consume aquí, así solo se omite la
+    auditoría de esa escritura y no la de otros registros de la misma tabla en la petición.
     """
+    pendientes = g.get('_auditoria_pendiente_trigger', {}) if has_request_context() else {}
+    if tabla_afectada and pendientes.get(tabla_afectada) == accion:
+        del pendientes[tabla_afectada]
+        try:
+            _limpiar_contexto_auditoria(get_db_connection())
+        except psycopg2.Error as e:
+            current_app.logger.error(f"Error al limpiar el contexto de auditoría ({accion}): {e!r}")
+        return
+
     conn = None
+    savepoint = False
     try:
         # ***** LA CORRECCIÓN CLAVE *****
         # Se obtiene el ID del usuario directamente de la sesión aquí.
         # Esto evita pasar IDs incorrectos entre capas y soluciona el error de auditoría.
-        app_user_id = session.get('user_id')
+        app_user_id = session.get('user_id') if has_request_context() else None
 
-        conn = get_db_connection()
-        cur = conn.cursor()
+        if datos_anteriores and datos_nuevos:
+            # Formato delta: solo se guardan las claves modificadas, como en el trigger genérico.
+            datos_anteriores, datos_nuevos = _delta_auditoria(datos_anteriores, datos_nuevos)
+        datos_anteriores = _serialize_data_for_jsonb(datos_anteriores)
+        datos_nuevos = _serialize_data_for_jsonb(datos_nuevos)
 
-        p_datos_anteriores = Json(_serialize_data_for_jsonb(datos_anteriores)) if datos_anteriores else None
-        p_datos_nuevos = Json(_serialize_data_for_jsonb(datos_nuevos)) if datos_nuevos else None
+        p_datos_anteriores = Json(datos_anteriores) if datos_anteriores else None
+        p_datos_nuevos = Json(datos_nuevos) if datos_nuevos else None
         p_detalles_adicionales = Json(_serialize_data_for_jsonb(detalles_adicionales)) if detalles_adicionales else None
 
+        writer = get_audit_writer()
+        if writer is not None and writer.submit((
+            app_user_id, accion, tabla_afectada, registro_id,
+            p_datos_anteriores, p_datos_nuevos, p_detalles_adicionales,
+            datetime.now(timezone.utc)
+        )):
+            return
+
+        conn = get_db_connection()
+        cur = conn.cursor()
+
+        cur.execute("SAVEPOINT auditoria_aplicacion;")
+        savepoint = True
         cur.execute(
             "SELECT sp_registrar_evento_auditoria(%s, %s, %s, %s, %s, %s, %s);",
             (app_user_id, accion, tabla_afectada, registro_id,
              p_datos_anteriores, p_datos_nuevos, p_detalles_adicionales)
         )
+        cur.execute("RELEASE SAVEPOINT auditoria_aplicacion;")
         conn.commit()
     except Exception as e:
         current_app.logger.error(f"Error al registrar auditoría de aplicación ({accion}): {e!r}")
-        if conn:
-            conn.rollback()
+        if conn and savepoint:
+            try:
+                conn.cursor().execute("ROLLBACK TO SAVEPOINT auditoria_aplicacion;")
+            except psycopg2.Error:
+                pass
     finally:
         if conn:
             conn.close()
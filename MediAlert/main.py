@@ -7,6 +7,9 @@ import logging
 
 # Importar la configuración de la aplicación
 import config
+import database
+from comandos import registrar_comandos
+from utils.json_provider import MediAlertJSONProvider
 
 # Importar los blueprints de los routers
 from routers.auth import auth_bp
@@ -20,10 +23,20 @@ app = Flask(__name__, static_url_path='/static', static_folder='static', templat
 # Cargar la configuración desde el módulo config
 app.config.from_object('config')
 
+# Serialización JSON central: fechas ISO 8601 en todas las respuestas (ver utils/json_provider.py)
+app.json = MediAlertJSONProvider(app)
+
 # --- Definir rutas completas para carpetas de almacenamiento ---
 # Esto se hace aquí porque app.root_path solo está disponible después de crear la instancia de Flask app
 app.config['INSTANCE_FOLDER_PATH'] = os.path.join(app.root_path, '..', config.INSTANCE_FOLDER_NAME)
 app.config['REPORTS_STORAGE_PATH'] = os.path.join(app.config['INSTANCE_FOLDER_PATH'], config.REPORTS_SUBDIRECTORY)
+app.config['AUDIT_ARCHIVE_PATH'] = os.path.join(app.config['INSTANCE_FOLDER_PATH'], config.AUDIT_ARCHIVE_SUBDIRECTORY)
+
+# Unidad de trabajo por petición: una conexión y un commit por petición
+database.init_app(app)
+
+# Comandos de mantenimiento (flask --app main <comando>)
+registrar_comandos(app)
 
 # Configurar CORS
 CORS(app, supports_credentials=True, resources={r"/api/*": {"origins": "*"}})
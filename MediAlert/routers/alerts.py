@@ -3,14 +3,18 @@
 from flask import Blueprint, request, jsonify, session
 from services.alert_service import (
     get_alerts, get_alert_by_id, create_alert, update_alert, delete_alert,
-    get_client_alerts, get_consolidated_client_recipes, get_recipe_data
+    get_client_alerts, get_consolidated_client_recipes, get_recipe_data,
+    contar_alertas, get_alertas_proximas, get_calendario_tomas, CAMPOS_ALERTAS, ORDENES_ALERTAS
 )
-from utils.decorators import admin_required, login_required
+from services.dose_event_service import registrar_eventos_toma
+from utils.decorators import admin_required, login_required, etag_por_version
+from utils.paginacion import normalizar_limite, parse_campos, cabeceras_paginacion
 
 alerts_bp = Blueprint('alerts', __name__)
 
 @alerts_bp.route('/admin/alertas', methods=['GET', 'POST'])
 @admin_required
+@etag_por_version('alertas', 'usuarios', 'medicamentos')
 def manage_alertas_admin():
     admin_id_actual = session.get('user_id')
 
@@ -18,8 +22,27 @@ def manage_alertas_admin():
         usuario_id_filtro = request.args.get('usuario_id', type=int)
         group_by_client = request.args.get('group_by_client', 'false').lower() == 'true'
         try:
-            alertas = get_alerts(usuario_id_filtro, group_by_client)
-            return jsonify(alertas)
+            if group_by_client:
+                return jsonify(get_alerts(usuario_id_filtro, group_by_client))
+
+            # Paginación opcional: ?limit=&cursor=&orden=&fields=&total=estimado|exacto
+            cursor = request.args.get('cursor')
+            limit = normalizar_limite(request.args.get('limit', type=int), cursor)
+            orden = request.args.get('orden') or ('fecha_inicio' if limit else None)
+            total = request.args.get('total')
+            if total not in (None, 'estimado', 'exacto'):
+                raise ValueError("total debe ser 'estimado' o 'exacto'.")
+            alertas = get_alerts(usuario_id_filtro, limit=limit, cursor=cursor, orden=orden,
+                                 campos=parse_campos(request.args.get('fields'), CAMPOS_ALERTAS))
+            response = jsonify(alertas)
+            claves = [campo for _, campo, _ in ORDENES_ALERTAS[orden][1]] if orden else []
+            return cabeceras_paginacion(
+                response, alertas, limit, orden, claves,
+                total=contar_alertas(usuario_id_filtro, exacto=total == 'exacto') if total else None,
+                total_exacto=total == 'exacto'
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         except Exception as e:
             return jsonify({'error': f'Error al obtener alertas: {e}'}), 500
 
@@ -33,6 +56,30 @@ def manage_alertas_admin():
         except Exception as e:
             return jsonify({'error': f'Error al crear alerta: {e}'}), 500
 
+@alerts_bp.route('/admin/alertas/proximas', methods=['GET'])
+@admin_required
+def get_alertas_proximas_admin():
+    """Alertas con toma en los próximos ?minutos= (60 por defecto), en orden de vencimiento."""
+    try:
+        return jsonify(get_alertas_proximas(request.args.get('minutos', type=int, default=60),
+                                            request.args.get('limit', type=int)))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': f'Error al obtener alertas próximas: {e}'}), 500
+
+@alerts_bp.route('/admin/calendario', methods=['GET'])
+@admin_required
+def get_calendario_admin():
+    """Tomas de ?desde= a ?hasta= (AAAA-MM-DD) de todos los clientes, o de ?usuario_id=."""
+    try:
+        return jsonify(get_calendario_tomas(request.args.get('desde'), request.args.get('hasta'),
+                                            request.args.get('usuario_id', type=int)))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': f'Error al obtener el calendario de tomas: {e}'}), 500
+
 @alerts_bp.route('/admin/alertas/<int:alerta_id>', methods=['GET', 'PUT', 'DELETE'])
 @admin_required
 def manage_single_alerta_admin(alerta_id):
@@ -44,10 +91,6 @@ def manage_single_alerta_admin(alerta_id):
             return jsonify({'error': 'Alerta no encontrada.'}), 404
 
         if request.method == 'GET':
-            if isinstance(alerta.get('hora_preferida'), (type(None),)):
-                alerta['hora_preferida'] = None
-            else:
-                 alerta['hora_preferida'] = str(alerta['hora_preferida'])
             return jsonify(alerta)
 
         if request.method == 'PUT':
@@ -76,6 +119,40 @@ def get_mis_alertas_cliente():
     except Exception as e:
         return jsonify({'error': f'Error al cargar tus alertas: {e}'}), 500
 
+@alerts_bp.route('/cliente/calendario', methods=['GET'])
+@login_required
+def get_calendario_cliente():
+    if session.get('rol') != 'cliente':
+        return jsonify({'error': 'Acceso denegado. Esta vista es solo para clientes.'}), 403
+    try:
+        return jsonify(get_calendario_tomas(request.args.get('desde'), request.args.get('hasta'), session['user_id']))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': f'Error al cargar tu calendario: {e}'}), 500
+
+@alerts_bp.route('/cliente/tomas', methods=['POST'])
+@login_required
+def registrar_tomas_cliente():
+    """
+    Confirma u omite tomas: un evento {"alerta_id", "programada_para", "tipo": "tomada"|"omitida",
+    "registrado_en" opcional} o varios en {"eventos": [...]}. Con registrado_en (hora en que el
+    paciente respondió) los reenvíos son idempotentes.
+    """
+    if session.get('rol') != 'cliente':
+        return jsonify({'error': 'Acceso denegado. Esta vista es solo para clientes.'}), 403
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Cuerpo JSON no válido.'}), 400
+    eventos = data['eventos'] if 'eventos' in data else [data]
+    try:
+        aceptados = registrar_eventos_toma(session['user_id'], eventos)
+        return jsonify({'message': 'Eventos de toma registrados.', 'aceptados': aceptados}), 202
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': f'Error al registrar las tomas: {e}'}), 500
+
 @alerts_bp.route('/cliente/recetas_consolidadas', methods=['GET'])
 @login_required
 def get_consolidated_recetas_cliente():
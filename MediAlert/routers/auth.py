@@ -44,7 +44,7 @@ def get_configuracion_usuario():
     user_id = session.get('user_id')
     try:
         from services.user_service import get_user_by_id # Importar aquí para evitar circular imports
-        user_data = get_user_by_id(user_id)
+        user_data = get_user_by_id(user_id, 'perfil')
         if not user_data:
             return jsonify({'error': 'Usuario no encontrado.'}), 404
         return jsonify(user_data)
@@ -2,12 +2,13 @@
 
 from flask import Blueprint, request, jsonify, session
 from services.medication_service import get_medications, get_medication_by_id, create_medication, update_medication
-from utils.decorators import admin_required
+from utils.decorators import admin_required, etag_por_version
 
 medications_bp = Blueprint('medications', __name__)
 
 @medications_bp.route('/medicamentos', methods=['GET', 'POST'])
 @admin_required
+@etag_por_version('medicamentos')
 def manage_medicamentos():
     admin_id_actual = session.get('user_id')
 
@@ -1,12 +1,20 @@
 # medialert/routers/reports.py
 
-from flask import Blueprint, request, jsonify, send_from_directory
+from flask import Blueprint, request, jsonify, send_from_directory, Response, stream_with_context, current_app
 # 1. Actualiza la línea de importación
 from services.report_service import (
     log_report_generation, get_report_logs, save_pdf_file, 
-    get_pdf_file_info, get_all_active_consolidated_recipes, get_audit_logs
+    get_pdf_file_info, get_all_active_consolidated_recipes_json, iter_active_consolidated_recipes_json, get_audit_logs,
+    get_audit_writer_metrics, get_audit_log_detail, get_audit_log_snapshot
 )
-from utils.decorators import admin_required
+from services.cache import get_service_cache_stats
+from services.stats_service import get_estadisticas
+from services.notification_service import get_metricas_outbox
+from services.dose_event_service import get_eventos_writer_metrics
+from database import get_catalog_cache
+from utils.decorators import admin_required, etag_por_version
+from utils.paginacion import cursor_siguiente
+from utils.json_provider import respuesta_json_texto
 import os
 
 reports_bp = Blueprint('reports', __name__)
@@ -63,11 +71,82 @@ def get_auditoria_logs():
     user_search = request.args.get('search_user') # El frontend usa 'search_user' en el query
     try:
         # Llama a la nueva y correcta función de servicio
-        logs = get_audit_logs(limit=limit, tabla_filtro=module_filter, user_search_term=user_search)
-        return jsonify(logs)
+        logs = get_audit_logs(
+            limit=limit, tabla_filtro=module_filter, user_search_term=user_search,
+            fecha_desde=request.args.get('desde'), fecha_hasta=request.args.get('hasta'),
+            accion_filtro=request.args.get('accion'), registro_id_filtro=request.args.get('registro_id'),
+            cursor=request.args.get('cursor'), vista=request.args.get('vista', 'completa')
+        )
+        response = jsonify(logs)
+        # El cursor de la página siguiente viaja en una cabecera para no cambiar el formato del cuerpo.
+        next_cursor = cursor_siguiente(logs, limit, ('fecha_hora', 'id'))
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+        return response
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': f'Error al cargar los registros de auditoría: {e}'}), 500
 
+@reports_bp.route('/auditoria/<int:audit_id>', methods=['GET'])
+@admin_required
+def get_auditoria_detalle(audit_id):
+    try:
+        log = get_audit_log_detail(audit_id)
+        if not log:
+            return jsonify({'error': 'Registro de auditoría no encontrado.'}), 404
+        return jsonify(log)
+    except Exception as e:
+        return jsonify({'error': f'Error al cargar el registro de auditoría: {e}'}), 500
+
+@reports_bp.route('/auditoria/<int:audit_id>/snapshot', methods=['GET'])
+@admin_required
+def get_auditoria_snapshot(audit_id):
+    try:
+        snapshot = get_audit_log_snapshot(audit_id)
+        if not snapshot:
+            return jsonify({'error': 'Registro de auditoría no encontrado.'}), 404
+        return jsonify(snapshot)
+    except Exception as e:
+        return jsonify({'error': f'Error al reconstruir el registro de auditoría: {e}'}), 500
+
+@reports_bp.route('/auditoria/metricas', methods=['GET'])
+@admin_required
+def get_auditoria_metricas():
+    return jsonify(get_audit_writer_metrics())
+
+@reports_bp.route('/tomas/metricas', methods=['GET'])
+@admin_required
+def get_tomas_metricas():
+    return jsonify(get_eventos_writer_metrics())
+
+@reports_bp.route('/cache/metricas', methods=['GET'])
+@admin_required
+def get_cache_metricas():
+    catalogos = get_catalog_cache()
+    return jsonify({
+        'servicios': get_service_cache_stats(),
+        'catalogos': catalogos.stats() if catalogos is not None else None
+    })
+
+@reports_bp.route('/notificaciones/metricas', methods=['GET'])
+@admin_required
+def get_notificaciones_metricas():
+    try:
+        return jsonify(get_metricas_outbox())
+    except Exception as e:
+        return jsonify({'error': f'Error al obtener métricas de notificaciones: {e}'}), 500
+
+
+@reports_bp.route('/estadisticas', methods=['GET'])
+@admin_required
+@etag_por_version('alertas', 'usuarios', 'medicamentos', 'eps', por_fecha=True)
+def get_estadisticas_route():
+    try:
+        return jsonify(get_estadisticas(request.args.get('dias', 30, type=int)))
+    except Exception as e:
+        return jsonify({'error': f'Error al obtener estadísticas: {e}'}), 500
+
 
 @reports_bp.route('/reportes/download/<int:log_id>', methods=['GET'])
 @admin_required
@@ -92,10 +171,29 @@ def download_report_pdf(log_id):
 @reports_bp.route('/recetas_consolidadas', methods=['GET'])
 @admin_required
 def get_consolidated_recetas_admin_route():
+    if request.args.get('formato') == 'ndjson':
+        return _stream_recetas_ndjson()
     try:
-        recetas_data = get_all_active_consolidated_recipes()
-        if not recetas_data:
+        recetas_json = get_all_active_consolidated_recipes_json()
+        if recetas_json == '[]':
             return jsonify({'message': 'No hay alertas activas de clientes para generar una receta consolidada.'}), 200
-        return jsonify(recetas_data)
+        # PostgreSQL ya generó el JSON: se envía sin pasar por dicts de Python.
+        return respuesta_json_texto(current_app, recetas_json)
     except Exception as e:
-        return jsonify({'error': f'Error al cargar las recetas consolidadas para el administrador: {e}'}), 500
\ No newline at end of file
+        return jsonify({'error': f'Error al cargar las recetas consolidadas para el administrador: {e}'}), 500
+
+
+def _stream_recetas_ndjson():
+    """Una receta por línea (NDJSON), enviada a medida que llega del cursor de servidor."""
+    tamano_lote = request.args.get('lote', type=int, default=500)
+
+    def generar():
+        try:
+            for receta in iter_active_consolidated_recipes_json(tamano_lote=max(1, tamano_lote)):
+                yield receta + '\n'
+        except Exception as e:
+            # Las cabeceras ya se enviaron: el error se informa como última línea.
+            current_app.logger.error(f"Error durante la exportación NDJSON de recetas: {e!r}")
+            yield current_app.json.dumps({'error': f'Exportación interrumpida: {e}'}) + '\n'
+
+    return Response(stream_with_context(generar()), mimetype='application/x-ndjson')
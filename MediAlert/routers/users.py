@@ -2,22 +2,45 @@
 
 from flask import Blueprint, request, jsonify, session
 # La importación de funciones de servicio es la misma
-from services.user_service import get_users, get_user_by_id, create_user, update_user, get_eps_list
-from utils.decorators import admin_required
+from services.user_service import (
+    get_users, get_user_by_id, create_user, update_user, get_eps_list,
+    contar_usuarios, CAMPOS_USUARIOS, ORDENES_USUARIOS
+)
+from services.search_service import buscar_clientes
+from utils.decorators import admin_required, etag_por_version
+from utils.paginacion import normalizar_limite, parse_campos, cabeceras_paginacion
 
 users_bp = Blueprint('users', __name__)
 
 @users_bp.route('/clientes', methods=['GET', 'POST'])
 @admin_required
+@etag_por_version('usuarios', 'eps')
 def manage_clientes():
     if request.method == 'GET':
+        filtros = dict(
+            estado_filtro=request.args.get('estado'),
+            rol_filtro=request.args.get('rol', 'cliente'),
+            search_query=request.args.get('query')
+        )
         try:
-            users = get_users(
-                estado_filtro=request.args.get('estado'),
-                rol_filtro=request.args.get('rol', 'cliente'),
-                search_query=request.args.get('query')
+            # Paginación opcional: ?limit=&cursor=&orden=&fields=&total=estimado|exacto
+            cursor = request.args.get('cursor')
+            limit = normalizar_limite(request.args.get('limit', type=int), cursor)
+            orden = request.args.get('orden') or 'rol_nombre'
+            total = request.args.get('total')
+            if total not in (None, 'estimado', 'exacto'):
+                raise ValueError("total debe ser 'estimado' o 'exacto'.")
+            users = get_users(**filtros, limit=limit, cursor=cursor, orden=orden,
+                              campos=parse_campos(request.args.get('fields'), CAMPOS_USUARIOS))
+            response = jsonify(users)
+            claves = [campo for _, campo, _ in ORDENES_USUARIOS[orden][1]]
+            return cabeceras_paginacion(
+                response, users, limit, orden, claves,
+                total=contar_usuarios(**filtros, exacto=total == 'exacto') if total else None,
+                total_exacto=total == 'exacto'
             )
-            return jsonify(users)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         except Exception as e:
             return jsonify({'error': f'Error al obtener clientes: {e}'}), 500
 
@@ -33,11 +56,27 @@ def manage_clientes():
         except Exception as e:
             return jsonify({'error': f'Error al crear cliente: {e}'}), 500
 
+@users_bp.route('/clientes/buscar', methods=['GET'])
+@admin_required
+def buscar_clientes_route():
+    try:
+        resultados = buscar_clientes(
+            request.args.get('q', ''),
+            limit=request.args.get('limit', type=int, default=10),
+            rol=request.args.get('rol', 'cliente'),
+            estado=request.args.get('estado')
+        )
+        return jsonify(resultados)
+    except Exception as e:
+        return jsonify({'error': f'Error al buscar clientes: {e}'}), 500
+
 @users_bp.route('/clientes/<int:uid>', methods=['GET', 'PUT'])
 @admin_required
 def manage_single_cliente(uid):
     try:
-        current_user_data = get_user_by_id(uid)
+        # El PUT guarda el estado anterior en la auditoría: se lee con las columnas de la tabla.
+        proyeccion = 'admin' if request.method == 'GET' else 'auditoria'
+        current_user_data = get_user_by_id(uid, proyeccion)
         if not current_user_data:
             return jsonify({'error': 'Usuario no encontrado.'}), 404
         if current_user_data['rol'] != 'cliente':
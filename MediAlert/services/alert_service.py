@@ -1,69 +1,148 @@
 # medialert/services/alert_service.py
 
+from datetime import date, datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values
 from flask import current_app, session
-from datetime import time
-
-from database import get_db_connection, registrar_auditoria_aplicacion
 
-def get_alerts(usuario_id_filtro=None, group_by_client=False):
-    """Obtiene alertas o un conteo de alertas agrupado por cliente."""
+from database import (
+    get_db_connection, registrar_auditoria_aplicacion, establecer_contexto_auditoria, solo_lectura, contar_filas
+)
+from services.cache import cache_versionado
+from utils.frecuencia import parse_frecuencia, expandir_tomas
+from utils.paginacion import (
+    condicion_keyset, decodificar_cursor_orden, normalizar_limite, LISTADO_LIMITE_POR_DEFECTO
+)
+
+# Columnas del listado de alertas (fields=) y el join que necesita cada una. No incluye
+# proxima_toma: el listado va con ETag y caché por versión de alertas, que no cambia cuando solo
+# cambian columnas derivadas; la próxima toma se consulta en /admin/alertas/proximas.
+CAMPOS_ALERTAS = {
+    'id': ('a.id', None), 'usuario_id': ('a.usuario_id', None),
+    'cliente_nombre': ('u.nombre', 'u'), 'estado_usuario': ('u.estado_usuario', 'u'),
+    'medicamento_id': ('a.medicamento_id', None), 'medicamento_nombre': ('m.nombre', 'm'),
+    'estado_medicamento': ('m.estado_medicamento', 'm'),
+    'dosis': ('a.dosis', None), 'frecuencia': ('a.frecuencia', None), 'fecha_inicio': ('a.fecha_inicio', None),
+    'fecha_fin': ('a.fecha_fin', None), 'hora_preferida': ('a.hora_preferida', None),
+    'estado_alerta': ('a.estado', None), 'asignado_por_usuario_id': ('a.asignado_por_usuario_id', None),
+    'asignador_nombre': ('ap.nombre', 'ap')
+}
+_JOINS_ALERTAS = {
+    'u': "JOIN usuarios u ON a.usuario_id = u.id",
+    'm': "JOIN medicamentos m ON a.medicamento_id = m.id",
+    'ap': "LEFT JOIN usuarios ap ON a.asignado_por_usuario_id = ap.id",
+}
+
+# Órdenes de la paginación (ver ORDENES_USUARIOS). 'cliente' es el orden histórico del listado
+# completo (nombre del cliente y del medicamento) y no admite paginación: depende de columnas
+# de otras tablas y ningún índice lo cubre.
+ORDENES_ALERTAS = {
+    'fecha_inicio': (False, (('a.fecha_inicio', 'fecha_inicio', date), ('a.id', 'id', int))),
+    'recientes': (True, (('a.id', 'id', int),)),
+}
+_ORDEN_ALERTAS_CLIENTE = "u.nombre, m.nombre, a.fecha_inicio, a.id"
+
+PROXIMAS_MINUTOS_MAXIMO = 7 * 24 * 60
+# Días que puede abarcar una consulta del calendario de tomas (y días por defecto).
+CALENDARIO_DIAS_MAXIMO = 62
+CALENDARIO_DIAS_POR_DEFECTO = 30
+
+def _campos_frecuencia(frecuencia):
+    """(intervalo, veces por día, días de la semana) de la frecuencia, o Nones si no se reconoce."""
+    estructurada = parse_frecuencia(frecuencia)
+    return tuple(estructurada) if estructurada else (None, None, None)
+
+def _marcar_frecuencia_normalizada(cur, activa=True):
+    """
+    Marca (o desmarca) en la transacción que las escrituras de alertas traen sus campos de
+    frecuencia ya calculados. Sin la marca, el trigger de alertas anula esos campos cuando
+    cambia el texto de frecuencia (escrituras hechas fuera de la aplicación).
+    """
+    cur.execute("SELECT set_config('medialert.frecuencia_normalizada', %s, true);", ('1' if activa else '',))
+
+@cache_versionado('alertas', 'usuarios', 'medicamentos')
+@solo_lectura
+def get_alerts(usuario_id_filtro=None, group_by_client=False,
+               limit=None, cursor=None, orden=None, campos=None):
+    """
+    Obtiene alertas o un conteo de alertas agrupado por cliente.
+    Sin limit ni cursor devuelve todas las alertas en el orden 'cliente', como siempre.
+    Con limit o cursor pagina por conjunto de claves (ver utils/paginacion.py) según 'orden'
+    (ORDENES_ALERTAS, por defecto 'fecha_inicio'). 'campos' limita las columnas
+    (CAMPOS_ALERTAS) y solo se hacen los joins que esas columnas necesitan.
+    """
+    paginado = bool(limit or cursor)
+    if paginado or orden:
+        orden = orden or 'fecha_inicio'
+        if orden not in ORDENES_ALERTAS:
+            raise ValueError(f"Orden no válido: use {', '.join(ORDENES_ALERTAS)}.")
     conn = None
     try:
         conn = get_db_connection()
         cur = conn.cursor(cursor_factory=RealDictCursor)
 
         if group_by_client:
+            # Conteos mantenidos por trigger (contadores_alertas_cliente): el costo depende del
+            # número de clientes, no del de alertas.
             query = """
                 SELECT
                     u.id as usuario_id,
                     u.nombre as cliente_nombre,
                     u.cedula,
                     u.estado_usuario,
-                    COUNT(CASE WHEN a.estado = 'activa' THEN 1 ELSE NULL END) as alertas_activas_count,
-                    COUNT(a.id) as total_alertas_count
+                    COALESCE(c.alertas_activas, 0) as alertas_activas_count,
+                    COALESCE(c.alertas_total, 0) as total_alertas_count
                 FROM usuarios u
-                LEFT JOIN alertas a ON u.id = a.usuario_id
+                LEFT JOIN contadores_alertas_cliente c ON c.usuario_id = u.id
                 WHERE u.rol = 'cliente'
-                GROUP BY u.id, u.nombre, u.cedula, u.estado_usuario
                 ORDER BY u.nombre;
             """
             cur.execute(query)
             clientes_con_alertas = cur.fetchall()
             return clientes_con_alertas
+
+        claves = ORDENES_ALERTAS[orden][1] if orden else ()
+        descendente = ORDENES_ALERTAS[orden][0] if orden else False
+        limit = normalizar_limite(limit, cursor)
+        posicion = decodificar_cursor_orden(cursor, orden, [tipo for _, _, tipo in claves]) if cursor else None
+
+        campos = list(campos or CAMPOS_ALERTAS)
+        campos += [campo for _, campo, _ in claves if campo not in campos]
+        # u y m son joins internos por clave foránea: quitarlos no cambia las filas.
+        joins = {CAMPOS_ALERTAS[c][1] for c in campos} - {None}
+        if not orden:
+            joins |= {'u', 'm'}
+        columnas = ", ".join(f"{CAMPOS_ALERTAS[c][0]} AS {c}" for c in campos)
+        query_parts = [f"SELECT {columnas} FROM alertas a"]
+        query_parts += [_JOINS_ALERTAS[j] for j in ('u', 'm', 'ap') if j in joins]
+
+        conditions = []
+        params = []
+
+        if usuario_id_filtro:
+            conditions.append("a.usuario_id = %s")
+            params.append(usuario_id_filtro)
+
+        if posicion:
+            conditions.append(condicion_keyset([col for col, _, _ in claves], descendente))
+            params.extend(posicion)
+
+        if conditions:
+            query_parts.append("WHERE " + " AND ".join(conditions))
+
+        if orden:
+            direccion = " DESC" if descendente else ""
+            query_parts.append("ORDER BY " + ", ".join(col + direccion for col, _, _ in claves))
         else:
-            query_parts = ["""
-                SELECT
-                    a.id, a.usuario_id, u.nombre as cliente_nombre, u.estado_usuario,
-                    a.medicamento_id, m.nombre as medicamento_nombre, m.estado_medicamento,
-                    a.dosis, a.frecuencia, a.fecha_inicio, a.fecha_fin, a.hora_preferida, 
-                    a.estado as estado_alerta, a.asignado_por_usuario_id, ap.nombre as asignador_nombre
-                FROM alertas a
-                JOIN usuarios u ON a.usuario_id = u.id
-                JOIN medicamentos m ON a.medicamento_id = m.id
-                LEFT JOIN usuarios ap ON a.asignado_por_usuario_id = ap.id
-            """]
-            conditions = []
-            params = []
-
-            if usuario_id_filtro:
-                conditions.append("a.usuario_id = %s")
-                params.append(usuario_id_filtro)
-
-            if conditions:
-                query_parts.append("WHERE " + " AND ".join(conditions))
-
-            query_parts.append("ORDER BY u.nombre, m.nombre, a.fecha_inicio")
-
-            final_query = " ".join(query_parts)
-            cur.execute(final_query, tuple(params))
-            alertas = cur.fetchall()
-
-            for alerta in alertas:
-                if isinstance(alerta.get('hora_preferida'), (time,)):
-                    alerta['hora_preferida'] = alerta['hora_preferida'].strftime('%H:%M:%S')
-            return alertas
+            query_parts.append("ORDER BY " + _ORDEN_ALERTAS_CLIENTE)
+        if limit:
+            query_parts.append("LIMIT %s")
+            params.append(limit)
+
+        cur.execute(" ".join(query_parts), tuple(params))
+        return cur.fetchall()
     except psycopg2.Error as e:
         current_app.logger.error(f"Error de BD al obtener alertas: {e}")
         raise
@@ -71,6 +150,20 @@ def get_alerts(usuario_id_filtro=None, group_by_client=False):
         if conn:
             conn.close()
 
+@solo_lectura
+def contar_alertas(usuario_id_filtro=None, exacto=False):
+    """Total de alertas con los filtros de get_alerts: estimado por el planificador o exacto."""
+    query, params = "SELECT a.id FROM alertas a", ()
+    if usuario_id_filtro:
+        query, params = query + " WHERE a.usuario_id = %s", (usuario_id_filtro,)
+    conn = None
+    try:
+        conn = get_db_connection()
+        return contar_filas(conn, query, params, exacto)
+    finally:
+        if conn:
+            conn.close()
+
 def get_alert_by_id(alerta_id):
     """Obtiene una alerta por su ID."""
     conn = None
@@ -120,12 +213,16 @@ def create_alert(alert_data, admin_id_actual):
         if estado_alerta not in ['activa', 'inactiva', 'completada', 'fallida']:
             raise ValueError('Valor de estado de alerta no válido.')
 
+        detalles_auditoria = {'creado_por_admin_id': admin_id_actual}
+        establecer_contexto_auditoria(conn, 'CREACION_ALERTA', 'alertas', detalles_auditoria)
         cur.execute(
             """
-            INSERT INTO alertas (usuario_id, medicamento_id, dosis, frecuencia, fecha_inicio, fecha_fin, hora_preferida, estado, asignado_por_usuario_id)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s) RETURNING id
+            INSERT INTO alertas (usuario_id, medicamento_id, dosis, frecuencia, fecha_inicio, fecha_fin, hora_preferida, estado, asignado_por_usuario_id,
+                                 frecuencia_intervalo_min, frecuencia_veces_dia, frecuencia_dias_semana)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s) RETURNING id
             """,
-            (usuario_id, medicamento_id, dosis, frecuencia, fecha_inicio, fecha_fin, hora_preferida, estado_alerta, admin_id_actual)
+            (usuario_id, medicamento_id, dosis, frecuencia, fecha_inicio, fecha_fin, hora_preferida, estado_alerta, admin_id_actual,
+             *_campos_frecuencia(frecuencia))
         )
         new_id = cur.fetchone()['id']
         conn.commit()
@@ -134,7 +231,7 @@ def create_alert(alert_data, admin_id_actual):
             tabla_afectada='alertas',
             registro_id=str(new_id),
             datos_nuevos=alert_data,
-            detalles_adicionales={'creado_por_admin_id': admin_id_actual}
+            detalles_adicionales=detalles_auditoria
         )
         return new_id
     except psycopg2.Error as e:
@@ -166,14 +263,21 @@ def update_alert(alerta_id, alert_data, old_alerta_data, admin_id_actual):
         if estado not in ['activa', 'inactiva', 'completada', 'fallida']:
             raise ValueError('Valor de estado de alerta no válido.')
         
+        detalles_auditoria = {'actualizado_por_admin_id': admin_id_actual}
+        establecer_contexto_auditoria(conn, 'EDICION_ALERTA', 'alertas', detalles_auditoria)
+        _marcar_frecuencia_normalizada(cur)
         cur.execute(
             """
             UPDATE alertas SET usuario_id=%s, medicamento_id=%s, dosis=%s, frecuencia=%s, 
-            fecha_inicio=%s, fecha_fin=%s, hora_preferida=%s, estado=%s, asignado_por_usuario_id=%s
+            fecha_inicio=%s, fecha_fin=%s, hora_preferida=%s, estado=%s, asignado_por_usuario_id=%s,
+            frecuencia_intervalo_min=%s, frecuencia_veces_dia=%s, frecuencia_dias_semana=%s
             WHERE id=%s
             """,
-            (usuario_id, medicamento_id, dosis, frecuencia, fecha_inicio, fecha_fin, hora_preferida, estado, admin_id_actual, alerta_id)
+            (usuario_id, medicamento_id, dosis, frecuencia, fecha_inicio, fecha_fin, hora_preferida, estado, admin_id_actual,
+             *_campos_frecuencia(frecuencia), alerta_id)
         )
+        # La transacción de la petición sigue abierta: la marca no debe cubrir otras escrituras.
+        _marcar_frecuencia_normalizada(cur, False)
         conn.commit()
         registrar_auditoria_aplicacion(
             'EDICION_ALERTA', 
@@ -181,7 +285,7 @@ def update_alert(alerta_id, alert_data, old_alerta_data, admin_id_actual):
             registro_id=str(alerta_id),
             datos_anteriores=dict(old_alerta_data),
             datos_nuevos=alert_data,
-            detalles_adicionales={'actualizado_por_admin_id': admin_id_actual}
+            detalles_adicionales=detalles_auditoria
         )
         return True
     except psycopg2.Error as e:
@@ -199,6 +303,8 @@ def delete_alert(alerta_id, old_alerta_data, admin_id_actual):
         conn = get_db_connection()
         cur = conn.cursor(cursor_factory=RealDictCursor)
         
+        detalles_auditoria = {'eliminado_por_admin_id': admin_id_actual}
+        establecer_contexto_auditoria(conn, 'ELIMINACION_ALERTA', 'alertas', detalles_auditoria)
         cur.execute("DELETE FROM alertas WHERE id = %s", (alerta_id,))
         conn.commit()
         registrar_auditoria_aplicacion(
@@ -206,7 +312,7 @@ def delete_alert(alerta_id, old_alerta_data, admin_id_actual):
             tabla_afectada='alertas', 
             registro_id=str(alerta_id),
             datos_anteriores=dict(old_alerta_data),
-            detalles_adicionales={'eliminado_por_admin_id': admin_id_actual}
+            detalles_adicionales=detalles_auditoria
         )
         return True
     except psycopg2.Error as e:
@@ -217,6 +323,173 @@ def delete_alert(alerta_id, old_alerta_data, admin_id_actual):
         if conn:
             conn.close()
 
+@solo_lectura
+def get_alertas_proximas(minutos=60, limit=None):
+    """
+    Alertas cuya próxima toma (alertas.proxima_toma, mantenida por trigger) vence en los próximos
+    'minutos', incluidas las vencidas sin notificar, en orden de vencimiento. Es un recorrido del
+    índice idx_alertas_proxima_toma.
+    """
+    minutos = max(1, min(int(minutos), PROXIMAS_MINUTOS_MAXIMO))
+    limit = normalizar_limite(limit or LISTADO_LIMITE_POR_DEFECTO)
+    hasta = datetime.now(timezone.utc) + timedelta(minutes=minutos)
+    conn = None
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        query = """
+            SELECT a.id, a.usuario_id, u.nombre AS cliente_nombre, a.medicamento_id, m.nombre AS medicamento_nombre,
+                   a.dosis, a.frecuencia, a.hora_preferida, a.proxima_toma, a.ultima_notificacion_enviada
+            FROM alertas a
+            JOIN usuarios u ON a.usuario_id = u.id
+            JOIN medicamentos m ON a.medicamento_id = m.id
+            WHERE a.proxima_toma IS NOT NULL AND a.proxima_toma < %s
+            ORDER BY a.proxima_toma, a.id
+            LIMIT %s
+        """
+        cur.execute(query, (hasta, limit))
+        return cur.fetchall()
+    except psycopg2.Error as e:
+        current_app.logger.error(f"Error de BD al obtener alertas próximas: {e}")
+        raise
+    finally:
+        if conn:
+            conn.close()
+
+def _fecha_calendario(valor, nombre):
+    if valor is None or isinstance(valor, date):
+        return valor
+    try:
+        return date.fromisoformat(valor)
+    except ValueError:
+        raise ValueError(f"Fecha '{nombre}' no válida: use AAAA-MM-DD.")
+
+@solo_lectura
+def get_calendario_tomas(desde=None, hasta=None, usuario_id=None):
+    """
+    Expande las alertas activas (de un cliente, o de todos si usuario_id es None) en sus tomas
+    concretas entre las fechas desde y hasta, incluidas; por defecto desde hoy y durante
+    CALENDARIO_DIAS_POR_DEFECTO días. Las tomas se dan en hora local
+    (RECORDATORIOS_ZONA_HORARIA), con utils.frecuencia.expandir_tomas; las alertas sin
+    frecuencia estructurada o sin tomas en el rango no aparecen.
+    """
+    zona = current_app.config['RECORDATORIOS_ZONA_HORARIA']
+    desde = _fecha_calendario(desde, 'desde') or datetime.now(ZoneInfo(zona)).date()
+    hasta = _fecha_calendario(hasta, 'hasta') or desde + timedelta(days=CALENDARIO_DIAS_POR_DEFECTO - 1)
+    if hasta < desde:
+        raise ValueError("La fecha 'hasta' no puede ser anterior a 'desde'.")
+    if (hasta - desde).days >= CALENDARIO_DIAS_MAXIMO:
+        raise ValueError(f"El calendario abarca como máximo {CALENDARIO_DIAS_MAXIMO} días.")
+
+    conn = None
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        filtro, params = ("AND a.usuario_id = %s", (usuario_id,)) if usuario_id is not None else ("", ())
+        cur.execute(f"""
+            SELECT a.id, a.usuario_id, u.nombre, m.nombre, a.dosis,
+                   a.frecuencia_intervalo_min, a.frecuencia_veces_dia, a.frecuencia_dias_semana,
+                   a.hora_preferida, a.fecha_inicio, a.fecha_fin
+            FROM alertas a
+            JOIN usuarios u ON a.usuario_id = u.id
+            JOIN medicamentos m ON a.medicamento_id = m.id
+            WHERE a.estado = 'activa' AND a.frecuencia_intervalo_min IS NOT NULL
+              AND a.fecha_inicio <= %s AND (a.fecha_fin IS NULL OR a.fecha_fin >= %s) {filtro}
+            ORDER BY a.usuario_id, a.id
+        """, (hasta, desde) + params)
+        filas = cur.fetchall()
+    except psycopg2.Error as e:
+        current_app.logger.error(f"Error de BD al obtener el calendario de tomas: {e}")
+        raise
+    finally:
+        if conn:
+            conn.close()
+
+    tomas = expandir_tomas([fila[5:] for fila in filas], desde, hasta)
+    alertas = [
+        {'alerta_id': fila[0], 'usuario_id': fila[1], 'cliente_nombre': fila[2], 'medicamento_nombre': fila[3],
+         'dosis': fila[4], 'tomas': tomas_alerta}
+        for fila, tomas_alerta in zip(filas, tomas) if tomas_alerta
+    ]
+    return {
+        'desde': desde.isoformat(), 'hasta': hasta.isoformat(), 'zona_horaria': zona,
+        'total_tomas': sum(len(a['tomas']) for a in alertas), 'alertas': alertas
+    }
+
+def contar_frecuencias_pendientes():
+    """Alertas activas con texto de frecuencia pero sin su forma estructurada."""
+    conn = None
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT count(*) FROM alertas
+            WHERE estado = 'activa' AND frecuencia IS NOT NULL AND frecuencia_intervalo_min IS NULL
+        """)
+        return cur.fetchone()[0]
+    finally:
+        if conn:
+            conn.close()
+
+def normalizar_frecuencias(todas=False, tamano_lote=1000):
+    """
+    Rellena frecuencia_intervalo_min, frecuencia_veces_dia y frecuencia_dias_semana a partir del
+    texto de frecuencia en las alertas que no los tienen (o en todas con todas=True), por lotes de
+    id. El trigger de alertas recalcula proxima_toma de las filas que cambian. Devuelve cuántas
+    se actualizaron y los textos que no se reconocieron con su número de alertas.
+    """
+    resultado = {'revisadas': 0, 'actualizadas': 0, 'sin_reconocer': {}}
+    ultimo_id = 0
+    conn = None
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        pendientes = "" if todas else " AND frecuencia_intervalo_min IS NULL"
+        while True:
+            cur.execute(
+                f"""
+                SELECT id, frecuencia, frecuencia_intervalo_min, frecuencia_veces_dia, frecuencia_dias_semana
+                FROM alertas WHERE id > %s AND frecuencia IS NOT NULL{pendientes}
+                ORDER BY id LIMIT %s
+                """,
+                (ultimo_id, tamano_lote)
+            )
+            filas = cur.fetchall()
+            if not filas:
+                break
+            ultimo_id = filas[-1][0]
+            resultado['revisadas'] += len(filas)
+            cambios = []
+            for alerta_id, frecuencia, *actuales in filas:
+                campos = _campos_frecuencia(frecuencia)
+                if campos[0] is None:
+                    resultado['sin_reconocer'][frecuencia] = resultado['sin_reconocer'].get(frecuencia, 0) + 1
+                if list(campos) != actuales:
+                    cambios.append((alerta_id, *campos))
+            if cambios:
+                execute_values(
+                    cur,
+                    """
+                    UPDATE alertas a SET frecuencia_intervalo_min = v.intervalo, frecuencia_veces_dia = v.veces,
+                                         frecuencia_dias_semana = v.dias
+                    FROM (VALUES %s) AS v(id, intervalo, veces, dias)
+                    WHERE a.id = v.id
+                    """,
+                    cambios,
+                    template="(%s, %s::INTEGER, %s::SMALLINT, %s::SMALLINT)"
+                )
+                resultado['actualizadas'] += len(cambios)
+            conn.commit()
+        return resultado
+    except psycopg2.Error as e:
+        if conn: conn.rollback()
+        current_app.logger.error(f"Error de BD al normalizar frecuencias: {e}")
+        raise
+    finally:
+        if conn:
+            conn.close()
+
+@solo_lectura
 def get_client_alerts(client_id):
     """Obtiene todas las alertas para un cliente específico."""
     conn = None
@@ -234,10 +507,6 @@ def get_client_alerts(client_id):
             ORDER BY a.fecha_inicio DESC, a.hora_preferida DESC
         """, (client_id,))
         alertas = cur.fetchall()
-
-        for alerta in alertas:
-            if isinstance(alerta.get('hora_preferida'), time):
-                alerta['hora_preferida'] = alerta['hora_preferida'].strftime('%H:%M:%S')
         return alertas
     except psycopg2.Error as e:
         current_app.logger.error(f"Error de BD al obtener mis_alertas para cliente {client_id}: {e}")
@@ -246,44 +515,24 @@ def get_client_alerts(client_id):
         if conn:
             conn.close()
 
+# Claves de receta_snapshot.datos que no forman parte de la receta consolidada.
+_CLAVES_SOLO_RECETA = ['eps_logo_url', 'eps_tipo_regimen', 'usuario_id']
+
+@solo_lectura
 def get_consolidated_client_recipes(client_id):
     """Obtiene alertas activas de un cliente para una receta consolidada."""
     conn = None
     try:
         conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-
+        cur = conn.cursor()
+        # receta_snapshot ya tiene el join de alertas, usuarios, medicamentos, EPS y asignador.
         cur.execute("""
-            SELECT
-                a.id as alerta_id, a.dosis, a.frecuencia, a.fecha_inicio, a.fecha_fin, a.hora_preferida, a.estado as estado_alerta,
-                m.nombre as medicamento_nombre, m.descripcion as medicamento_descripcion, m.composicion as medicamento_composicion,
-                m.indicaciones as medicamento_indicaciones, m.sintomas_secundarios as medicamento_sintomas_secundarios,
-                m.rango_edad as medicamento_rango_edad,
-                u.nombre as cliente_nombre, u.cedula as cliente_cedula, u.fecha_nacimiento as cliente_fecha_nacimiento,
-                u.telefono as cliente_telefono, u.ciudad as cliente_ciudad,
-                e.nombre as eps_nombre, e.nit as eps_nit,
-                ap.nombre as asignador_nombre, ap.cedula as asignador_cedula, ap.rol as asignador_rol
-            FROM alertas a
-            JOIN medicamentos m ON a.medicamento_id = m.id
-            JOIN usuarios u ON a.usuario_id = u.id
-            LEFT JOIN eps e ON u.eps_id = e.id
-            LEFT JOIN usuarios ap ON a.asignado_por_usuario_id = ap.id
-            WHERE a.usuario_id = %s AND a.estado = 'activa' AND m.estado_medicamento = 'disponible'
-            ORDER BY m.nombre;
-        """, (client_id,))
-        recetas_data = cur.fetchall()
-
-        for receta in recetas_data:
-            if receta.get('fecha_inicio'):
-                receta['fecha_inicio'] = receta['fecha_inicio'].isoformat()
-            if receta.get('fecha_fin'):
-                receta['fecha_fin'] = receta['fecha_fin'].isoformat()
-            if receta.get('hora_preferida'):
-                receta['hora_preferida'] = str(receta['hora_preferida'])
-            if receta.get('cliente_fecha_nacimiento'):
-                receta['cliente_fecha_nacimiento'] = receta['cliente_fecha_nacimiento'].isoformat()
-
-        return recetas_data
+            SELECT datos - %s::text[]
+            FROM receta_snapshot
+            WHERE usuario_id = %s AND estado_alerta = 'activa' AND medicamento_estado = 'disponible'
+            ORDER BY medicamento_nombre;
+        """, (_CLAVES_SOLO_RECETA, client_id))
+        return [fila[0] for fila in cur.fetchall()]
     except psycopg2.Error as e:
         current_app.logger.error(f"Error de BD al obtener recetas consolidadas para cliente {client_id}: {e}")
         raise
@@ -291,55 +540,106 @@ def get_consolidated_client_recipes(client_id):
         if conn:
             conn.close()
 
+@solo_lectura
 def get_recipe_data(alerta_id):
     """Obtiene datos de una alerta específica para generar una receta médica."""
     conn = None
     try:
         conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        
-        # MODIFICADO: Añadir e.logo_url y e.tipo_regimen a la consulta
-        cur.execute("""
-            SELECT
-                a.id as alerta_id, a.dosis, a.frecuencia, a.fecha_inicio, a.fecha_fin, a.hora_preferida, a.estado as estado_alerta,
-                u.nombre as cliente_nombre, u.cedula as cliente_cedula, u.fecha_nacimiento as cliente_fecha_nacimiento,
-                u.telefono as cliente_telefono, u.ciudad as cliente_ciudad,
-                m.nombre as medicamento_nombre, m.descripcion as medicamento_descripcion, m.composicion as medicamento_composicion,
-                m.indicaciones as medicamento_indicaciones, m.sintomas_secundarios as medicamento_sintomas_secundarios,
-                m.rango_edad as medicamento_rango_edad,
-                e.nombre as eps_nombre, e.nit as eps_nit, e.logo_url as eps_logo_url, e.tipo_regimen as eps_tipo_regimen,
-                ap.nombre as asignador_nombre, ap.cedula as asignador_cedula, ap.rol as asignador_rol,
-                a.usuario_id -- Se incluye para validación de permisos
-            FROM alertas a
-            JOIN usuarios u ON a.usuario_id = u.id
-            JOIN medicamentos m ON a.medicamento_id = m.id
-            LEFT JOIN eps e ON u.eps_id = e.id
-            LEFT JOIN usuarios ap ON a.asignado_por_usuario_id = ap.id
-            WHERE a.id = %s
-        """, (alerta_id,))
-        
-        receta_data = cur.fetchone()
-
-        if receta_data:
-            # La serialización de fechas ya está correctamente manejada
-            if receta_data.get('fecha_inicio'):
-                receta_data['fecha_inicio'] = receta_data['fecha_inicio'].isoformat()
-            if receta_data.get('fecha_fin'):
-                receta_data['fecha_fin'] = receta_data['fecha_fin'].isoformat()
-            if receta_data.get('hora_preferida'):
-                receta_data['hora_preferida'] = str(receta_data['hora_preferida'])
-            if receta_data.get('cliente_fecha_nacimiento'):
-                receta_data['cliente_fecha_nacimiento'] = receta_data['cliente_fecha_nacimiento'].isoformat()
-
-        return receta_data
-
+        cur = conn.cursor()
+        # Lectura por clave primaria del snapshot (ver vista_receta en script_MediAlert.sql);
+        # incluye usuario_id para la validación de permisos.
+        cur.execute("SELECT datos FROM receta_snapshot WHERE alerta_id = %s", (alerta_id,))
+        fila = cur.fetchone()
+        return fila[0] if fila else None
     except psycopg2.Error as e:
         current_app.logger.error(f"Error de BD al obtener datos de receta {alerta_id}: {e}")
         raise
     finally:
         if conn:
             conn.close()
+
+def verificar_receta_snapshot(reparar=False):
+    """
+    Compara receta_snapshot con vista_receta (los datos calculados en vivo) y devuelve las
+    alertas sin snapshot ('faltantes'), los snapshots sin alerta ('sobrantes') y los que
+    difieren ('diferentes'). Con reparar=True recalcula o borra esas filas.
+    """
+    conn = None
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT COALESCE(v.alerta_id, rs.alerta_id),
+                   CASE WHEN rs.alerta_id IS NULL THEN 'faltantes'
+                        WHEN v.alerta_id IS NULL THEN 'sobrantes'
+                        ELSE 'diferentes' END
+            FROM vista_receta v
+            FULL JOIN receta_snapshot rs ON rs.alerta_id = v.alerta_id
+            WHERE rs.alerta_id IS NULL OR v.alerta_id IS NULL
+               OR (v.usuario_id, v.medicamento_id, v.asignado_por_usuario_id, v.eps_id, v.estado_alerta,
+                   v.medicamento_estado, v.medicamento_nombre, v.datos)
+                  IS DISTINCT FROM
+                  (rs.usuario_id, rs.medicamento_id, rs.asignado_por_usuario_id, rs.eps_id, rs.estado_alerta,
+                   rs.medicamento_estado, rs.medicamento_nombre, rs.datos)
+            ORDER BY 1;
+        """)
+        resultado = {'faltantes': [], 'sobrantes': [], 'diferentes': [], 'reparadas': 0}
+        for alerta_id, tipo in cur.fetchall():
+            resultado[tipo].append(alerta_id)
+
+        if reparar:
+            if resultado['sobrantes']:
+                cur.execute("DELETE FROM receta_snapshot WHERE alerta_id = ANY(%s);", (resultado['sobrantes'],))
+                resultado['reparadas'] += cur.rowcount
+            a_refrescar = resultado['faltantes'] + resultado['diferentes']
+            if a_refrescar:
+                cur.execute("SELECT fn_refrescar_receta_snapshot(%s::integer[]);", (a_refrescar,))
+                resultado['reparadas'] += cur.fetchone()[0]
+            conn.commit()
+        return resultado
+    except psycopg2.Error as e:
+        if conn: conn.rollback()
+        current_app.logger.error(f"Error de BD al verificar receta_snapshot: {e}")
+        raise
+    finally:
+        if conn:
+            conn.close()
             
+def verificar_contadores_alertas(reparar=False):
+    """
+    Compara contadores_alertas_cliente con los conteos reales de alertas y devuelve los clientes
+    cuyo conteo difiere. Con reparar=True recalcula toda la tabla.
+    """
+    conn = None
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT COALESCE(r.usuario_id, c.usuario_id)
+            FROM (
+                SELECT usuario_id, count(*) FILTER (WHERE estado = 'activa') AS activas, count(*) AS total
+                FROM alertas GROUP BY usuario_id
+            ) r
+            FULL JOIN contadores_alertas_cliente c ON c.usuario_id = r.usuario_id
+            WHERE (COALESCE(r.activas, 0), COALESCE(r.total, 0))
+                  IS DISTINCT FROM (COALESCE(c.alertas_activas, 0), COALESCE(c.alertas_total, 0))
+            ORDER BY 1;
+        """)
+        resultado = {'diferentes': [fila[0] for fila in cur.fetchall()], 'reparadas': 0}
+        if reparar and resultado['diferentes']:
+            cur.execute("SELECT fn_recalcular_contadores_alertas_cliente();")
+            resultado['reparadas'] = cur.fetchone()[0]
+            conn.commit()
+        return resultado
+    except psycopg2.Error as e:
+        if conn: conn.rollback()
+        current_app.logger.error(f"Error de BD al verificar contadores de alertas: {e}")
+        raise
+    finally:
+        if conn:
+            conn.close()
+
 class AlertService:
     def __init__(self, db_conn=None):
         self.db_conn = db_conn if db_conn else get_db_connection()
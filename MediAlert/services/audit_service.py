@@ -0,0 +1,116 @@
+# medialert/services/audit_service.py
+
+import gzip
+import os
+import re
+from datetime import datetime, timezone
+
+import psycopg2
+from flask import current_app
+
+from database import get_db_connection
+
+_PATRON_PARTICION = re.compile(r'^auditoria_(\d{4})_(\d{2})$')
+
+def crear_particiones_auditoria(meses_adelante):
+    """Crea las particiones mensuales de auditoría del mes en curso y los siguientes."""
+    conn = None
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        cur.execute("SELECT fn_crear_particiones_auditoria(%s);", (meses_adelante,))
+        creadas = cur.fetchone()[0]
+        conn.commit()
+        return creadas
+    except psycopg2.Error as e:
+        if conn: conn.rollback()
+        current_app.logger.error(f"Error de BD al crear particiones de auditoría: {e}")
+        raise
+    finally:
+        if conn:
+            conn.close()
+
+def _meses_atras(fecha, meses):
+    indice = fecha.year * 12 + (fecha.month - 1) - meses
+    return indice // 12, indice % 12 + 1
+
+def listar_particiones_vencidas(meses_retencion):
+    """
+    Devuelve [(nombre, estado), ...] de las particiones anteriores a la retención. estado es
+    'adjunta', 'pendiente' (un DETACH CONCURRENTLY quedó a medias) o 'separada' (tabla
+    auditoria_AAAA_MM que ya no es partición: se separó pero no llegó a archivarse).
+    """
+    anio, mes = _meses_atras(datetime.now(timezone.utc), meses_retencion)
+    limite = f"auditoria_{anio:04d}_{mes:02d}"
+    conn = None
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT c.relname,
+                   CASE WHEN i.inhrelid IS NULL THEN 'separada'
+                        WHEN i.inhdetachpending THEN 'pendiente'
+                        ELSE 'adjunta' END
+            FROM pg_class c
+            LEFT JOIN pg_inherits i ON i.inhrelid = c.oid AND i.inhparent = 'auditoria'::regclass
+            WHERE c.relkind = 'r' AND c.relnamespace = 'public'::regnamespace
+              AND c.relname LIKE 'auditoria\\_%'
+              AND (i.inhrelid IS NOT NULL OR NOT c.relispartition)
+            ORDER BY c.relname
+        """)
+        return [
+            (nombre, estado) for nombre, estado in cur.fetchall()
+            if _PATRON_PARTICION.match(nombre) and nombre < limite
+        ]
+    finally:
+        if conn:
+            conn.close()
+
+def archivar_particion_auditoria(nombre, destino, estado='adjunta'):
+    """
+    Exporta una partición de auditoría como CSV comprimido con gzip en 'destino', la separa sin
+    bloquear a los escritores (DETACH ... CONCURRENTLY) y después la elimina. La exportación se
+    hace con la partición aún adjunta: si falla, sus filas siguen visibles en auditoria y la
+    próxima ejecución la vuelve a intentar. Devuelve la ruta del archivo generado.
+    """
+    if not _PATRON_PARTICION.match(nombre):
+        raise ValueError(f'Nombre de partición de auditoría no válido: {nombre}')
+    os.makedirs(destino, exist_ok=True)
+    ruta = os.path.join(destino, f"{nombre}.csv.gz")
+    ruta_temporal = ruta + '.tmp'
+
+    conn = get_db_connection()
+    try:
+        # DETACH CONCURRENTLY no puede ejecutarse dentro de un bloque de transacción.
+        conn.autocommit = True
+        cur = conn.cursor()
+        with gzip.open(ruta_temporal, 'wb') as archivo:
+            cur.copy_expert(f'COPY "{nombre}" TO STDOUT WITH (FORMAT csv, HEADER true)', archivo)
+        os.replace(ruta_temporal, ruta)
+
+        if estado == 'pendiente':
+            # Una ejecución anterior se interrumpió a mitad de la separación.
+            cur.execute(f'ALTER TABLE auditoria DETACH PARTITION "{nombre}" FINALIZE;')
+        elif estado == 'adjunta':
+            cur.execute(f'ALTER TABLE auditoria DETACH PARTITION "{nombre}" CONCURRENTLY;')
+
+        # Solo se elimina la tabla cuando el archivo quedó escrito por completo.
+        cur.execute(f'DROP TABLE "{nombre}";')
+        return ruta
+    except (psycopg2.Error, OSError) as e:
+        current_app.logger.error(f"Error al archivar la partición de auditoría {nombre}: {e}")
+        if os.path.exists(ruta_temporal):
+            os.remove(ruta_temporal)
+        raise
+    finally:
+        conn.autocommit = False
+        conn.close()
+
+def ejecutar_mantenimiento_auditoria(meses_adelante, meses_retencion, destino):
+    """Crea particiones futuras y archiva las que superan la retención. Devuelve un resumen."""
+    creadas = crear_particiones_auditoria(meses_adelante)
+    archivadas = [
+        archivar_particion_auditoria(nombre, destino, estado)
+        for nombre, estado in listar_particiones_vencidas(meses_retencion)
+    ]
+    return {'particiones_creadas': creadas, 'archivos': archivadas}
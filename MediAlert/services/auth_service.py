@@ -5,7 +5,7 @@ from psycopg2.extras import RealDictCursor
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask import current_app, session
 
-from database import get_db_connection, registrar_auditoria_aplicacion
+from database import get_db_connection, registrar_auditoria_aplicacion, establecer_contexto_auditoria
 
 def verify_and_login_user(cedula, password_ingresada):
     """Verifica credenciales de usuario y establece la sesión."""
@@ -81,6 +81,7 @@ def update_user_password(user_id, current_password, new_password):
             return False, "La contraseña actual es incorrecta."
             
         new_password_hashed = generate_password_hash(new_password)
+        establecer_contexto_auditoria(conn, 'CAMBIO_CONTRASENA_EXITOSO', 'usuarios')
         cur.execute("UPDATE usuarios SET contrasena = %s WHERE id = %s", (new_password_hashed, user_id))
         conn.commit()
         
@@ -88,7 +89,6 @@ def update_user_password(user_id, current_password, new_password):
             'CAMBIO_CONTRASENA_EXITOSO',
             tabla_afectada='usuarios',
             registro_id=str(user_id),
-            datos_anteriores={'contrasena': '********'}, 
             datos_nuevos={'contrasena': '********'}
         )
         return True, "Contraseña actualizada con éxito."
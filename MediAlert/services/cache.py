@@ -0,0 +1,90 @@
+# medialert/services/cache.py
+
+import os
+import threading
+from functools import wraps
+
+from flask import current_app
+
+from database import obtener_versiones_tablas
+from utils.service_cache import AUSENTE, MemoryBackend, FileBackend, RedisBackend
+
+_BACKENDS = ('memoria', 'archivo', 'redis')
+_lock = threading.Lock()
+
+def _crear_backend(config):
+    tipo = config.get('SERVICE_CACHE_BACKEND', 'memoria')
+    if tipo == 'memoria':
+        return MemoryBackend(config['SERVICE_CACHE_MAX_ENTRIES'])
+    if tipo == 'archivo':
+        directorio = config.get('SERVICE_CACHE_DIR') or os.path.join(config['INSTANCE_FOLDER_PATH'], 'service_cache')
+        return FileBackend(directorio, config['SERVICE_CACHE_MAX_ENTRIES'])
+    if tipo == 'redis':
+        return RedisBackend(config['SERVICE_CACHE_REDIS_URL'])
+    raise ValueError(f"SERVICE_CACHE_BACKEND no válido: '{tipo}' (use {', '.join(_BACKENDS)} o 'ninguno').")
+
+def get_service_cache():
+    """Devuelve el almacén de la caché de servicios del proceso, o None si está desactivada."""
+    app = current_app._get_current_object()
+    if app.config.get('SERVICE_CACHE_BACKEND', 'memoria') == 'ninguno':
+        return None
+    entrada = app.extensions.get('medialert_service_cache')
+    if entrada is None or entrada[1] != os.getpid():
+        with _lock:
+            entrada = app.extensions.get('medialert_service_cache')
+            if entrada is None or entrada[1] != os.getpid():
+                entrada = app.extensions['medialert_service_cache'] = (_crear_backend(app.config), os.getpid())
+    return entrada[0]
+
+def get_service_cache_stats():
+    backend = get_service_cache()
+    return backend.stats() if backend is not None else {'backend': 'ninguno'}
+
+def cache_versionado(*tablas, ttl=None):
+    """
+    Caché de lectura para funciones de servicio que solo leen de 'tablas'. La clave incluye la
+    función, sus argumentos y la versión actual de cada tabla (versiones_tabla, que los triggers
+    cambian en cada escritura), así que un cambio en cualquiera de ellas hace que la siguiente
+    llamada vuelva a la BD sin necesidad de invalidar nada. ttl (segundos, por defecto
+    SERVICE_CACHE_TTL) solo limita cuánto se conserva una entrada. Las versiones se leen con
+    el mismo enrutamiento que la función decorada (@solo_lectura): de la misma réplica, o del
+    primario si la petición ya usa esa conexión.
+
+    Los argumentos deben tener un repr() estable (números, cadenas, None, bool) y el resultado
+    debe poder serializarse con pickle si el backend no es 'memoria'. El valor devuelto puede
+    compartirse entre peticiones y no debe modificarse.
+    """
+    def decorador(func):
+        nombre = f"{func.__module__}.{func.__qualname__}"
+
+        @wraps(func)
+        def envoltura(*args, **kwargs):
+            backend = get_service_cache()
+            if backend is None:
+                return func(*args, **kwargs)
+            try:
+                versiones = obtener_versiones_tablas(tablas)
+            except Exception as e:
+                current_app.logger.warning(f"Caché de servicios omitida para {nombre}: {e}")
+                return func(*args, **kwargs)
+
+            firma_versiones = ','.join(f"{t}:{versiones[t]}" for t in tablas)
+            clave = f"{nombre}|{args!r}|{sorted(kwargs.items())!r}|{firma_versiones}"
+            try:
+                valor = backend.get(clave)
+            except Exception as e:
+                current_app.logger.warning(f"Error leyendo la caché de servicios ({nombre}): {e!r}")
+                valor = AUSENTE
+            if valor is not AUSENTE:
+                return valor
+
+            valor = func(*args, **kwargs)
+            try:
+                backend.set(clave, valor, ttl if ttl is not None else current_app.config.get('SERVICE_CACHE_TTL'))
+            except Exception as e:
+                current_app.logger.warning(f"Error guardando en la caché de servicios ({nombre}): {e!r}")
+            return valor
+
+        envoltura.sin_cache = func
+        return envoltura
+    return decorador
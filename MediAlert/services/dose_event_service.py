@@ -0,0 +1,168 @@
+# medialert/services/dose_event_service.py
+
+import atexit
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+from functools import partial
+from zoneinfo import ZoneInfo
+
+import psycopg2
+from psycopg2.extras import execute_values
+from flask import current_app
+
+from database import get_db_connection
+from utils.batch_writer import BatchWriter
+
+# Valor de eventos_toma.tipo para cada tipo de evento que envía el cliente.
+TIPOS_EVENTO_TOMA = {'tomada': 1, 'omitida': 2}
+EVENTOS_TOMA_MAXIMO_POR_PETICION = 500
+# Margen para relojes de dispositivo adelantados en registrado_en.
+_TOLERANCIA_RELOJ = timedelta(minutes=5)
+
+_writer_lock = threading.Lock()
+
+# Las filas de alertas borradas entre la petición y la escritura del lote se descartan en el
+# JOIN, en lugar de hacer fallar el lote entero por la clave foránea. Los eventos ya guardados
+# (reenvíos del cliente tras un error) se ignoran.
+_INSERTAR_EVENTOS = """
+    INSERT INTO eventos_toma (programada_para, registrado_en, alerta_id, tipo)
+    SELECT v.programada_para, v.registrado_en, v.alerta_id, v.tipo
+    FROM (VALUES %s) AS v(programada_para, registrado_en, alerta_id, tipo)
+    JOIN alertas a ON a.id = v.alerta_id
+    ON CONFLICT (alerta_id, programada_para, tipo, registrado_en) DO NOTHING
+"""
+_PLANTILLA_EVENTO = "(%s::TIMESTAMPTZ, %s::TIMESTAMPTZ, %s::INTEGER, %s::SMALLINT)"
+
+
+def _insertar_eventos(conn, filas):
+    with conn.cursor() as cur:
+        execute_values(cur, _INSERTAR_EVENTOS, filas, template=_PLANTILLA_EVENTO, page_size=len(filas))
+
+
+def _escribir_lote_eventos(app, filas):
+    """Inserta un lote de eventos de toma con un único INSERT multi-fila."""
+    with app.app_context():
+        conn = get_db_connection()
+        try:
+            _insertar_eventos(conn, filas)
+            conn.commit()
+        except psycopg2.Error:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+
+def get_eventos_writer():
+    """
+    Escritor por lotes de eventos de toma de este proceso, o None si EVENTOS_TOMA_ASYNC_ENABLED
+    está desactivado. Se arranca en el primer uso de cada proceso (como la caché de catálogos),
+    así cada worker del servidor tiene su propio hilo, y al terminar el proceso vacía su cola.
+    """
+    app = current_app._get_current_object()
+    if not app.config.get('EVENTOS_TOMA_ASYNC_ENABLED'):
+        return None
+    entrada = app.extensions.get('medialert_eventos_writer')
+    if entrada is None or entrada[1] != os.getpid():
+        with _writer_lock:
+            entrada = app.extensions.get('medialert_eventos_writer')
+            if entrada is None or entrada[1] != os.getpid():
+                writer = BatchWriter(
+                    'eventos_toma',
+                    partial(_escribir_lote_eventos, app),
+                    max_queue=app.config['EVENTOS_TOMA_QUEUE_SIZE'],
+                    batch_size=app.config['EVENTOS_TOMA_BATCH_SIZE'],
+                    flush_interval=app.config['EVENTOS_TOMA_FLUSH_INTERVAL'],
+                    politica=app.config['EVENTOS_TOMA_BACKPRESSURE'],
+                    logger=app.logger
+                ).start()
+                # atexit ejecuta en orden inverso: la cola se vacía antes de cerrar el pool.
+                atexit.register(writer.stop)
+                entrada = app.extensions['medialert_eventos_writer'] = (writer, os.getpid())
+    return entrada[0]
+
+
+def _instante(valor, nombre, zona):
+    """Fecha y hora ISO 8601; sin zona horaria se interpreta en hora local (como el calendario)."""
+    if not isinstance(valor, str):
+        raise ValueError(f"'{nombre}' debe ser una fecha y hora ISO 8601.")
+    try:
+        instante = datetime.fromisoformat(valor)
+    except ValueError:
+        raise ValueError(f"'{nombre}' no es una fecha y hora válida: '{valor}'.")
+    if instante.tzinfo is None:
+        instante = instante.replace(tzinfo=zona)
+    return instante.astimezone(timezone.utc)
+
+
+def _validar_evento(evento, zona, ahora):
+    if not isinstance(evento, dict):
+        raise ValueError('Cada evento debe ser un objeto con alerta_id, programada_para y tipo.')
+    alerta_id = evento.get('alerta_id')
+    if not isinstance(alerta_id, int) or isinstance(alerta_id, bool):
+        raise ValueError("'alerta_id' es requerido y debe ser un número entero.")
+    tipo = TIPOS_EVENTO_TOMA.get(evento.get('tipo'))
+    if tipo is None:
+        raise ValueError(f"'tipo' no válido: use {', '.join(TIPOS_EVENTO_TOMA)}.")
+    programada_para = _instante(evento.get('programada_para'), 'programada_para', zona)
+    if programada_para > ahora + timedelta(days=1):
+        raise ValueError('No se pueden registrar tomas programadas para más de un día en el futuro.')
+    registrado_en = ahora
+    if evento.get('registrado_en') is not None:
+        registrado_en = _instante(evento['registrado_en'], 'registrado_en', zona)
+        if registrado_en > ahora + _TOLERANCIA_RELOJ:
+            raise ValueError("'registrado_en' no puede estar en el futuro.")
+    return (programada_para, registrado_en, alerta_id, tipo)
+
+
+def registrar_eventos_toma(usuario_id, eventos):
+    """
+    Registra confirmaciones ('tomada') u omisiones ('omitida') de tomas de las alertas del
+    cliente. Valida todos los eventos (y que las alertas sean suyas) antes de aceptar ninguno;
+    después los encola en el escritor por lotes, y los que no caben en la cola se insertan en la
+    transacción de la petición. Devuelve cuántos eventos se aceptaron.
+
+    Si la petición falla, los eventos ya encolados se escriben igualmente; el cliente puede
+    reenviarlos sin duplicarlos siempre que mande el mismo registrado_en (sin él se usa la hora
+    del servidor y cada reenvío es un evento distinto).
+    """
+    if not isinstance(eventos, list) or not eventos:
+        raise ValueError('Debe enviar al menos un evento de toma.')
+    if len(eventos) > EVENTOS_TOMA_MAXIMO_POR_PETICION:
+        raise ValueError(f'Máximo {EVENTOS_TOMA_MAXIMO_POR_PETICION} eventos por petición.')
+    zona = ZoneInfo(current_app.config['RECORDATORIOS_ZONA_HORARIA'])
+    ahora = datetime.now(timezone.utc)
+    filas = [_validar_evento(evento, zona, ahora) for evento in eventos]
+
+    conn = None
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        alerta_ids = list({fila[2] for fila in filas})
+        cur.execute("SELECT id FROM alertas WHERE usuario_id = %s AND id = ANY(%s)", (usuario_id, alerta_ids))
+        ajenas = set(alerta_ids) - {fila[0] for fila in cur.fetchall()}
+        if ajenas:
+            raise ValueError(f"Alertas no encontradas: {', '.join(map(str, sorted(ajenas)))}.")
+
+        writer = get_eventos_writer()
+        sincronas = [fila for fila in filas if writer is None or not writer.submit(fila)]
+        if sincronas:
+            _insertar_eventos(conn, sincronas)
+        conn.commit()
+        return len(filas)
+    except psycopg2.Error as e:
+        if conn: conn.rollback()
+        current_app.logger.error(f"Error de BD al registrar eventos de toma del usuario {usuario_id}: {e}")
+        raise
+    finally:
+        if conn:
+            conn.close()
+
+
+def get_eventos_writer_metrics():
+    """Métricas del escritor de eventos de toma de este proceso (cola, lotes, latencias)."""
+    writer = get_eventos_writer()
+    if writer is None:
+        return {'habilitado': False}
+    return {'habilitado': True, **writer.metrics()}
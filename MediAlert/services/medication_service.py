@@ -4,10 +4,21 @@ import psycopg2
 from psycopg2.extras import RealDictCursor
 from flask import current_app, session
 
-from database import get_db_connection, registrar_auditoria_aplicacion
+from database import (
+    get_db_connection, registrar_auditoria_aplicacion, establecer_contexto_auditoria,
+    obtener_catalogo, invalidar_catalogo
+)
 
 def get_medications(estado_filtro='disponible'):
-    """Obtiene una lista de medicamentos basada en el estado."""
+    """
+    Obtiene una lista de medicamentos basada en el estado.
+    Se sirve desde la caché de catálogos, que se invalida por NOTIFY al cambiar la tabla.
+    No se lee de réplicas: una réplica retrasada podría volver a llenar la caché con datos
+    anteriores al aviso y dejarlos ahí hasta el siguiente cambio.
+    """
+    return obtener_catalogo('medicamentos', estado_filtro, lambda: _consultar_medicamentos(estado_filtro))
+
+def _consultar_medicamentos(estado_filtro):
     conn = None
     try:
         conn = get_db_connection()
@@ -63,6 +74,8 @@ def create_medication(med_data, admin_id_actual):
         if not nombre:
             raise ValueError('El nombre del medicamento es requerido.')
         
+        detalles_auditoria = {'creado_por_admin_id': admin_id_actual}
+        establecer_contexto_auditoria(conn, 'CREACION_MEDICAMENTO', 'medicamentos', detalles_auditoria)
         cur.execute(
             """
             INSERT INTO medicamentos (nombre, descripcion, composicion, sintomas_secundarios, indicaciones, rango_edad, estado_medicamento) 
@@ -71,13 +84,14 @@ def create_medication(med_data, admin_id_actual):
             (nombre, descripcion, composicion, sintomas_secundarios, indicaciones, rango_edad)
         )
         new_id = cur.fetchone()['id']
+        invalidar_catalogo('medicamentos')
         conn.commit()
         registrar_auditoria_aplicacion(
             'CREACION_MEDICAMENTO', 
             tabla_afectada='medicamentos', 
             registro_id=str(new_id),
             datos_nuevos=med_data,
-            detalles_adicionales={'creado_por_admin_id': admin_id_actual}
+            detalles_adicionales=detalles_auditoria
         )
         return new_id
     except psycopg2.IntegrityError as e:
@@ -109,6 +123,14 @@ def update_medication(mid, med_data, old_med_data, admin_id_actual):
         if estado_medicamento not in ['disponible', 'discontinuado']:
              raise ValueError('Valor de estado_medicamento no válido.')
         
+        accion_audit = 'EDICION_MEDICAMENTO'
+        if old_med_data['estado_medicamento'] == 'disponible' and estado_medicamento == 'discontinuado':
+            accion_audit = 'DISCONTINUACION_MEDICAMENTO'
+        elif old_med_data['estado_medicamento'] == 'discontinuado' and estado_medicamento == 'disponible':
+            accion_audit = 'REACTIVACION_MEDICAMENTO'
+        detalles_auditoria = {'actualizado_por_admin_id': admin_id_actual}
+        establecer_contexto_auditoria(conn, accion_audit, 'medicamentos', detalles_auditoria)
+
         cur.execute(
             """
             UPDATE medicamentos SET nombre=%s, descripcion=%s, composicion=%s, 
@@ -118,12 +140,7 @@ def update_medication(mid, med_data, old_med_data, admin_id_actual):
             (nombre, descripcion, composicion, sintomas_secundarios, indicaciones, rango_edad, estado_medicamento, mid)
         )
         conn.commit()
-        
-        accion_audit = 'EDICION_MEDICAMENTO'
-        if old_med_data['estado_medicamento'] == 'disponible' and estado_medicamento == 'discontinuado':
-            accion_audit = 'DISCONTINUACION_MEDICAMENTO'
-        elif old_med_data['estado_medicamento'] == 'discontinuado' and estado_medicamento == 'disponible':
-            accion_audit = 'REACTIVACION_MEDICAMENTO'
+        invalidar_catalogo('medicamentos')
         
         registrar_auditoria_aplicacion(
             accion_audit, 
@@ -131,7 +148,7 @@ def update_medication(mid, med_data, old_med_data, admin_id_actual):
             registro_id=str(mid),
             datos_anteriores=dict(old_med_data),
             datos_nuevos=med_data,
-            detalles_adicionales={'actualizado_por_admin_id': admin_id_actual}
+            detalles_adicionales=detalles_auditoria
         )
         return True
     except psycopg2.IntegrityError as e:
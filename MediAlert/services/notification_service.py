@@ -0,0 +1,379 @@
+# medialert/services/notification_service.py
+
+import os
+import threading
+import time as reloj
+from collections import defaultdict
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+
+import psycopg2
+from psycopg2.extras import RealDictCursor, execute_values
+from flask import current_app
+
+from database import get_db_connection, _connect_kwargs
+from utils.db_listener import NotifyListener
+from utils.notification_channels import FileChannel, SMTPChannel, NotificacionRechazada
+
+# Canal de NOTIFY con el que se despierta a los workers al encolar recordatorios.
+CANAL_OUTBOX = 'medialert_outbox'
+CANALES_NOTIFICACION = ('archivo', 'smtp')
+
+
+def crear_canal(nombre, config):
+    """Instancia el canal de entrega 'nombre' con la configuración de la aplicación."""
+    if nombre == 'archivo':
+        return FileChannel(config.get('NOTIFICACIONES_DIR') or os.path.join(config['INSTANCE_FOLDER_PATH'], 'notificaciones'))
+    if nombre == 'smtp':
+        return SMTPChannel(
+            config['NOTIFICACIONES_SMTP_HOST'], config['NOTIFICACIONES_SMTP_PORT'],
+            remitente=config['NOTIFICACIONES_REMITENTE'], usuario=config.get('NOTIFICACIONES_SMTP_USUARIO'),
+            contrasena=config.get('NOTIFICACIONES_SMTP_CONTRASENA'), starttls=config['NOTIFICACIONES_SMTP_STARTTLS']
+        )
+    raise ValueError(f"Canal de notificación no válido: '{nombre}' (use {', '.join(CANALES_NOTIFICACION)}).")
+
+
+def _bloquear_alertas(cur, alerta_ids):
+    # Siempre en orden de id: el programador y los workers actualizan las mismas alertas en
+    # transacciones concurrentes y así no se bloquean mutuamente en orden inverso.
+    cur.execute("SELECT id FROM alertas WHERE id = ANY(%s) ORDER BY id FOR UPDATE", (sorted(alerta_ids),))
+
+
+def encolar_recordatorios(lote):
+    """
+    Acción del programador de recordatorios al vencer un lote: inserta una notificación por toma y
+    canal configurado (NOTIFICACIONES_CANALES) en notificaciones_outbox, marca ultima_toma_encolada
+    en las alertas y avisa a los workers, todo en una transacción. Una toma ya encolada (p. ej. tras
+    reiniciar el programador) no se duplica.
+    """
+    canales = current_app.config['NOTIFICACIONES_CANALES']
+    conn = None
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        _bloquear_alertas(cur, {r['alerta_id'] for r in lote})
+        execute_values(
+            cur,
+            """
+            INSERT INTO notificaciones_outbox (alerta_id, canal, programada_para)
+            SELECT v.alerta_id, v.canal, v.programada FROM (VALUES %s) AS v(alerta_id, canal, programada)
+            JOIN alertas a ON a.id = v.alerta_id
+            ON CONFLICT (alerta_id, programada_para, canal) DO NOTHING
+            """,
+            [(r['alerta_id'], canal, r['programada_para']) for r in lote for canal in canales],
+            template="(%s, %s, %s::TIMESTAMPTZ)"
+        )
+        execute_values(
+            cur,
+            """
+            UPDATE alertas a SET ultima_toma_encolada = v.programada
+            FROM (VALUES %s) AS v(id, programada)
+            WHERE a.id = v.id AND (a.ultima_toma_encolada IS NULL OR a.ultima_toma_encolada < v.programada)
+            """,
+            [(r['alerta_id'], r['programada_para']) for r in lote],
+            template="(%s, %s::TIMESTAMPTZ)"
+        )
+        cur.execute("SELECT pg_notify(%s, '')", (CANAL_OUTBOX,))
+        conn.commit()
+    except psycopg2.Error as e:
+        if conn: conn.rollback()
+        current_app.logger.error(f"Error de BD al encolar recordatorios: {e}")
+        raise
+    finally:
+        if conn:
+            conn.close()
+
+
+class NotificationWorker:
+    """
+    Worker de la outbox: reclama lotes de notificaciones pendientes con FOR UPDATE SKIP LOCKED
+    (varios workers, en uno o varios servidores, nunca toman la misma fila), las entrega por su
+    canal y confirma el resultado en la misma transacción que las reclamó. Si el proceso muere
+    a mitad de lote, la transacción se deshace y las filas vuelven a la cola, así que la entrega
+    es "al menos una vez".
+
+    Un fallo temporal se reintenta con espera exponencial (reintento_base * 2^(intentos-1),
+    hasta reintento_maximo segundos); al llegar a max_intentos, o si el canal la rechaza
+    (NotificacionRechazada), la notificación pasa a 'fallida'. Las de alertas que ya no están
+    activas se marcan 'cancelada' sin enviarse. ultima_notificacion_enviada de las alertas
+    enviadas se actualiza con una sola sentencia por lote.
+
+    Espera nuevas notificaciones con LISTEN (CANAL_OUTBOX) y revisa la cola cada
+    espera_inactiva segundos para los reintentos.
+    """
+
+    def __init__(self, canales, tamano_lote=100, max_intentos=5, reintento_base=30, reintento_maximo=3600,
+                 espera_inactiva=5.0, zona=None):
+        self.canales = {canal.nombre: canal for canal in canales}
+        self.tamano_lote = tamano_lote
+        self.max_intentos = max_intentos
+        self.reintento_base = reintento_base
+        self.reintento_maximo = reintento_maximo
+        self.espera_inactiva = espera_inactiva
+        self.zona = ZoneInfo(zona or current_app.config['RECORDATORIOS_ZONA_HORARIA'])
+        self._lock = threading.Lock()
+        self._despertar = threading.Event()
+        self._detener = threading.Event()
+        self._inicio = reloj.monotonic()
+        self.metricas = {
+            'enviadas': 0, 'reintentos': 0, 'fallidas': 0, 'canceladas': 0, 'lotes': 0, 'errores': 0,
+            'latencia_max_ms': 0.0, 'latencia_total_ms': 0.0, 'ultimo_lote_por_segundo': None
+        }
+
+    def _redactar(self, fila):
+        local = fila['programada_para'].astimezone(self.zona)
+        dosis = f" ({fila['dosis']})" if fila['dosis'] else ''
+        fila['asunto'] = f"Recordatorio: {fila['medicamento']}"
+        fila['mensaje'] = (f"Hola {fila['nombre']}, es hora de tomar {fila['medicamento']}{dosis}. "
+                           f"Toma programada para las {local:%H:%M} del {local:%d/%m/%Y}.")
+        return fila
+
+    def _sumar(self, **valores):
+        with self._lock:
+            for nombre, valor in valores.items():
+                self.metricas[nombre] += valor
+
+    def procesar_lote(self):
+        """Reclama, entrega y confirma un lote. Devuelve cuántas notificaciones procesó."""
+        inicio = reloj.monotonic()
+        conn = None
+        try:
+            conn = get_db_connection()
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+            cur.execute(
+                """
+                SELECT o.id, o.alerta_id, o.canal, o.programada_para, o.intentos,
+                       a.estado AS estado_alerta, a.dosis, u.nombre, u.email, m.nombre AS medicamento
+                FROM notificaciones_outbox o
+                JOIN alertas a ON a.id = o.alerta_id
+                JOIN usuarios u ON u.id = a.usuario_id
+                JOIN medicamentos m ON m.id = a.medicamento_id
+                WHERE o.estado = 'pendiente' AND o.disponible_en <= CURRENT_TIMESTAMP AND o.canal = ANY(%s)
+                ORDER BY o.disponible_en, o.id
+                LIMIT %s
+                FOR UPDATE OF o SKIP LOCKED
+                """,
+                (list(self.canales), self.tamano_lote)
+            )
+            filas = cur.fetchall()
+            if not filas:
+                conn.commit()
+                return 0
+
+            canceladas = [f['id'] for f in filas if f['estado_alerta'] != 'activa']
+            por_canal = defaultdict(list)
+            for fila in filas:
+                if fila['estado_alerta'] == 'activa':
+                    por_canal[fila['canal']].append(self._redactar(fila))
+
+            enviadas, fallos = [], []
+            for canal, notificaciones in por_canal.items():
+                try:
+                    errores = self.canales[canal].enviar(notificaciones)
+                except Exception as e:
+                    errores = {n['id']: e for n in notificaciones}
+                for n in notificaciones:
+                    if n['id'] in errores:
+                        fallos.append((n, errores[n['id']]))
+                    else:
+                        enviadas.append(n)
+
+            reintentos, fallidas = [], []
+            for n, error in fallos:
+                intentos = n['intentos'] + 1
+                definitiva = isinstance(error, NotificacionRechazada) or intentos >= self.max_intentos
+                espera = min(self.reintento_base * 2 ** (intentos - 1), self.reintento_maximo)
+                (fallidas if definitiva else reintentos).append(
+                    (n['id'], f"{type(error).__name__}: {error}"[:1000], 'fallida' if definitiva else 'pendiente', espera)
+                )
+
+            if enviadas:
+                cur.execute(
+                    """
+                    UPDATE notificaciones_outbox SET estado = 'enviada', intentos = intentos + 1,
+                           procesada_en = CURRENT_TIMESTAMP, ultimo_error = NULL
+                    WHERE id = ANY(%s)
+                    """,
+                    ([n['id'] for n in enviadas],)
+                )
+                alerta_ids = {n['alerta_id'] for n in enviadas}
+                _bloquear_alertas(cur, alerta_ids)
+                cur.execute(
+                    "UPDATE alertas SET ultima_notificacion_enviada = CURRENT_TIMESTAMP WHERE id = ANY(%s)",
+                    (list(alerta_ids),)
+                )
+            if canceladas:
+                cur.execute(
+                    """
+                    UPDATE notificaciones_outbox SET estado = 'cancelada', procesada_en = CURRENT_TIMESTAMP
+                    WHERE id = ANY(%s)
+                    """,
+                    (canceladas,)
+                )
+            if fallos:
+                execute_values(
+                    cur,
+                    """
+                    UPDATE notificaciones_outbox o SET
+                        intentos = o.intentos + 1, ultimo_error = v.error, estado = v.estado,
+                        disponible_en = CURRENT_TIMESTAMP + make_interval(secs => v.espera),
+                        procesada_en = CASE WHEN v.estado = 'fallida' THEN CURRENT_TIMESTAMP END
+                    FROM (VALUES %s) AS v(id, error, estado, espera)
+                    WHERE o.id = v.id
+                    """,
+                    reintentos + fallidas,
+                    template="(%s, %s, %s, %s::DOUBLE PRECISION)"
+                )
+            conn.commit()
+        except psycopg2.Error:
+            if conn: conn.rollback()
+            raise
+        finally:
+            if conn:
+                conn.close()
+
+        ahora = datetime.now(timezone.utc)
+        latencias = [(ahora - n['programada_para']).total_seconds() * 1000 for n in enviadas]
+        duracion = reloj.monotonic() - inicio
+        with self._lock:
+            self.metricas['enviadas'] += len(enviadas)
+            self.metricas['reintentos'] += len(reintentos)
+            self.metricas['fallidas'] += len(fallidas)
+            self.metricas['canceladas'] += len(canceladas)
+            self.metricas['lotes'] += 1
+            self.metricas['latencia_total_ms'] += sum(latencias)
+            self.metricas['latencia_max_ms'] = max([self.metricas['latencia_max_ms']] + latencias)
+            self.metricas['ultimo_lote_por_segundo'] = round(len(filas) / duracion, 1) if duracion > 0 else None
+        for n, error in fallos:
+            current_app.logger.warning(f"Notificación {n['id']} ({n['canal']}) no entregada: {error!r}")
+        return len(filas)
+
+    def stats(self):
+        with self._lock:
+            metricas = dict(self.metricas)
+        segundos = reloj.monotonic() - self._inicio
+        metricas['enviadas_por_segundo'] = round(metricas['enviadas'] / segundos, 2) if segundos > 0 else None
+        if metricas['enviadas']:
+            metricas['latencia_media_ms'] = round(metricas['latencia_total_ms'] / metricas['enviadas'], 2)
+        return metricas
+
+    def detener(self):
+        self._detener.set()
+        self._despertar.set()
+
+    def ejecutar(self, una_vez=False):
+        """Procesa lotes hasta detener(); con una_vez=True termina cuando la cola queda vacía."""
+        app = current_app._get_current_object()
+        listener = None
+        if not una_vez:
+            listener = NotifyListener(
+                'outbox', _connect_kwargs(app.config), [CANAL_OUTBOX],
+                callback=lambda canal, carga: self._despertar.set(), logger=app.logger
+            ).start()
+        try:
+            while not self._detener.is_set():
+                self._despertar.clear()
+                try:
+                    procesadas = self.procesar_lote()
+                except psycopg2.Error as e:
+                    self._sumar(errores=1)
+                    app.logger.error(f"Error de BD en el worker de notificaciones: {e}")
+                    self._detener.wait(1.0)
+                    continue
+                if procesadas >= self.tamano_lote:
+                    continue
+                if una_vez:
+                    break
+                self._despertar.wait(self.espera_inactiva)
+        finally:
+            if listener is not None:
+                listener.stop()
+
+
+def get_metricas_outbox():
+    """Estado de la cola: filas por estado, retraso de las pendientes y envíos recientes."""
+    conn = None
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        cur.execute("SELECT estado, count(*) AS total FROM notificaciones_outbox GROUP BY estado")
+        por_estado = {fila['estado']: fila['total'] for fila in cur.fetchall()}
+        cur.execute("""
+            SELECT count(*) AS listas,
+                   extract(epoch FROM CURRENT_TIMESTAMP - min(disponible_en)) AS retraso_max_s
+            FROM notificaciones_outbox
+            WHERE estado = 'pendiente' AND disponible_en <= CURRENT_TIMESTAMP
+        """)
+        pendientes = cur.fetchone()
+        cur.execute("""
+            SELECT count(*) FILTER (WHERE procesada_en > CURRENT_TIMESTAMP - INTERVAL '1 minute' AND estado = 'enviada') AS ultimo_minuto,
+                   count(*) FILTER (WHERE estado = 'enviada') AS ultima_hora,
+                   count(*) FILTER (WHERE estado = 'fallida') AS fallidas_ultima_hora,
+                   avg(extract(epoch FROM procesada_en - programada_para)) FILTER (WHERE estado = 'enviada') AS latencia_media_s
+            FROM notificaciones_outbox
+            WHERE procesada_en > CURRENT_TIMESTAMP - INTERVAL '1 hour'
+        """)
+        recientes = cur.fetchone()
+        return {
+            'por_estado': {estado: por_estado.get(estado, 0) for estado in ('pendiente', 'enviada', 'fallida', 'cancelada')},
+            'pendientes_listas': pendientes['listas'],
+            'retraso_max_s': round(float(pendientes['retraso_max_s']), 3) if pendientes['retraso_max_s'] is not None else None,
+            'enviadas_ultimo_minuto': recientes['ultimo_minuto'],
+            'enviadas_ultima_hora': recientes['ultima_hora'],
+            'fallidas_ultima_hora': recientes['fallidas_ultima_hora'],
+            'latencia_media_s': round(float(recientes['latencia_media_s']), 3) if recientes['latencia_media_s'] is not None else None
+        }
+    except psycopg2.Error as e:
+        current_app.logger.error(f"Error de BD al obtener métricas de notificaciones: {e}")
+        raise
+    finally:
+        if conn:
+            conn.close()
+
+
+def get_notificaciones_fallidas(limit=50):
+    """Últimas notificaciones de la cola de fallidas, con su error."""
+    conn = None
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        cur.execute(
+            """
+            SELECT id, alerta_id, canal, programada_para, intentos, procesada_en, ultimo_error
+            FROM notificaciones_outbox WHERE estado = 'fallida'
+            ORDER BY procesada_en DESC, id DESC LIMIT %s
+            """,
+            (limit,)
+        )
+        return cur.fetchall()
+    finally:
+        if conn:
+            conn.close()
+
+
+def reintentar_notificaciones_fallidas(ids=None):
+    """Devuelve a la cola las notificaciones fallidas (todas o las de 'ids') con los intentos a cero."""
+    conn = None
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        filtro, params = ("AND id = ANY(%s)", (list(ids),)) if ids else ("", ())
+        cur.execute(
+            f"""
+            UPDATE notificaciones_outbox SET estado = 'pendiente', intentos = 0, procesada_en = NULL,
+                   disponible_en = CURRENT_TIMESTAMP
+            WHERE estado = 'fallida' {filtro}
+            """,
+            params
+        )
+        total = cur.rowcount
+        cur.execute("SELECT pg_notify(%s, '')", (CANAL_OUTBOX,))
+        conn.commit()
+        return total
+    except psycopg2.Error as e:
+        if conn: conn.rollback()
+        current_app.logger.error(f"Error de BD al reintentar notificaciones fallidas: {e}")
+        raise
+    finally:
+        if conn:
+            conn.close()
@@ -0,0 +1,282 @@
+# medialert/services/reminder_service.py
+
+import threading
+import time as reloj
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+from flask import current_app
+
+from database import get_db_connection, _connect_kwargs
+from services.notification_service import encolar_recordatorios
+from utils.db_listener import NotifyListener
+from utils.frecuencia import Frecuencia, TODOS_LOS_DIAS, proxima_toma
+from utils.scheduler import HeapScheduler
+
+# Canal de NOTIFY por el que el trigger de alertas avisa de cambios en su programación.
+CANAL_ALERTAS = 'medialert_alertas'
+
+_COLUMNAS_PROGRAMACION = """
+    id, frecuencia_intervalo_min, frecuencia_veces_dia, frecuencia_dias_semana, hora_preferida,
+    fecha_inicio, fecha_fin, ultima_notificacion_enviada, ultima_toma_encolada, proxima_toma
+"""
+
+
+class ReminderScheduler:
+    """
+    Programador de recordatorios de las alertas activas.
+
+    Guarda en un HeapScheduler la próxima toma de cada alerta (calculada con utils.frecuencia a
+    partir de la frecuencia estructurada, hora_preferida y fecha_inicio/fecha_fin) y duerme hasta
+    el próximo vencimiento. Al vencer, calcula la siguiente toma en memoria y entrega el lote a
+    al_vencer (por defecto encolar_recordatorios, que lo deja en la outbox para los workers de
+    notificaciones).
+
+    Solo se tienen en memoria las alertas que vencen dentro de 'ventana' segundos: se cargan con
+    un recorrido del índice de alertas.proxima_toma, por páginas y sin bloquear los disparos, y
+    la ventana se amplía por tramos a medida que avanza el tiempo. Los cambios posteriores llegan
+    por NOTIFY y solo se releen esas alertas. Tras cada (re)conexión del listener se recarga todo,
+    porque pudo perderse algún aviso; esa carga recupera las tomas vencidas en los últimos
+    'recuperacion' segundos que aún no constan como encoladas.
+
+    ejecutar() bloquea el hilo que la llama, que debe tener contexto de aplicación. Solo debe
+    haber un programador por base de datos (comando 'flask recordatorios'), o se duplicarían
+    los envíos.
+    """
+
+    def __init__(self, al_vencer=None, zona=None, tamano_pagina=5000, tamano_lote=1000,
+                 recuperacion=900, ventana=3600, espera_maxima=60.0):
+        self.al_vencer = al_vencer or encolar_recordatorios
+        self.zona = ZoneInfo(zona or current_app.config['RECORDATORIOS_ZONA_HORARIA'])
+        self.tamano_pagina = tamano_pagina
+        self.tamano_lote = tamano_lote
+        self.recuperacion = recuperacion
+        self.ventana = ventana
+        self.espera_maxima = espera_maxima
+        self._heap = HeapScheduler()
+        self._pautas = {}                 # alerta_id -> (Frecuencia, hora, fecha_inicio, fecha_fin)
+        self._lock = threading.Lock()
+        self._despertar = threading.Event()
+        self._detener = threading.Event()
+        self._pendientes = set()
+        self._recargar = False
+        self._horizonte = None            # epoch hasta el que se cargaron (o se están cargando) las alertas
+        self._carga = None                # tramo en curso: {'desde', 'hasta', 'despues'}
+        self._listener = None
+        self.metricas = {
+            'cargadas': 0, 'disparadas': 0, 'lotes': 0, 'errores': 0, 'recargas_completas': 0,
+            'tramos': 0, 'avisos': 0, 'retraso_max_ms': 0.0, 'retraso_total_ms': 0.0
+        }
+
+    # --- Avisos (hilo del listener) ---
+
+    def _al_notificar(self, canal, carga):
+        ids = {int(i) for i in carga.split(',') if i}
+        with self._lock:
+            self._pendientes |= ids
+            self.metricas['avisos'] += 1
+        self._despertar.set()
+
+    def _al_conectar(self):
+        with self._lock:
+            self._recargar = True
+            self._pendientes.clear()
+        self._despertar.set()
+
+    # --- Carga ---
+
+    def _programar(self, fila, despues_de):
+        if fila['frecuencia_intervalo_min'] is None:
+            self._descartar(fila['id'])
+            return
+        frecuencia = Frecuencia(fila['frecuencia_intervalo_min'], fila['frecuencia_veces_dia'],
+                                fila['frecuencia_dias_semana'] or TODOS_LOS_DIAS)
+        pauta = (frecuencia, fila['hora_preferida'], fila['fecha_inicio'], fila['fecha_fin'])
+        for marca in (fila['ultima_notificacion_enviada'], fila['ultima_toma_encolada']):
+            if marca is not None:
+                despues_de = max(despues_de, marca)
+        toma = proxima_toma(*pauta, despues_de, self.zona)
+        if toma is None:
+            self._descartar(fila['id'])
+            return
+        self._pautas[fila['id']] = pauta
+        self._heap.programar(fila['id'], toma.timestamp())
+
+    def _descartar(self, alerta_id):
+        self._pautas.pop(alerta_id, None)
+        self._heap.cancelar(alerta_id)
+
+    def _iniciar_carga(self, desde):
+        """Empieza a cargar las alertas con proxima_toma en [desde, ahora + ventana); desde=None incluye las vencidas."""
+        hasta = datetime.now(timezone.utc) + timedelta(seconds=self.ventana)
+        self._carga = {'desde': desde, 'hasta': hasta, 'despues': None}
+        self._horizonte = hasta.timestamp()
+
+    def _cargar_pagina(self):
+        """Carga la siguiente página del tramo en curso (orden proxima_toma, id)."""
+        carga = self._carga
+        condiciones, params = ["proxima_toma IS NOT NULL", "proxima_toma < %s"], [carga['hasta']]
+        if carga['desde'] is not None:
+            condiciones.append("proxima_toma >= %s")
+            params.append(carga['desde'])
+        if carga['despues'] is not None:
+            condiciones.append("(proxima_toma, id) > (%s, %s)")
+            params.extend(carga['despues'])
+        conn = None
+        try:
+            conn = get_db_connection()
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+            cur.execute(
+                f"SELECT {_COLUMNAS_PROGRAMACION} FROM alertas WHERE {' AND '.join(condiciones)} "
+                f"ORDER BY proxima_toma, id LIMIT %s",
+                params + [self.tamano_pagina]
+            )
+            filas = cur.fetchall()
+            conn.commit()
+        finally:
+            if conn:
+                conn.close()
+        desde = datetime.now(timezone.utc) - timedelta(seconds=self.recuperacion)
+        for fila in filas:
+            self._programar(fila, desde)
+        self.metricas['cargadas'] += len(filas)
+        if len(filas) < self.tamano_pagina:
+            self._carga = None
+        else:
+            carga['despues'] = (filas[-1]['proxima_toma'], filas[-1]['id'])
+
+    def _recargar_alertas(self, ids):
+        """Relee las alertas anunciadas por NOTIFY; las que ya no tienen próxima toma se quitan."""
+        conn = None
+        try:
+            conn = get_db_connection()
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+            cur.execute(
+                f"SELECT {_COLUMNAS_PROGRAMACION} FROM alertas WHERE proxima_toma IS NOT NULL AND id = ANY(%s)",
+                (list(ids),)
+            )
+            filas = cur.fetchall()
+            conn.commit()
+        finally:
+            if conn:
+                conn.close()
+        # Un cambio no dispara la toma que acaba de pasar: se programa a partir de ahora.
+        ahora = datetime.now(timezone.utc)
+        for alerta_id in ids - {fila['id'] for fila in filas}:
+            self._descartar(alerta_id)
+        for fila in filas:
+            self._programar(fila, ahora)
+
+    # --- Disparo ---
+
+    def _disparar(self, vencidos):
+        ahora = datetime.now(timezone.utc)
+        lote, siguientes = [], []
+        for alerta_id, vence_en in vencidos:
+            pauta = self._pautas.get(alerta_id)
+            if pauta is None:
+                continue
+            programada = datetime.fromtimestamp(vence_en, timezone.utc)
+            lote.append({'alerta_id': alerta_id, 'programada_para': programada})
+            retraso_ms = (ahora - programada).total_seconds() * 1000
+            self.metricas['retraso_max_ms'] = max(self.metricas['retraso_max_ms'], retraso_ms)
+            self.metricas['retraso_total_ms'] += retraso_ms
+            # Si el programador se retrasó más de un intervalo, no se acumulan tomas atrasadas.
+            siguientes.append((alerta_id, proxima_toma(*pauta, max(programada, ahora), self.zona)))
+        if not lote:
+            return
+        entregado = True
+        try:
+            self.al_vencer(lote)
+        except Exception as e:
+            entregado = False
+            self.metricas['errores'] += 1
+            current_app.logger.error(f"Error al entregar {len(lote)} recordatorios: {e!r}")
+        self.metricas['disparadas'] += len(lote)
+        self.metricas['lotes'] += 1
+        # Las tomas que caen fuera de la ventana se sueltan: al encolar la toma el trigger guardó
+        # la siguiente en proxima_toma y un tramo posterior la volverá a cargar. Si la entrega
+        # falló la BD no cambió, así que se conservan en memoria.
+        for alerta_id, siguiente in siguientes:
+            if siguiente is None:
+                self._pautas.pop(alerta_id, None)
+            elif entregado and siguiente.timestamp() >= self._horizonte:
+                self._pautas.pop(alerta_id, None)
+            else:
+                self._heap.programar(alerta_id, siguiente.timestamp())
+
+    # --- Ciclo principal ---
+
+    def stats(self):
+        with self._lock:
+            metricas = dict(self.metricas)
+        metricas['en_memoria'] = len(self._heap)
+        metricas['cargando'] = self._carga is not None
+        metricas['horizonte'] = datetime.fromtimestamp(self._horizonte, timezone.utc).isoformat() if self._horizonte else None
+        proximo = self._heap.proximo()
+        metricas['proximo'] = datetime.fromtimestamp(proximo, timezone.utc).isoformat() if proximo else None
+        if metricas['disparadas']:
+            metricas['retraso_medio_ms'] = round(metricas['retraso_total_ms'] / metricas['disparadas'], 2)
+        return metricas
+
+    def detener(self):
+        self._detener.set()
+        self._despertar.set()
+
+    def ejecutar(self):
+        app = current_app._get_current_object()
+        self._listener = NotifyListener(
+            'recordatorios', _connect_kwargs(app.config), [CANAL_ALERTAS],
+            callback=self._al_notificar, on_connect=self._al_conectar, logger=app.logger
+        ).start()
+        # La ventana se amplía cuando le queda menos de tres cuartos por delante.
+        ampliar_cada = self.ventana / 4
+        try:
+            while not self._detener.is_set():
+                self._despertar.clear()
+                with self._lock:
+                    recargar, self._recargar = self._recargar, False
+                    pendientes, self._pendientes = self._pendientes, set()
+                try:
+                    if recargar:
+                        self._heap.limpiar()
+                        self._pautas.clear()
+                        self._iniciar_carga(None)
+                        self.metricas['recargas_completas'] += 1
+                    elif pendientes:
+                        self._recargar_alertas(pendientes)
+                    if (self._carga is None and self._horizonte is not None
+                            and self._horizonte - reloj.time() <= self.ventana - ampliar_cada):
+                        self._iniciar_carga(datetime.fromtimestamp(self._horizonte, timezone.utc))
+                        self.metricas['tramos'] += 1
+                    if self._carga is not None:
+                        self._cargar_pagina()
+                except psycopg2.Error as e:
+                    # Se reintenta en el siguiente ciclo; los avisos no procesados se conservan.
+                    self.metricas['errores'] += 1
+                    app.logger.error(f"Error de BD en el programador de recordatorios: {e}")
+                    with self._lock:
+                        self._pendientes |= pendientes
+                    self._detener.wait(1.0)
+
+                while True:
+                    vencidos = self._heap.extraer_vencidos(reloj.time(), self.tamano_lote)
+                    if not vencidos:
+                        break
+                    self._disparar(vencidos)
+
+                if self._carga is not None:
+                    continue
+                esperas = [self.espera_maxima]
+                proximo = self._heap.proximo()
+                if proximo is not None:
+                    esperas.append(proximo - reloj.time())
+                if self._horizonte is not None:
+                    esperas.append(self._horizonte - (self.ventana - ampliar_cada) - reloj.time())
+                espera = min(esperas)
+                if espera > 0:
+                    self._despertar.wait(espera)
+        finally:
+            self._listener.stop()
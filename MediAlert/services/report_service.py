@@ -6,9 +6,10 @@ from flask import current_app, session
 import os
 import uuid
 from werkzeug.utils import secure_filename
-from datetime import datetime
+from datetime import datetime, timedelta
 
-from database import get_db_connection
+from database import get_db_connection, get_dedicated_db_connection, get_audit_writer, fetch_rows_as_json, solo_lectura
+from utils.paginacion import decodificar_cursor
 import config # Importar el módulo config para allowed_file y rutas
 
 def log_report_generation(tipo_reporte, nombre_reporte, pdf_filename):
@@ -41,6 +42,7 @@ def log_report_generation(tipo_reporte, nombre_reporte, pdf_filename):
         if conn:
             conn.close()
 
+@solo_lectura
 def get_report_logs(limit=50):
     """Obtiene el historial de reportes generados."""
     conn = None
@@ -114,65 +116,124 @@ def get_pdf_file_info(log_id):
         if conn:
             conn.close()
 
-def get_all_active_consolidated_recipes():
-    """Obtiene todas las alertas activas de todos los clientes para un reporte consolidado de admin."""
+_SQL_RECETAS_CONSOLIDADAS = """
+    SELECT
+        a.id as alerta_id, a.dosis, a.frecuencia, a.fecha_inicio, a.fecha_fin, a.hora_preferida, a.estado as estado_alerta,
+        u.nombre as cliente_nombre, u.cedula as cliente_cedula, u.fecha_nacimiento as cliente_fecha_nacimiento,
+        u.telefono as cliente_telefono, u.ciudad as cliente_ciudad,
+        m.nombre as medicamento_nombre, m.descripcion as medicamento_descripcion, m.composicion as medicamento_composicion,
+        m.indicaciones as medicamento_indicaciones, m.sintomas_secundarios as medicamento_sintomas_secundarios,
+        m.rango_edad as medicamento_rango_edad,
+        e.nombre as eps_nombre, e.nit as eps_nit,
+        ap.nombre as asignador_nombre, ap.cedula as asignador_cedula, ap.rol as asignador_rol
+    FROM alertas a
+    JOIN medicamentos m ON a.medicamento_id = m.id
+    JOIN usuarios u ON a.usuario_id = u.id
+    LEFT JOIN eps e ON u.eps_id = e.id
+    LEFT JOIN usuarios ap ON a.asignado_por_usuario_id = ap.id
+    WHERE a.estado = 'activa' AND m.estado_medicamento = 'disponible' AND u.rol = 'cliente'
+    ORDER BY u.nombre, m.nombre
+"""
+
+@solo_lectura
+def get_all_active_consolidated_recipes_json():
+    """
+    Todas las alertas activas de todos los clientes para la receta consolidada del admin, como
+    texto JSON (un arreglo) generado por PostgreSQL.
+    """
     conn = None
     try:
         conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-
-        cur.execute("""
-            SELECT
-                a.id as alerta_id, a.dosis, a.frecuencia, a.fecha_inicio, a.fecha_fin, a.hora_preferida, a.estado as estado_alerta,
-                u.nombre as cliente_nombre, u.cedula as cliente_cedula, u.fecha_nacimiento as cliente_fecha_nacimiento,
-                u.telefono as cliente_telefono, u.ciudad as cliente_ciudad,
-                m.nombre as medicamento_nombre, m.descripcion as medicamento_descripcion, m.composicion as medicamento_composicion,
-                m.indicaciones as medicamento_indicaciones, m.sintomas_secundarios as medicamento_sintomas_secundarios,
-                m.rango_edad as medicamento_rango_edad,
-                e.nombre as eps_nombre, e.nit as eps_nit,
-                ap.nombre as asignador_nombre, ap.cedula as asignador_cedula, ap.rol as asignador_rol
-            FROM alertas a
-            JOIN medicamentos m ON a.medicamento_id = m.id
-            JOIN usuarios u ON a.usuario_id = u.id
-            LEFT JOIN eps e ON u.eps_id = e.id
-            LEFT JOIN usuarios ap ON a.asignado_por_usuario_id = ap.id
-            WHERE a.estado = 'activa' AND m.estado_medicamento = 'disponible' AND u.rol = 'cliente'
-            ORDER BY u.nombre, m.nombre;
-        """)
-        recetas_data = cur.fetchall()
-
-        for receta in recetas_data:
-            if receta.get('fecha_inicio'):
-                receta['fecha_inicio'] = receta['fecha_inicio'].isoformat()
-            if receta.get('fecha_fin'):
-                receta['fecha_fin'] = receta['fecha_fin'].isoformat()
-            if receta.get('hora_preferida'):
-                receta['hora_preferida'] = str(receta['hora_preferida'])
-            if receta.get('cliente_fecha_nacimiento'):
-                receta['cliente_fecha_nacimiento'] = receta['cliente_fecha_nacimiento'].isoformat()
-
-        return recetas_data
+        return fetch_rows_as_json(conn, _SQL_RECETAS_CONSOLIDADAS)
     except psycopg2.Error as e:
         current_app.logger.error(f"Error de BD al obtener recetas consolidadas para admin: {e}")
         raise
     finally:
         if conn:
             conn.close()
-            
-def get_audit_logs(limit=100, tabla_filtro=None, user_search_term=None):
-    """Obtiene el historial de auditoría del sistema con filtros."""
+
+def iter_active_consolidated_recipes_json(tamano_lote=500):
+    """
+    Generador con las mismas filas que get_all_active_consolidated_recipes_json, cada una como
+    texto JSON, leídas con un cursor de servidor (con nombre) en lotes de 'tamano_lote': la
+    memoria usada no depende del número de alertas activas. Usa una conexión dedicada porque
+    se consume mientras se envía la respuesta, cuando la transacción de la petición ya terminó.
+    """
+    conn = get_dedicated_db_connection(solo_lectura=True)
+    try:
+        cur = conn.cursor(name='recetas_consolidadas')
+        cur.itersize = tamano_lote
+        cur.execute(f"SELECT row_to_json(q)::text FROM ({_SQL_RECETAS_CONSOLIDADAS}) q")
+        for (receta,) in cur:
+            yield receta
+        cur.close()
+    except psycopg2.Error as e:
+        current_app.logger.error(f"Error de BD al exportar recetas consolidadas: {e}")
+        raise
+    finally:
+        # Al devolverla, el pool revierte la transacción y con ella el cursor de servidor.
+        conn.close()
+
+def _parse_fecha_filtro(valor, nombre):
+    try:
+        return datetime.fromisoformat(valor)
+    except ValueError:
+        raise ValueError(f'Formato de fecha no válido para "{nombre}": use AAAA-MM-DD o AAAA-MM-DDTHH:MM.')
+
+_COLUMNAS_AUDITORIA_BASE = """
+    aud.id, aud.fecha_hora, u_app.nombre as nombre_usuario_app,
+    u_app.cedula as cedula_usuario_app,
+    aud.usuario_db as usuario_postgres, aud.accion, aud.tabla_afectada,
+    aud.registro_id_afectado, aud.operacion
+"""
+
+VISTAS_AUDITORIA = {
+    # El trigger genérico guarda filas completas de usuarios: el hash de la contraseña no sale
+    # de la BD (como en fn_reconstruir_snapshot_auditoria).
+    'completa': _COLUMNAS_AUDITORIA_BASE + """,
+        aud.datos_anteriores - 'contrasena' AS datos_anteriores,
+        aud.datos_nuevos - 'contrasena' AS datos_nuevos,
+        aud.detalles_adicionales
+    """,
+    # Los nombres de campos modificados se calculan en el servidor; el JSONB no sale de la BD.
+    'resumen': _COLUMNAS_AUDITORIA_BASE + """,
+        CASE
+            WHEN aud.datos_anteriores IS NOT NULL AND aud.datos_nuevos IS NOT NULL THEN
+                ARRAY(SELECT k FROM jsonb_object_keys(aud.datos_nuevos) AS k
+                      WHERE aud.datos_nuevos -> k IS DISTINCT FROM aud.datos_anteriores -> k
+                      ORDER BY k)
+        END AS campos_modificados,
+        aud.detalles_adicionales IS NOT NULL AS tiene_detalles
+    """,
+}
+
+@solo_lectura
+def get_audit_logs(limit=100, tabla_filtro=None, user_search_term=None, fecha_desde=None, fecha_hasta=None,
+                   accion_filtro=None, registro_id_filtro=None, cursor=None, vista='completa'):
+    """
+    Obtiene el historial de auditoría del sistema con filtros, del más reciente al más antiguo.
+    Con vista='resumen' no se leen las instantáneas JSONB: cada fila trae solo los nombres de
+    los campos modificados, y el contenido completo se pide con get_audit_log_detail.
+    Con fecha_desde/fecha_hasta (ISO, 'hasta' inclusivo si es solo fecha) PostgreSQL solo
+    recorre las particiones mensuales de ese rango.
+    La paginación es por conjunto de claves sobre (fecha_hora, id): 'cursor' es el valor
+    devuelto para la página anterior, de modo que cualquier página cuesta lo mismo que la primera.
+    """
+    if vista not in VISTAS_AUDITORIA:
+        raise ValueError(f'Vista de auditoría no válida: use {", ".join(VISTAS_AUDITORIA)}.')
+    posicion = decodificar_cursor(cursor, (datetime, int)) if cursor else None
+    desde = _parse_fecha_filtro(fecha_desde, 'desde') if fecha_desde else None
+    hasta = _parse_fecha_filtro(fecha_hasta, 'hasta') if fecha_hasta else None
+    if hasta and len(fecha_hasta) == 10:
+        hasta += timedelta(days=1)
+
     conn = None
     try:
         conn = get_db_connection()
         cur = conn.cursor(cursor_factory=RealDictCursor)
 
-        query_parts = ["""
-            SELECT
-                aud.id, aud.fecha_hora, u_app.nombre as nombre_usuario_app,
-                u_app.cedula as cedula_usuario_app,
-                aud.usuario_db as usuario_postgres, aud.accion, aud.tabla_afectada,
-                aud.registro_id_afectado, aud.datos_anteriores, aud.datos_nuevos,
-                aud.detalles_adicionales
+        query_parts = [f"""
+            SELECT {VISTAS_AUDITORIA[vista]}
             FROM auditoria aud
             LEFT JOIN usuarios u_app ON aud.usuario_id_app = u_app.id
         """]
@@ -183,15 +244,37 @@ def get_audit_logs(limit=100, tabla_filtro=None, user_search_term=None):
             conditions.append("aud.tabla_afectada = %s")
             params.append(tabla_filtro)
 
+        if accion_filtro:
+            conditions.append("aud.accion = %s")
+            params.append(accion_filtro)
+
+        if registro_id_filtro:
+            conditions.append("aud.registro_id_afectado = %s")
+            params.append(str(registro_id_filtro))
+
+        if desde:
+            conditions.append("aud.fecha_hora >= %s")
+            params.append(desde)
+
+        if hasta:
+            conditions.append("aud.fecha_hora < %s" if len(fecha_hasta) == 10 else "aud.fecha_hora <= %s")
+            params.append(hasta)
+
         if user_search_term:
-            conditions.append("(u_app.nombre ILIKE %s OR u_app.cedula ILIKE %s)")
+            # Se resuelven primero los usuarios (índices de trigramas) y después se usa
+            # idx_auditoria_usuario_fecha_hora, en lugar de unir toda la auditoría con usuarios.
+            conditions.append("aud.usuario_id_app IN (SELECT id FROM usuarios WHERE nombre ILIKE %s OR cedula ILIKE %s)")
             params.append(f"%{user_search_term}%")
             params.append(f"%{user_search_term}%")
 
+        if posicion:
+            conditions.append("(aud.fecha_hora, aud.id) < (%s, %s)")
+            params.extend(posicion)
+
         if conditions:
             query_parts.append("WHERE " + " AND ".join(conditions))
 
-        query_parts.append("ORDER BY aud.fecha_hora DESC")
+        query_parts.append("ORDER BY aud.fecha_hora DESC, aud.id DESC")
 
         if limit:
             query_parts.append("LIMIT %s")
@@ -206,4 +289,52 @@ def get_audit_logs(limit=100, tabla_filtro=None, user_search_term=None):
         raise
     finally:
         if conn:
-            conn.close()
\ No newline at end of file
+            conn.close()
+
+@solo_lectura
+def get_audit_log_detail(audit_id):
+    """Obtiene una entrada de auditoría con sus instantáneas JSONB completas, o None si no existe."""
+    conn = None
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        cur.execute(f"""
+            SELECT {VISTAS_AUDITORIA['completa']}
+            FROM auditoria aud
+            LEFT JOIN usuarios u_app ON aud.usuario_id_app = u_app.id
+            WHERE aud.id = %s
+        """, (audit_id,))
+        return cur.fetchone()
+    except psycopg2.Error as e:
+        current_app.logger.error(f"Error de BD al obtener detalle de auditoría {audit_id}: {e}")
+        raise
+    finally:
+        if conn:
+            conn.close()
+
+@solo_lectura
+def get_audit_log_snapshot(audit_id):
+    """
+    Devuelve las filas completas antes/después de una entrada de auditoría. Las entradas UPDATE
+    del trigger solo guardan las columnas modificadas; la BD rehace el resto a partir del
+    estado actual del registro. Retorna None si la entrada no existe.
+    """
+    conn = None
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        cur.execute("SELECT * FROM fn_reconstruir_snapshot_auditoria(%s);", (audit_id,))
+        return cur.fetchone()
+    except psycopg2.Error as e:
+        current_app.logger.error(f"Error de BD al reconstruir auditoría {audit_id}: {e}")
+        raise
+    finally:
+        if conn:
+            conn.close()
+
+def get_audit_writer_metrics():
+    """Devuelve las métricas del escritor de auditoría asíncrono (profundidad de cola, latencias)."""
+    writer = get_audit_writer()
+    if writer is None:
+        return {'habilitado': False}
+    return {'habilitado': True, **writer.metrics()}
@@ -0,0 +1,90 @@
+# medialert/services/search_service.py
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+from flask import current_app
+
+from database import get_db_connection, solo_lectura
+
+BUSQUEDA_LIMITE_MAXIMO = 50
+# Por debajo de 3 caracteres no hay trigramas útiles: solo se buscan prefijos.
+_MIN_CARACTERES_TRIGRAMA = 3
+
+_COLUMNAS_BUSQUEDA = "u.id, u.nombre, u.cedula, u.email, u.rol, u.estado_usuario"
+
+def _escapar_like(texto):
+    return texto.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def pg_trgm_disponible():
+    """Indica si la extensión pg_trgm está instalada en la BD (se consulta una vez por proceso)."""
+    disponible = current_app.extensions.get('medialert_pg_trgm')
+    if disponible is None:
+        conn = get_db_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm');")
+            disponible = cur.fetchone()[0]
+        finally:
+            conn.close()
+        current_app.extensions['medialert_pg_trgm'] = disponible
+    return disponible
+
+@solo_lectura
+def buscar_clientes(termino, limit=10, rol='cliente', estado=None):
+    """
+    Búsqueda tipo 'typeahead' de usuarios por nombre o cédula, ordenada por relevancia:
+    cédula exacta, prefijo de cédula, prefijo de nombre y, con pg_trgm, similitud del nombre.
+    """
+    termino = (termino or '').strip()
+    if not termino:
+        return []
+    limit = max(1, min(int(limit), BUSQUEDA_LIMITE_MAXIMO))
+    patron = _escapar_like(termino)
+
+    filtros, params_filtro = [], []
+    if rol:
+        filtros.append("u.rol = %s")
+        params_filtro.append(rol)
+    if estado and estado != 'todos':
+        filtros.append("u.estado_usuario = %s")
+        params_filtro.append(estado)
+
+    usar_trigramas = len(termino) >= _MIN_CARACTERES_TRIGRAMA and pg_trgm_disponible()
+    if termino.isdigit():
+        # Camino rápido: la cédula se teclea desde el principio; el índice de prefijo basta.
+        coincidencia = "u.cedula LIKE %s"
+        params_coincidencia = [f"{patron}%"]
+        if usar_trigramas:
+            coincidencia = "(u.cedula LIKE %s OR u.cedula LIKE %s)"
+            params_coincidencia.append(f"%{patron}%")
+        orden = "(u.cedula = %s) DESC, (u.cedula LIKE %s) DESC, length(u.cedula), u.cedula"
+        params_orden = [termino, f"{patron}%"]
+    elif usar_trigramas:
+        # 'nombre %% q' (similitud) tolera errores de tecleo; ILIKE cubre subcadenas exactas.
+        coincidencia = "(u.nombre ILIKE %s OR u.nombre %% %s)"
+        params_coincidencia = [f"%{patron}%", termino]
+        orden = "(lower(u.nombre) LIKE lower(%s)) DESC, similarity(u.nombre, %s) DESC, u.nombre"
+        params_orden = [f"{patron}%", termino]
+    else:
+        coincidencia = "(lower(u.nombre) LIKE lower(%s) OR u.nombre ILIKE %s)"
+        params_coincidencia = [f"{patron}%", f"% {patron}%"]
+        orden = "(lower(u.nombre) LIKE lower(%s)) DESC, u.nombre"
+        params_orden = [f"{patron}%"]
+
+    condiciones = [coincidencia] + filtros
+    query = (f"SELECT {_COLUMNAS_BUSQUEDA} FROM usuarios u WHERE {' AND '.join(condiciones)} "
+             f"ORDER BY {orden} LIMIT %s")
+    params = params_coincidencia + params_filtro + params_orden + [limit]
+
+    conn = None
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        cur.execute(query, tuple(params))
+        return cur.fetchall()
+    except psycopg2.Error as e:
+        current_app.logger.error(f"Error de BD al buscar usuarios: {e}")
+        raise
+    finally:
+        if conn:
+            conn.close()
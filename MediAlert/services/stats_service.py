@@ -0,0 +1,122 @@
+# medialert/services/stats_service.py
+
+from datetime import date, timedelta
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+from flask import current_app
+
+from database import get_db_connection, solo_lectura
+
+ESTADISTICAS_DIAS_MAXIMO = 366
+
+@solo_lectura
+def get_estadisticas(dias=30):
+    """
+    Estadísticas del panel de administración leídas de estadisticas_rollup (conteos que los
+    triggers mantienen al día). Solo se leen las filas de resumen y los catálogos para los
+    nombres: el costo no depende del número de alertas ni de clientes.
+    """
+    dias = max(1, min(int(dias), ESTADISTICAS_DIAS_MAXIMO))
+    desde = (date.today() - timedelta(days=dias - 1)).isoformat()
+    conn = None
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+
+        cur.execute("""
+            SELECT clave AS estado, total FROM estadisticas_rollup
+            WHERE dimension = 'alertas_estado' AND total <> 0 ORDER BY clave;
+        """)
+        por_estado = {fila['estado']: fila['total'] for fila in cur.fetchall()}
+
+        cur.execute("""
+            SELECT m.id AS medicamento_id, m.nombre, m.estado_medicamento, r.total, r.activas
+            FROM estadisticas_rollup r
+            JOIN medicamentos m ON m.id = r.clave::INTEGER
+            WHERE r.dimension = 'alertas_medicamento' AND r.total <> 0
+            ORDER BY r.total DESC, m.nombre;
+        """)
+        por_medicamento = cur.fetchall()
+
+        cur.execute("""
+            SELECT e.id AS eps_id, e.nombre, r.total, r.activas
+            FROM estadisticas_rollup r
+            LEFT JOIN eps e ON e.id = NULLIF(r.clave, '')::INTEGER
+            WHERE r.dimension = 'alertas_eps' AND r.total <> 0
+            ORDER BY r.total DESC, e.nombre;
+        """)
+        por_eps = cur.fetchall()
+
+        cur.execute("""
+            SELECT NULLIF(clave, '') AS ciudad, total, activas
+            FROM estadisticas_rollup
+            WHERE dimension = 'alertas_ciudad' AND total <> 0
+            ORDER BY total DESC, clave;
+        """)
+        por_ciudad = cur.fetchall()
+
+        # Las claves son fechas ISO: el orden de texto es el cronológico.
+        cur.execute("""
+            SELECT clave AS fecha, total AS nuevos, activas AS activos
+            FROM estadisticas_rollup
+            WHERE dimension = 'clientes_registro_dia' AND clave >= %s AND total <> 0
+            ORDER BY clave;
+        """, (desde,))
+        clientes_por_dia = cur.fetchall()
+
+        discontinuados = [m for m in por_medicamento if m['estado_medicamento'] == 'discontinuado']
+        return {
+            'alertas_por_estado': por_estado,
+            'alertas_total': sum(por_estado.values()),
+            'alertas_por_medicamento': por_medicamento,
+            'alertas_por_eps': por_eps,
+            'alertas_por_ciudad': por_ciudad,
+            'clientes_nuevos_por_dia': {
+                'desde': desde,
+                'dias': clientes_por_dia,
+                'total': sum(fila['nuevos'] for fila in clientes_por_dia)
+            },
+            'impacto_medicamentos_discontinuados': {
+                'medicamentos': discontinuados,
+                'alertas_total': sum(m['total'] for m in discontinuados),
+                'alertas_activas': sum(m['activas'] for m in discontinuados)
+            }
+        }
+    except psycopg2.Error as e:
+        current_app.logger.error(f"Error de BD al obtener estadísticas: {e}")
+        raise
+    finally:
+        if conn:
+            conn.close()
+
+def verificar_estadisticas(reparar=False):
+    """
+    Compara estadisticas_rollup con vista_estadisticas (conteos en vivo) y devuelve las claves
+    que difieren como 'dimension:clave'. Con reparar=True recalcula toda la tabla.
+    """
+    conn = None
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT COALESCE(v.dimension, r.dimension) || ':' || COALESCE(v.clave, r.clave)
+            FROM vista_estadisticas v
+            FULL JOIN estadisticas_rollup r ON r.dimension = v.dimension AND r.clave = v.clave
+            WHERE (COALESCE(v.total, 0), COALESCE(v.activas, 0))
+                  IS DISTINCT FROM (COALESCE(r.total, 0), COALESCE(r.activas, 0))
+            ORDER BY 1;
+        """)
+        resultado = {'diferentes': [fila[0] for fila in cur.fetchall()], 'reparadas': 0}
+        if reparar and resultado['diferentes']:
+            cur.execute("SELECT fn_recalcular_estadisticas();")
+            resultado['reparadas'] = cur.fetchone()[0]
+            conn.commit()
+        return resultado
+    except psycopg2.Error as e:
+        if conn: conn.rollback()
+        current_app.logger.error(f"Error de BD al verificar estadísticas: {e}")
+        raise
+    finally:
+        if conn:
+            conn.close()
@@ -5,39 +5,123 @@ from werkzeug.security import generate_password_hash
 from datetime import datetime, date
 from flask import current_app
 # La importación ahora es más simple
-from database import get_db_connection, registrar_auditoria_aplicacion
+from database import (
+    get_db_connection, registrar_auditoria_aplicacion, establecer_contexto_auditoria, solo_lectura,
+    obtener_catalogo, contar_filas
+)
+from utils.paginacion import condicion_keyset, decodificar_cursor_orden, normalizar_limite
+
+# Columnas que puede pedir el listado de usuarios (fields=); las de eps_nombre requieren el join con eps.
+CAMPOS_USUARIOS = {
+    'id': 'u.id', 'nombre': 'u.nombre', 'cedula': 'u.cedula', 'email': 'u.email', 'rol': 'u.rol',
+    'estado_usuario': 'u.estado_usuario', 'fecha_nacimiento': 'u.fecha_nacimiento', 'telefono': 'u.telefono',
+    'ciudad': 'u.ciudad', 'genero': 'u.genero', 'tipo_regimen': 'u.tipo_regimen',
+    'fecha_registro': 'u.fecha_registro', 'eps_id': 'u.eps_id', 'eps_nombre': 'e.nombre'
+}
+
+# Columnas de get_user_by_id según el uso: 'perfil' para la configuración del propio usuario,
+# 'admin' para el detalle que edita el administrador y 'auditoria' para datos_anteriores del log.
+# La contraseña (hash) no está en CAMPOS_USUARIOS y por tanto en ninguna proyección.
+PROYECCIONES_USUARIO = {
+    'perfil': ('id', 'nombre', 'email', 'rol'),
+    'admin': ('id', 'nombre', 'cedula', 'email', 'rol', 'estado_usuario', 'fecha_nacimiento', 'telefono',
+              'ciudad', 'genero', 'tipo_regimen', 'fecha_registro', 'eps_id', 'eps_nombre'),
+    'auditoria': ('id', 'nombre', 'cedula', 'email', 'rol', 'estado_usuario', 'fecha_nacimiento', 'telefono',
+                  'ciudad', 'genero', 'tipo_regimen', 'fecha_registro', 'eps_id'),
+}
+
+# Órdenes de la paginación: (descendente, ((columna, campo, tipo), ...)). Todas terminan en el id
+# para que el orden sea total, y tienen un índice (rol, ...) porque el listado filtra por rol.
+ORDENES_USUARIOS = {
+    'rol_nombre': (False, (('u.rol', 'rol', str), ('u.nombre', 'nombre', str), ('u.id', 'id', int))),
+    'cedula': (False, (('u.cedula', 'cedula', str), ('u.id', 'id', int))),
+    'recientes': (True, (('u.id', 'id', int),)),
+}
+
+def _filtros_usuarios(estado_filtro, rol_filtro, search_query):
+    conditions, params = [], []
+    if rol_filtro:
+        conditions.append("u.rol = %s")
+        params.append(rol_filtro)
+    if estado_filtro and estado_filtro != 'todos':
+        conditions.append("u.estado_usuario = %s")
+        params.append(estado_filtro)
+    if search_query:
+        conditions.append("(u.nombre ILIKE %s OR u.cedula ILIKE %s)")
+        params.extend([f"%{search_query}%", f"%{search_query}%"])
+    return conditions, params
+
+@solo_lectura
+def get_users(estado_filtro=None, rol_filtro=None, search_query=None,
+              limit=None, cursor=None, orden=None, campos=None):
+    """
+    Lista usuarios. Sin limit ni cursor devuelve todas las filas, como siempre.
+    Con limit o cursor pagina por conjunto de claves (ver utils/paginacion.py) según 'orden'
+    (ORDENES_USUARIOS, por defecto 'rol_nombre'); 'cursor' es el que devolvió la página anterior.
+    'campos' limita las columnas (CAMPOS_USUARIOS); las claves del orden se incluyen siempre.
+    """
+    orden = orden or 'rol_nombre'
+    if orden not in ORDENES_USUARIOS:
+        raise ValueError(f"Orden no válido: use {', '.join(ORDENES_USUARIOS)}.")
+    descendente, claves = ORDENES_USUARIOS[orden]
+    limit = normalizar_limite(limit, cursor)
+    posicion = decodificar_cursor_orden(cursor, orden, [tipo for _, _, tipo in claves]) if cursor else None
+
+    campos = list(campos or CAMPOS_USUARIOS)
+    campos += [campo for _, campo, _ in claves if campo not in campos]
+    columnas = ", ".join(f"{CAMPOS_USUARIOS[c]} AS {c}" for c in campos)
+    join_eps = " LEFT JOIN eps e ON u.eps_id = e.id" if 'eps_nombre' in campos else ""
+
+    conditions, params = _filtros_usuarios(estado_filtro, rol_filtro, search_query)
+    if posicion:
+        conditions.append(condicion_keyset([col for col, _, _ in claves], descendente))
+        params.extend(posicion)
+
+    query_parts = [f"SELECT {columnas} FROM usuarios u{join_eps}"]
+    if conditions:
+        query_parts.append("WHERE " + " AND ".join(conditions))
+    direccion = " DESC" if descendente else ""
+    query_parts.append("ORDER BY " + ", ".join(col + direccion for col, _, _ in claves))
+    if limit:
+        query_parts.append("LIMIT %s")
+        params.append(limit)
 
-# (Las funciones get_users y get_user_by_id no cambian)
-def get_users(estado_filtro=None, rol_filtro=None, search_query=None):
     conn = None
     try:
         conn = get_db_connection()
         cur = conn.cursor(cursor_factory=RealDictCursor)
-        query_parts = ["SELECT u.id, u.nombre, u.cedula, u.email, u.rol, u.estado_usuario, u.fecha_nacimiento, u.telefono, u.ciudad, u.genero, u.tipo_regimen, u.fecha_registro, u.eps_id, e.nombre as eps_nombre FROM usuarios u LEFT JOIN eps e ON u.eps_id = e.id"]
-        conditions, params = [], []
-        if rol_filtro:
-            conditions.append("u.rol = %s")
-            params.append(rol_filtro)
-        if estado_filtro and estado_filtro != 'todos':
-            conditions.append("u.estado_usuario = %s")
-            params.append(estado_filtro)
-        if search_query:
-            conditions.append("(u.nombre ILIKE %s OR u.cedula ILIKE %s)")
-            params.extend([f"%{search_query}%", f"%{search_query}%"])
-        if conditions:
-            query_parts.append("WHERE " + " AND ".join(conditions))
-        query_parts.append("ORDER BY u.rol, u.nombre")
         cur.execute(" ".join(query_parts), tuple(params))
         return cur.fetchall()
     finally:
         if conn: conn.close()
 
-def get_user_by_id(uid):
+@solo_lectura
+def contar_usuarios(estado_filtro=None, rol_filtro=None, search_query=None, exacto=False):
+    """Total de usuarios con los filtros de get_users: estimado por el planificador o exacto."""
+    conditions, params = _filtros_usuarios(estado_filtro, rol_filtro, search_query)
+    query = "SELECT u.id FROM usuarios u" + (" WHERE " + " AND ".join(conditions) if conditions else "")
+    conn = None
+    try:
+        conn = get_db_connection()
+        return contar_filas(conn, query, tuple(params), exacto)
+    finally:
+        if conn: conn.close()
+
+def get_user_by_id(uid, proyeccion='admin'):
+    """
+    Devuelve el usuario con las columnas de la proyección pedida (ver PROYECCIONES_USUARIO), o
+    None si no existe. Ninguna proyección incluye el hash de la contraseña.
+    """
+    if proyeccion not in PROYECCIONES_USUARIO:
+        raise ValueError(f"Proyección de usuario no válida: '{proyeccion}'.")
+    campos = PROYECCIONES_USUARIO[proyeccion]
+    columnas = ', '.join(f"{CAMPOS_USUARIOS[c]} AS {c}" for c in campos)
+    join_eps = " LEFT JOIN eps e ON u.eps_id = e.id" if 'eps_nombre' in campos else ""
     conn = None
     try:
         conn = get_db_connection()
         cur = conn.cursor(cursor_factory=RealDictCursor)
-        cur.execute("SELECT * FROM usuarios WHERE id = %s", (uid,))
+        cur.execute(f"SELECT {columnas} FROM usuarios u{join_eps} WHERE u.id = %s", (uid,))
         return cur.fetchone()
     finally:
         if conn: conn.close()
@@ -56,6 +140,7 @@ def create_user(user_data):
         
         sql = "INSERT INTO usuarios (nombre, cedula, email, contrasena, rol, estado_usuario, fecha_nacimiento, telefono, ciudad, genero, tipo_regimen, fecha_registro, eps_id) VALUES (%s, %s, %s, %s, 'cliente', 'activo', %s, %s, %s, %s, %s, %s, %s) RETURNING id"
         params = (nombre, cedula, email, hashed_password, user_data.get('fecha_nacimiento') or None, user_data.get('telefono') or None, user_data.get('ciudad') or None, user_data.get('genero') or None, user_data.get('tipo_regimen') or None, datetime.now().date(), user_data.get('eps_id') or None)
+        establecer_contexto_auditoria(conn, 'CREACION_CLIENTE', 'usuarios')
         cur.execute(sql, params)
         new_id = cur.fetchone()['id']
         conn.commit()
@@ -93,16 +178,17 @@ def update_user(uid, user_data, old_user_data):
         if not sql_update_parts: return True
         sql_update = f"UPDATE usuarios SET {', '.join(sql_update_parts)} WHERE id=%s AND rol='cliente'"
         params.append(uid)
-        cur.execute(sql_update, tuple(params))
-        conn.commit()
-        
-        # ***** CORRECCIÓN *****
-        # Ya no se pasa 'admin_id_actual'.
         accion_audit = 'EDICION_CLIENTE'
         if old_user_data.get('estado_usuario') == 'activo' and user_data.get('estado_usuario') == 'inactivo':
             accion_audit = 'DESACTIVACION_CLIENTE'
         elif old_user_data.get('estado_usuario') == 'inactivo' and user_data.get('estado_usuario') == 'activo':
             accion_audit = 'REACTIVACION_CLIENTE'
+        establecer_contexto_auditoria(conn, accion_audit, 'usuarios')
+        cur.execute(sql_update, tuple(params))
+        conn.commit()
+        
+        # ***** CORRECCIÓN *****
+        # Ya no se pasa 'admin_id_actual'.
         datos_nuevos_cleaned = {k: (v or None) for k, v in user_data.items() if k != 'contrasena_nueva'}
         if user_data.get('contrasena_nueva'): datos_nuevos_cleaned['contrasena'] = "********"
         
@@ -116,6 +202,10 @@ def update_user(uid, user_data, old_user_data):
         if conn: conn.close()
 
 def get_eps_list():
+    # Catálogo cacheado en el proceso (ver get_medications); siempre se carga del primario.
+    return obtener_catalogo('eps', 'activas', _consultar_eps_activas)
+
+def _consultar_eps_activas():
     conn = None
     try:
         conn = get_db_connection()
@@ -208,7 +208,7 @@ async function loadAuditoria(moduleFilter = '', userSearchTerm = '') {
         return;
     }
     try {
-        let url = '/api/admin/auditoria?limit=100'; // Default limit for display
+        let url = '/api/admin/auditoria?limit=100&vista=resumen'; // Resumen: los JSONB se piden al abrir el detalle
         const params = new URLSearchParams();
 
         if (moduleFilter) {
@@ -244,10 +244,12 @@ async function loadAuditoria(moduleFilter = '', userSearchTerm = '') {
             row.insertCell().innerHTML = `<small>${log.registro_id_afectado !== null && typeof log.registro_id_afectado !== 'undefined' ? String(log.registro_id_afectado) : 'N/A'}</small>`; // Affected ID
             
             const cambiosCell = row.insertCell();
-            cambiosCell.innerHTML = generateChangeSummary(log.accion, log.datos_anteriores, log.datos_nuevos); // Changes Summary
-            
+            const campos = log.campos_modificados && log.campos_modificados.length
+                ? `<small>${log.campos_modificados.join(', ')}</small><br>` : '';
+            cambiosCell.innerHTML = `${campos}<button class="btn btn-sm btn-link p-0 btn-detalle-auditoria" data-id="${log.id}">Ver detalle</button>`;
+
             const detallesAdicionalesCell = row.insertCell();
-            detallesAdicionalesCell.innerHTML = formatJsonForDisplay(log.detalles_adicionales); // Additional Details
+            detallesAdicionalesCell.innerHTML = log.tiene_detalles ? '<small>Ver detalle</small>' : formatJsonForDisplay(null);
         });
     } catch (error) {
         console.error('Error en loadAuditoria:', error); // Log the actual error to console
@@ -255,6 +257,20 @@ async function loadAuditoria(moduleFilter = '', userSearchTerm = '') {
     }
 }
 
+async function loadAuditoriaDetalle(button) {
+    const row = button.closest('tr');
+    if (!row) return;
+    button.disabled = true;
+    try {
+        const log = await fetchData(`/api/admin/auditoria/${button.dataset.id}`, 'Error al cargar el detalle de auditoría');
+        row.cells[6].innerHTML = generateChangeSummary(log.accion, log.datos_anteriores, log.datos_nuevos);
+        row.cells[7].innerHTML = formatJsonForDisplay(log.detalles_adicionales);
+    } catch (error) {
+        console.error('Error en loadAuditoriaDetalle:', error);
+        button.disabled = false;
+    }
+}
+
 
 async function loadReportesLog() {
     const tableBody = document.getElementById('reportes-log-table-body');
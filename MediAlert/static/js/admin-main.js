@@ -124,6 +124,11 @@ document.addEventListener('DOMContentLoaded', () => {
         if (targetElement.matches('#btn-add-medicamento') && typeof openMedicamentoModal === 'function') openMedicamentoModal();
         if (targetElement.matches('#btn-add-alerta') && typeof openAlertaModal === 'function') openAlertaModal();
 
+        // Detalle de auditoría (las instantáneas JSONB se piden bajo demanda)
+        if (targetElement.matches('.btn-detalle-auditoria') && typeof loadAuditoriaDetalle === 'function') {
+            loadAuditoriaDetalle(targetElement);
+        }
+
         // --- Client Card Actions ---
         if (targetElement.matches('.btn-edit-cliente') && typeof openClienteModal === 'function') {
             openClienteModal(targetElement.dataset.id);
@@ -0,0 +1,41 @@
+# medialert/tests/conftest.py
+# Las pruebas importan los módulos como lo hace la aplicación (utils.frecuencia, ...), con
+# MediAlert/ como directorio de trabajo.
+
+import os
+import sys
+
+import psycopg2
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope='session')
+def app():
+    """
+    La aplicación configurada con el .env, para las pruebas que necesitan la base de datos.
+    Se omiten si PostgreSQL no está disponible.
+    """
+    import main
+    from database import get_db_connection
+    try:
+        with main.app.app_context():
+            get_db_connection().close()
+    except psycopg2.Error as e:
+        pytest.skip(f'Base de datos no disponible: {e}')
+    return main.app
+
+
+@pytest.fixture
+def peticion(app):
+    """
+    Contexto de petición cuya unidad de trabajo se revierte al terminar: las pruebas pueden
+    escribir y leer lo escrito en la misma transacción sin dejar cambios en la base de datos.
+    """
+    from database import _release_request_connection
+    with app.test_request_context():
+        try:
+            yield
+        finally:
+            _release_request_connection(None)
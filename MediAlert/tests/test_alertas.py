@@ -0,0 +1,53 @@
+# medialert/tests/test_alertas.py
+# Pruebas de services/alert_service.py contra la base de datos (se omiten sin ella). Cada
+# prueba escribe dentro de la unidad de trabajo de una petición que se revierte al final.
+
+import pytest
+
+from database import get_db_connection
+from services.alert_service import get_alert_by_id, get_alerts, update_alert
+
+_CAMPOS_PAUTA = ('frecuencia_intervalo_min', 'frecuencia_veces_dia', 'frecuencia_dias_semana', 'proxima_toma')
+# Columnas que no cambian la versión de alertas (trg_alertas_version_update).
+_CAMPOS_DERIVADOS = {'ultima_notificacion_enviada', 'ultima_toma_encolada', *_CAMPOS_PAUTA}
+
+
+@pytest.fixture
+def alerta_cada_8_horas(peticion):
+    """Una alerta activa y sin fecha de fin con la frecuencia 'cada 8 horas'."""
+    cur = get_db_connection().cursor()
+    cur.execute("SELECT id FROM alertas ORDER BY id LIMIT 1")
+    fila = cur.fetchone()
+    if fila is None:
+        pytest.skip('No hay alertas en la base de datos.')
+    alerta_id = fila[0]
+    update_alert(alerta_id, {'frecuencia': 'cada 8 horas', 'estado': 'activa', 'fecha_fin': None},
+                 get_alert_by_id(alerta_id), None)
+    return get_alert_by_id(alerta_id)
+
+
+def test_editar_texto_de_frecuencia_con_la_misma_pauta(alerta_cada_8_horas):
+    antes = alerta_cada_8_horas
+    assert antes['frecuencia_intervalo_min'] == 480 and antes['proxima_toma'] is not None
+
+    update_alert(antes['id'], {'frecuencia': 'Cada 8 horas'}, antes, None)
+
+    despues = get_alert_by_id(antes['id'])
+    assert despues['frecuencia'] == 'Cada 8 horas'
+    assert {c: despues[c] for c in _CAMPOS_PAUTA} == {c: antes[c] for c in _CAMPOS_PAUTA}
+
+
+def test_cambio_de_frecuencia_fuera_de_la_aplicacion_queda_pendiente(alerta_cada_8_horas):
+    alerta_id = alerta_cada_8_horas['id']
+    cur = get_db_connection().cursor()
+    cur.execute("UPDATE alertas SET frecuencia = 'Cada 6 horas' WHERE id = %s", (alerta_id,))
+
+    despues = get_alert_by_id(alerta_id)
+    assert all(despues[c] is None for c in _CAMPOS_PAUTA)
+
+
+def test_listado_versionado_sin_columnas_derivadas(peticion):
+    # El listado va con ETag y caché por versión de alertas: no puede incluir columnas cuyo
+    # cambio no cambia esa versión.
+    for alerta in get_alerts.sin_cache():
+        assert not _CAMPOS_DERIVADOS & set(alerta)
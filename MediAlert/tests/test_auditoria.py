@@ -0,0 +1,52 @@
+# medialert/tests/test_auditoria.py
+# Pruebas de la auditoría: el delta de la auditoría de aplicación (sin BD) y la consulta del
+# historial contra la base de datos (se omiten sin ella).
+
+from datetime import date, datetime, time
+from decimal import Decimal
+
+import pytest
+
+from database import _delta_auditoria, get_db_connection
+from services.report_service import get_audit_logs, get_audit_log_detail
+
+
+def test_delta_auditoria_compara_con_el_tipo_de_la_bd():
+    anteriores = {
+        'hora_preferida': time(8, 0), 'fecha_inicio': date(2025, 3, 1), 'usuario_id': 7,
+        'precio': Decimal('1.50'), 'fecha_fin': None, 'creada': datetime(2025, 3, 1, 8, 30),
+        'dosis': '1 tableta', 'activa': True,
+    }
+    nuevos = {
+        'hora_preferida': '08:00', 'fecha_inicio': '2025-03-01', 'usuario_id': '7',
+        'precio': 1.5, 'fecha_fin': '', 'creada': '2025-03-01T08:30:00', 'dosis': '1 tableta',
+        'activa': 'true',
+    }
+    assert _delta_auditoria(anteriores, nuevos) == ({}, {})
+
+
+def test_delta_auditoria_solo_claves_cambiadas():
+    anteriores = {'hora_preferida': time(8, 0), 'dosis': '1 tableta', 'fecha_fin': None, 'usuario_id': 7}
+    nuevos = {'hora_preferida': '20:00', 'dosis': '1 tableta', 'fecha_fin': '2025-04-01', 'usuario_id': 'siete',
+              'estado': 'activa'}
+    assert _delta_auditoria(anteriores, nuevos) == (
+        {'hora_preferida': time(8, 0), 'fecha_fin': None, 'usuario_id': 7, 'estado': None},
+        {'hora_preferida': '20:00', 'fecha_fin': '2025-04-01', 'usuario_id': 'siete', 'estado': 'activa'},
+    )
+
+
+def test_auditoria_no_expone_hash_de_contrasena(peticion):
+    cur = get_db_connection().cursor()
+    cur.execute("SELECT id FROM usuarios WHERE rol = 'cliente' ORDER BY id LIMIT 1")
+    fila = cur.fetchone()
+    if fila is None:
+        pytest.skip('No hay clientes en la base de datos.')
+    cur.execute("UPDATE usuarios SET contrasena = 'hash-de-prueba' WHERE id = %s", (fila[0],))
+    cur.execute("SELECT max(id) FROM auditoria WHERE tabla_afectada = 'usuarios'")
+    audit_id = cur.fetchone()[0]
+
+    detalle = get_audit_log_detail(audit_id)
+    assert 'contrasena' not in detalle['datos_anteriores'] and 'contrasena' not in detalle['datos_nuevos']
+    for entrada in get_audit_logs(limit=20, tabla_filtro='usuarios'):
+        assert 'contrasena' not in (entrada['datos_anteriores'] or {})
+        assert 'contrasena' not in (entrada['datos_nuevos'] or {})
@@ -0,0 +1,176 @@
+# medialert/tests/test_batch_writer.py
+# Pruebas de utils/batch_writer.py con una función de escritura falsa: no necesitan base de datos.
+
+import threading
+
+import pytest
+
+from utils import batch_writer
+from utils.batch_writer import BatchWriter
+
+
+class EscrituraFalsa:
+    """Guarda los lotes recibidos; falla con los elementos de 'invalidos' o las primeras 'fallos' veces."""
+
+    def __init__(self, invalidos=(), fallos=0):
+        self.lotes = []
+        self.invalidos = set(invalidos)
+        self.fallos = fallos
+        self.llamadas = 0
+
+    def __call__(self, lote):
+        self.llamadas += 1
+        if self.fallos:
+            self.fallos -= 1
+            raise RuntimeError('fallo temporal')
+        if self.invalidos & set(lote):
+            raise ValueError('elemento inválido')
+        self.lotes.append(list(lote))
+
+    @property
+    def escritos(self):
+        return [item for lote in self.lotes for item in lote]
+
+
+class EscrituraRetenida:
+    """Bloquea el hilo del escritor dentro de la escritura hasta liberar(), para llenar la cola."""
+
+    def __init__(self):
+        self.ocupado = threading.Event()
+        self._liberar = threading.Event()
+        self.escritos = []
+
+    def __call__(self, lote):
+        self.ocupado.set()
+        self._liberar.wait(5)
+        self.escritos.extend(lote)
+
+    def liberar(self):
+        self._liberar.set()
+
+
+@pytest.fixture
+def sin_esperas(monkeypatch):
+    """Los reintentos no esperan entre intentos."""
+    monkeypatch.setattr(batch_writer.time, 'sleep', lambda segundos: None)
+
+
+def _writer_con_cola_llena(politica, **kwargs):
+    escribir = EscrituraRetenida()
+    writer = BatchWriter('prueba', escribir, max_queue=1, batch_size=1, flush_interval=0.01,
+                         politica=politica, **kwargs).start()
+    assert writer.submit(1)
+    assert escribir.ocupado.wait(5)
+    assert writer.submit(2)
+    return writer, escribir
+
+
+def test_politica_no_valida():
+    with pytest.raises(ValueError):
+        BatchWriter('prueba', EscrituraFalsa(), politica='ignorar')
+
+
+def test_sin_iniciar_no_acepta_elementos():
+    writer = BatchWriter('prueba', EscrituraFalsa())
+    assert not writer.running
+    assert writer.submit(1) is False
+
+
+def test_lotes_y_stop_vacia_la_cola():
+    escribir = EscrituraFalsa()
+    writer = BatchWriter('prueba', escribir, batch_size=10, flush_interval=5).start()
+    for i in range(25):
+        assert writer.submit(i)
+    writer.stop()
+
+    assert escribir.escritos == list(range(25))
+    assert all(len(lote) <= 10 for lote in escribir.lotes)
+    metricas = writer.metrics()
+    assert metricas['encolados'] == metricas['escritos'] == 25
+    assert metricas['en_cola'] == 0 and not metricas['activo']
+
+
+def test_stop_sin_hilo_vacia_la_cola():
+    escribir = EscrituraFalsa()
+    writer = BatchWriter('prueba', escribir, batch_size=10).start()
+    writer._stop.set()
+    writer._thread.join(5)
+    # El hilo ya terminó: lo encolado directamente se escribe en stop().
+    writer._queue.put_nowait('pendiente')
+    writer.stop()
+    assert escribir.escritos == ['pendiente']
+
+
+def test_politica_sincrono_rechaza_con_cola_llena():
+    writer, escribir = _writer_con_cola_llena('sincrono')
+    try:
+        assert writer.submit(3) is False
+        assert writer.metrics()['rechazados'] == 1
+    finally:
+        escribir.liberar()
+        writer.stop()
+    assert escribir.escritos == [1, 2]
+
+
+def test_politica_descartar_acepta_y_cuenta_el_descarte():
+    writer, escribir = _writer_con_cola_llena('descartar')
+    try:
+        assert writer.submit(3) is True
+        assert writer.metrics()['descartados'] == 1
+    finally:
+        escribir.liberar()
+        writer.stop()
+    assert escribir.escritos == [1, 2]
+
+
+def test_politica_bloquear_espera_y_luego_rechaza():
+    writer, escribir = _writer_con_cola_llena('bloquear', block_timeout=0.05)
+    try:
+        assert writer.submit(3) is False
+        assert writer.metrics()['rechazados'] == 1
+    finally:
+        escribir.liberar()
+        writer.stop()
+
+
+def test_politica_bloquear_encola_cuando_hay_espacio():
+    writer, escribir = _writer_con_cola_llena('bloquear', block_timeout=5)
+    threading.Timer(0.05, escribir.liberar).start()
+    assert writer.submit(3) is True
+    writer.stop()
+    assert escribir.escritos == [1, 2, 3]
+
+
+def test_reintenta_un_lote_con_fallo_temporal(sin_esperas):
+    escribir = EscrituraFalsa(fallos=1)
+    writer = BatchWriter('prueba', escribir, batch_size=10, max_reintentos=2)
+    for i in range(3):
+        writer._queue.put_nowait(i)
+    writer.stop()
+
+    assert escribir.lotes == [[0, 1, 2]]
+    assert writer.metrics()['errores'] == 0 and writer.metrics()['escritos'] == 3
+
+
+def test_agotados_los_reintentos_escribe_fila_a_fila(sin_esperas):
+    escribir = EscrituraFalsa(invalidos={2})
+    writer = BatchWriter('prueba', escribir, batch_size=10, max_reintentos=1)
+    for i in range(5):
+        writer._queue.put_nowait(i)
+    writer.stop()
+
+    # Dos intentos del lote completo y después uno por elemento.
+    assert escribir.llamadas == 2 + 5
+    assert escribir.escritos == [0, 1, 3, 4]
+    metricas = writer.metrics()
+    assert metricas['escritos'] == 4 and metricas['errores'] == 1
+
+
+def test_un_solo_elemento_fallido_se_descarta(sin_esperas):
+    escribir = EscrituraFalsa(invalidos={'malo'})
+    writer = BatchWriter('prueba', escribir, max_reintentos=1)
+    writer._queue.put_nowait('malo')
+    writer.stop()
+
+    assert escribir.llamadas == 2
+    assert writer.metrics()['errores'] == 1 and writer.metrics()['escritos'] == 0
@@ -0,0 +1,154 @@
+# medialert/tests/test_frecuencia.py
+# Pruebas de utils/frecuencia.py: no necesitan base de datos.
+
+import random
+from datetime import date, datetime, time, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from utils import frecuencia
+from utils.frecuencia import (
+    Frecuencia, TODOS_LOS_DIAS, MINUTOS_DIA, parse_frecuencia, proxima_toma, expandir_tomas
+)
+
+# Bogotá no tiene horario de verano: la hora de reloj y la de proxima_toma coinciden siempre.
+ZONA = ZoneInfo('America/Bogota')
+LUNES, JUEVES = 1 << 0, 1 << 3
+
+
+@pytest.mark.parametrize('texto, esperado', [
+    ('Cada 8 horas', Frecuencia(480, 3, TODOS_LOS_DIAS)),
+    ('cada ocho horas', Frecuencia(480, 3, TODOS_LOS_DIAS)),
+    ('Cada hora', Frecuencia(60, 24, TODOS_LOS_DIAS)),
+    ('Cada 30 minutos', Frecuencia(30, 48, TODOS_LOS_DIAS)),
+    ('Cada 5 horas', Frecuencia(300, None, TODOS_LOS_DIAS)),
+    ('Cada 72 horas', Frecuencia(3 * MINUTOS_DIA, None, TODOS_LOS_DIAS)),
+    ('Dos veces al día', Frecuencia(720, 2, TODOS_LOS_DIAS)),
+    ('3 veces por día', Frecuencia(480, 3, TODOS_LOS_DIAS)),
+    ('Una vez al día', Frecuencia(MINUTOS_DIA, 1, TODOS_LOS_DIAS)),
+    ('Diario, en ayunas', Frecuencia(MINUTOS_DIA, 1, TODOS_LOS_DIAS)),
+    ('Antes de dormir', Frecuencia(MINUTOS_DIA, 1, TODOS_LOS_DIAS)),
+    ('Con cada comida', Frecuencia(360, 3, TODOS_LOS_DIAS)),
+    ('Semanal', Frecuencia(7 * MINUTOS_DIA, None, TODOS_LOS_DIAS)),
+    ('Una vez a la semana', Frecuencia(7 * MINUTOS_DIA, None, TODOS_LOS_DIAS)),
+    ('Quincenal', Frecuencia(14 * MINUTOS_DIA, None, TODOS_LOS_DIAS)),
+    ('Lunes y jueves', Frecuencia(MINUTOS_DIA, 1, LUNES | JUEVES)),
+    ('Dos veces al día los lunes', Frecuencia(720, 2, LUNES)),
+    ('Cada semana, los jueves', Frecuencia(MINUTOS_DIA, 1, JUEVES)),
+    ('Fines de semana', Frecuencia(MINUTOS_DIA, 1, 0b1100000)),
+    ('Entre semana', Frecuencia(MINUTOS_DIA, 1, 0b0011111)),
+    ('Miércoles', Frecuencia(MINUTOS_DIA, 1, 1 << 2)),
+])
+def test_parse_frecuencia(texto, esperado):
+    assert parse_frecuencia(texto) == esperado
+
+
+@pytest.mark.parametrize('texto', [None, '', 'Según necesidad', 'Cada 0 horas', '0 veces al día'])
+def test_parse_frecuencia_no_reconocida(texto):
+    assert parse_frecuencia(texto) is None
+
+
+def _utc(texto):
+    return datetime.fromisoformat(texto).replace(tzinfo=ZONA).astimezone(timezone.utc)
+
+
+def test_proxima_toma_diaria():
+    f = parse_frecuencia('Cada 8 horas')
+    inicio = date(2025, 3, 3)
+    assert proxima_toma(f, time(7, 0), inicio, None, _utc('2025-03-01T00:00'), ZONA) == _utc('2025-03-03T07:00')
+    assert proxima_toma(f, time(7, 0), inicio, None, _utc('2025-03-03T07:00'), ZONA) == _utc('2025-03-03T15:00')
+    # La última toma del día (23:00) y la primera del siguiente.
+    assert proxima_toma(f, time(7, 0), inicio, None, _utc('2025-03-03T15:00'), ZONA) == _utc('2025-03-03T23:00')
+    assert proxima_toma(f, time(7, 0), inicio, None, _utc('2025-03-03T23:00'), ZONA) == _utc('2025-03-04T07:00')
+
+
+def test_proxima_toma_pasa_de_medianoche():
+    # Desde las 20:00 cada 6 horas: la tercera toma del día es a las 08:00 del día siguiente.
+    f = parse_frecuencia('Cada 6 horas')
+    assert proxima_toma(f, time(20, 0), date(2025, 3, 3), None, _utc('2025-03-04T03:00'), ZONA) == _utc('2025-03-04T08:00')
+
+
+def test_proxima_toma_dias_semana_y_hora_por_defecto():
+    f = parse_frecuencia('Lunes y jueves')
+    # 2025-03-04 es martes: la siguiente es el jueves a la hora por defecto.
+    assert proxima_toma(f, None, date(2025, 3, 3), None, _utc('2025-03-04T12:00'), ZONA) == _utc('2025-03-06T08:00')
+
+
+def test_proxima_toma_intervalo():
+    f = parse_frecuencia('Cada 72 horas')
+    inicio = date(2025, 3, 1)
+    assert proxima_toma(f, time(9, 0), inicio, None, _utc('2025-03-02T00:00'), ZONA) == _utc('2025-03-04T09:00')
+    assert proxima_toma(f, time(9, 0), inicio, None, _utc('2025-03-04T09:00'), ZONA) == _utc('2025-03-07T09:00')
+
+
+def test_proxima_toma_fin_de_pauta():
+    f = parse_frecuencia('Dos veces al día')
+    fin = date(2025, 3, 5)
+    assert proxima_toma(f, time(8, 0), date(2025, 3, 1), fin, _utc('2025-03-05T10:00'), ZONA) == _utc('2025-03-05T20:00')
+    assert proxima_toma(f, time(8, 0), date(2025, 3, 1), fin, _utc('2025-03-05T20:00'), ZONA) is None
+
+
+def test_expandir_tomas():
+    pautas = [
+        (*parse_frecuencia('Cada 8 horas'), time(7, 0), date(2025, 3, 3), date(2025, 3, 4)),
+        (*parse_frecuencia('Cada 6 horas'), time(20, 0), date(2025, 3, 1), None),
+        (*parse_frecuencia('Cada 72 horas'), time(9, 0), date(2025, 3, 1), None),
+        (*parse_frecuencia('Lunes y jueves'), None, date(2025, 3, 1), None),
+    ]
+    assert expandir_tomas(pautas, date(2025, 3, 4), date(2025, 3, 6)) == [
+        ['2025-03-04T07:00', '2025-03-04T15:00', '2025-03-04T23:00'],
+        ['2025-03-04T02:00', '2025-03-04T08:00', '2025-03-04T14:00', '2025-03-04T20:00',
+         '2025-03-05T02:00', '2025-03-05T08:00', '2025-03-05T14:00', '2025-03-05T20:00',
+         '2025-03-06T02:00', '2025-03-06T08:00', '2025-03-06T14:00', '2025-03-06T20:00'],
+        ['2025-03-04T09:00'],
+        ['2025-03-06T08:00'],
+    ]
+    assert expandir_tomas([], date(2025, 3, 4), date(2025, 3, 6)) == []
+
+
+def _pautas_aleatorias(azar, cantidad):
+    textos = ['Cada 8 horas', 'Cada 6 horas', 'Cada 5 horas', 'Cada 36 horas', 'Cada 72 horas', 'Cada hora',
+              'Dos veces al día', 'Una vez al día', 'Con cada comida', 'Semanal', 'Quincenal',
+              'Lunes y jueves', 'Dos veces al día los lunes', 'Fines de semana', 'Cada 90 minutos']
+    pautas = []
+    for _ in range(cantidad):
+        inicio = date(2025, 1, 1) + timedelta(days=azar.randrange(90))
+        fin = inicio + timedelta(days=azar.randrange(60)) if azar.random() < 0.5 else None
+        hora = time(azar.randrange(24), azar.choice((0, 15, 30, 45))) if azar.random() < 0.8 else None
+        pautas.append((*parse_frecuencia(azar.choice(textos)), hora, inicio, fin))
+    return pautas
+
+
+def _expandir_con_proxima_toma(pauta, desde, hasta):
+    """Calendario de referencia: proxima_toma repetida hasta salir del rango."""
+    f, (hora, inicio, fin) = Frecuencia(*pauta[:3]), pauta[3:]
+    limite = datetime.combine(hasta + timedelta(days=1), time(0), tzinfo=ZONA)
+    tomas = []
+    t = proxima_toma(f, hora, inicio, fin, datetime.combine(desde, time(0), tzinfo=ZONA) - timedelta(minutes=1), ZONA)
+    while t is not None and t < limite:
+        tomas.append(t.astimezone(ZONA).strftime('%Y-%m-%dT%H:%M'))
+        t = proxima_toma(f, hora, inicio, fin, t, ZONA)
+    return tomas
+
+
+def test_expandir_tomas_igual_que_proxima_toma(monkeypatch):
+    azar = random.Random(22)
+    pautas = _pautas_aleatorias(azar, 60)
+    desde, hasta = date(2025, 2, 10), date(2025, 3, 20)
+    esperado = [_expandir_con_proxima_toma(p, desde, hasta) for p in pautas]
+    monkeypatch.setattr(frecuencia, 'np', None)
+    assert expandir_tomas(pautas, desde, hasta) == esperado
+
+
+def test_expandir_tomas_numpy_igual_que_python(monkeypatch):
+    np = pytest.importorskip('numpy')
+    azar = random.Random(2025)
+    for _ in range(20):
+        pautas = _pautas_aleatorias(azar, azar.randrange(1, 40))
+        desde = date(2025, 1, 1) + timedelta(days=azar.randrange(120))
+        hasta = desde + timedelta(days=azar.randrange(62))
+        monkeypatch.setattr(frecuencia, 'np', np)
+        con_numpy = expandir_tomas(pautas, desde, hasta)
+        monkeypatch.setattr(frecuencia, 'np', None)
+        assert con_numpy == expandir_tomas(pautas, desde, hasta)
@@ -0,0 +1,171 @@
+# medialert/utils/batch_writer.py
+
+import queue
+import threading
+import time
+
+# Políticas cuando la cola está llena:
+# - 'sincrono': submit() devuelve False y el llamador escribe la fila por su cuenta.
+# - 'bloquear': submit() espera hasta block_timeout segundos por espacio; si no hay, devuelve False.
+# - 'descartar': la fila se descarta y se contabiliza en 'descartados'.
+POLITICAS_CONTRAPRESION = ('sincrono', 'bloquear', 'descartar')
+
+
+class BatchWriter:
+    """
+    Escritor en segundo plano con cola acotada en memoria.
+
+    Los productores llaman submit(item); un hilo agrupa los elementos y llama a
+    flush_fn(lote) con hasta batch_size elementos, o con los que haya cuando pasan
+    flush_interval segundos desde el primero. Si un lote sigue fallando tras los reintentos se
+    escribe elemento a elemento, para que un elemento inválido no haga perder el resto.
+    stop() vacía la cola antes de terminar.
+    """
+
+    def __init__(self, nombre, flush_fn, max_queue=10000, batch_size=500, flush_interval=1.0,
+                 politica='sincrono', block_timeout=0.5, max_reintentos=2, logger=None):
+        if politica not in POLITICAS_CONTRAPRESION:
+            raise ValueError(f'Política de contrapresión no válida: {politica}')
+        self.nombre = nombre
+        self._flush_fn = flush_fn
+        self._queue = queue.Queue(maxsize=max_queue)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.politica = politica
+        self.block_timeout = block_timeout
+        self.max_reintentos = max_reintentos
+        self._logger = logger
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._metrics = {
+            'encolados': 0, 'escritos': 0, 'lotes': 0, 'descartados': 0, 'rechazados': 0,
+            'errores': 0, 'ultima_latencia_ms': None, 'max_latencia_ms': 0.0,
+            'latencia_total_ms': 0.0,
+        }
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name=f'batch-writer-{self.nombre}', daemon=True)
+            self._thread.start()
+        return self
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive() and not self._stop.is_set()
+
+    def submit(self, item):
+        """Encola un elemento. Devuelve False si el llamador debe escribirlo de forma síncrona."""
+        if not self.running:
+            return False
+        try:
+            if self.politica == 'bloquear':
+                self._queue.put(item, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(item)
+        except queue.Full:
+            with self._lock:
+                if self.politica == 'descartar':
+                    self._metrics['descartados'] += 1
+                    return True
+                self._metrics['rechazados'] += 1
+            return False
+        with self._lock:
+            self._metrics['encolados'] += 1
+        return True
+
+    def _collect(self, first_timeout):
+        try:
+            batch = [self._queue.get(timeout=first_timeout)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._stop.is_set():
+                # Al parar ya no se espera: se toma lo que quede sin bloquear.
+                try:
+                    batch.append(self._queue.get_nowait())
+                    continue
+                except queue.Empty:
+                    break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        for intento in range(self.max_reintentos + 1):
+            inicio = time.perf_counter()
+            try:
+                self._flush_fn(batch)
+            except Exception as e:
+                if self._logger:
+                    self._logger.error(f"Error al escribir lote de {len(batch)} en '{self.nombre}' "
+                                       f"(intento {intento + 1}): {e!r}")
+                if intento < self.max_reintentos and not self._stop.is_set():
+                    time.sleep(min(2 ** intento, 5))
+                continue
+            latencia = (time.perf_counter() - inicio) * 1000
+            with self._lock:
+                m = self._metrics
+                m['escritos'] += len(batch)
+                m['lotes'] += 1
+                m['ultima_latencia_ms'] = round(latencia, 3)
+                m['max_latencia_ms'] = max(m['max_latencia_ms'], round(latencia, 3))
+                m['latencia_total_ms'] += latencia
+            return
+        self._write_por_fila(batch)
+
+    def _write_por_fila(self, batch):
+        """Agotados los reintentos, escribe el lote fila a fila: solo se pierden las que fallan."""
+        fallidas = 0
+        if len(batch) > 1:
+            for item in batch:
+                try:
+                    self._flush_fn([item])
+                except Exception as e:
+                    fallidas += 1
+                    if self._logger:
+                        self._logger.error(f"Se descarta un elemento de '{self.nombre}': {e!r}")
+        else:
+            fallidas = len(batch)
+        with self._lock:
+            self._metrics['escritos'] += len(batch) - fallidas
+            self._metrics['errores'] += fallidas
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._collect(first_timeout=self.flush_interval)
+            if batch:
+                self._write(batch)
+        self._drain()
+
+    def _drain(self):
+        while True:
+            batch = self._collect(first_timeout=0)
+            if not batch:
+                return
+            self._write(batch)
+
+    def stop(self, timeout=10.0):
+        """Detiene el hilo garantizando que todo lo encolado se escriba antes."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        # Si el hilo no llegó a iniciarse, la cola se vacía aquí.
+        if self._thread is None or not self._thread.is_alive():
+            self._drain()
+
+    def metrics(self):
+        with self._lock:
+            m = dict(self._metrics)
+        latencia_total = m.pop('latencia_total_ms')
+        m['promedio_latencia_ms'] = round(latencia_total / m['lotes'], 3) if m['lotes'] else None
+        m['en_cola'] = self._queue.qsize()
+        m['capacidad_cola'] = self._queue.maxsize
+        m['politica'] = self.politica
+        m['activo'] = self.running
+        return m
@@ -0,0 +1,60 @@
+# medialert/utils/catalog_cache.py
+
+import threading
+from collections import defaultdict
+
+
+class CatalogCache:
+    """
+    Caché en memoria del proceso para catálogos que cambian poco (medicamentos, EPS).
+
+    Cada catálogo tiene un contador de versión; invalidate(nombre) lo incrementa y todas las
+    entradas de ese catálogo dejan de ser válidas. La versión se lee antes de cargar, así que
+    si llega una invalidación mientras se consulta la BD el resultado se guarda ya caducado
+    y la siguiente lectura vuelve a cargarlo.
+
+    Los valores devueltos se comparten entre peticiones y no deben modificarse.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._versiones = defaultdict(int)
+        self._entradas = {}   # (catálogo, clave) -> (versión, valor)
+        self._metricas = {'aciertos': 0, 'fallos': 0, 'invalidaciones': 0}
+
+    def version(self, nombre):
+        with self._lock:
+            return self._versiones[nombre]
+
+    def get(self, nombre, clave, cargar):
+        """Devuelve el valor cacheado o lo obtiene con cargar() y lo guarda."""
+        with self._lock:
+            version = self._versiones[nombre]
+            entrada = self._entradas.get((nombre, clave))
+            if entrada is not None and entrada[0] == version:
+                self._metricas['aciertos'] += 1
+                return entrada[1]
+            self._metricas['fallos'] += 1
+
+        valor = cargar()
+        with self._lock:
+            self._entradas[(nombre, clave)] = (version, valor)
+        return valor
+
+    def invalidate(self, nombre):
+        with self._lock:
+            self._versiones[nombre] += 1
+            self._metricas['invalidaciones'] += 1
+            for clave in [k for k in self._entradas if k[0] == nombre]:
+                del self._entradas[clave]
+
+    def invalidate_all(self):
+        with self._lock:
+            for nombre in {k[0] for k in self._entradas} | set(self._versiones):
+                self._versiones[nombre] += 1
+            self._entradas.clear()
+            self._metricas['invalidaciones'] += 1
+
+    def stats(self):
+        with self._lock:
+            return {**self._metricas, 'entradas': len(self._entradas), 'versiones': dict(self._versiones)}
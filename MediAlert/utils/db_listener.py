@@ -0,0 +1,94 @@
+# medialert/utils/db_listener.py
+
+import select
+import threading
+
+import psycopg2
+from psycopg2 import extensions
+
+
+class NotifyListener:
+    """
+    Hilo que mantiene una conexión dedicada con LISTEN sobre uno o varios canales y llama a
+    callback(canal, carga) por cada NOTIFY recibido.
+
+    Si la conexión se pierde se reconecta con espera exponencial; como en ese intervalo pudo
+    perderse algún aviso, tras cada (re)conexión se llama a on_connect() para que el
+    consumidor descarte lo que tenga en memoria.
+    """
+
+    def __init__(self, nombre, connect_kwargs, canales, callback, on_connect=None,
+                 poll_interval=1.0, max_espera=30.0, logger=None):
+        self.nombre = nombre
+        self._connect_kwargs = dict(connect_kwargs)
+        self.canales = tuple(canales)
+        self._callback = callback
+        self._on_connect = on_connect
+        self.poll_interval = poll_interval
+        self.max_espera = max_espera
+        self._logger = logger
+        self._stop = threading.Event()
+        self._conectado = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name=f'listener-{self.nombre}', daemon=True)
+            self._thread.start()
+        return self
+
+    @property
+    def conectado(self):
+        return self._conectado.is_set()
+
+    def wait_connected(self, timeout=None):
+        return self._conectado.wait(timeout)
+
+    def _escuchar(self, conn):
+        conn.set_isolation_level(extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with conn.cursor() as cur:
+            for canal in self.canales:
+                cur.execute(f'LISTEN "{canal}";')
+        if self._on_connect:
+            self._on_connect()
+        self._conectado.set()
+
+        while not self._stop.is_set():
+            if select.select([conn], [], [], self.poll_interval) == ([], [], []):
+                continue
+            conn.poll()
+            while conn.notifies:
+                aviso = conn.notifies.pop(0)
+                try:
+                    self._callback(aviso.channel, aviso.payload)
+                except Exception as e:
+                    if self._logger:
+                        self._logger.error(f"Error procesando NOTIFY en '{self.nombre}': {e!r}")
+
+    def _run(self):
+        espera = 1.0
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(**self._connect_kwargs)
+                espera = 1.0
+                self._escuchar(conn)
+            except (psycopg2.Error, OSError) as e:
+                if self._logger:
+                    self._logger.warning(f"Listener '{self.nombre}' desconectado, reintento en {espera:.0f}s: {e}".strip())
+            finally:
+                self._conectado.clear()
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except psycopg2.Error:
+                        pass
+            if self._stop.wait(espera):
+                break
+            espera = min(espera * 2, self.max_espera)
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
@@ -0,0 +1,288 @@
+# medialert/utils/db_pool.py
+
+import os
+import threading
+import time
+from collections import deque
+
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.pool import PoolError
+
+
+class PooledConnection:
+    """
+    Envoltorio de una conexión psycopg2 prestada por el pool.
+    Expone la misma API que la conexión original, pero close() la devuelve al pool
+    en lugar de cerrar el socket.
+    """
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def close(self):
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            self._pool.putconn(conn)
+
+    @property
+    def closed(self):
+        return self._conn is None or self._conn.closed
+
+    @property
+    def raw(self):
+        """Conexión psycopg2 subyacente (para APIs que exigen el objeto real)."""
+        if self._conn is None:
+            raise PoolError('La conexión ya fue devuelta al pool.')
+        return self._conn
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
+
+    def __setattr__(self, name, value):
+        # Atributos como autocommit o readonly deben fijarse en la conexión real.
+        if name.startswith('_'):
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self.raw, name, value)
+
+    def __enter__(self):
+        self.raw.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return self.raw.__exit__(exc_type, exc_value, traceback)
+
+    def __del__(self):
+        # Red de seguridad: si alguien olvida close(), el hueco del pool no se pierde.
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    """
+    Pool de conexiones PostgreSQL seguro para hilos.
+
+    - minconn / maxconn: conexiones mantenidas abiertas / máximo simultáneo.
+    - timeout: segundos que getconn() espera por una conexión libre antes de fallar.
+    - max_age: segundos de vida de una conexión antes de reciclarla (0 = sin límite).
+    - healthcheck_idle: si una conexión estuvo ociosa más de estos segundos se verifica
+      con 'SELECT 1' antes de entregarla (0 = verificar siempre).
+
+    Al devolver una conexión se revierte cualquier transacción pendiente y se ejecuta
+    connection.reset() (RESET ALL), de modo que ningún parámetro de sesión, como
+    'medialert.app_user_id', pasa de una petición a otra.
+    """
+
+    def __init__(self, connect_kwargs, minconn=1, maxconn=10, timeout=5.0,
+                 max_age=1800.0, healthcheck_idle=30.0, logger=None):
+        if maxconn < 1 or minconn < 0 or minconn > maxconn:
+            raise ValueError('Tamaños de pool no válidos.')
+        self._connect_kwargs = dict(connect_kwargs)
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.max_age = max_age
+        self.healthcheck_idle = healthcheck_idle
+        self._logger = logger
+        self._cond = threading.Condition()
+        self._idle = deque()      # (conn, instante en que quedó libre)
+        self._created = {}        # id(conn) -> instante de creación
+        self._size = 0
+        self._closed = False
+        self._pid = os.getpid()
+
+        for _ in range(minconn):
+            conn = self._connect()
+            self._idle.append((conn, time.monotonic()))
+            self._size += 1
+
+    def _log(self, message):
+        if self._logger:
+            self._logger.warning(message)
+
+    def _connect(self):
+        conn = psycopg2.connect(**self._connect_kwargs)
+        self._created[id(conn)] = time.monotonic()
+        return conn
+
+    def _discard(self, conn):
+        self._created.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _expired(self, conn):
+        if not self.max_age:
+            return False
+        return time.monotonic() - self._created.get(id(conn), 0) > self.max_age
+
+    def _healthy(self, conn, idle_since):
+        if conn.closed:
+            return False
+        if self.healthcheck_idle and time.monotonic() - idle_since < self.healthcheck_idle:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute('SELECT 1')
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _check_fork(self):
+        # Tras un fork (p. ej. gunicorn --preload) los sockets heredados no son utilizables.
+        if self._pid != os.getpid():
+            with self._cond:
+                self._idle.clear()
+                self._created.clear()
+                self._size = 0
+                self._pid = os.getpid()
+
+    def getconn(self):
+        """Obtiene una conexión del pool envuelta en PooledConnection."""
+        self._check_fork()
+        deadline = time.monotonic() + self.timeout
+        while True:
+            with self._cond:
+                if self._closed:
+                    raise PoolError('El pool de conexiones está cerrado.')
+                candidate = None
+                if self._idle:
+                    candidate = self._idle.pop()
+                elif self._size < self.maxconn:
+                    self._size += 1
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolError(
+                            f'No hay conexiones disponibles en el pool tras {self.timeout}s '
+                            f'(máximo {self.maxconn}).'
+                        )
+                    self._cond.wait(remaining)
+                    continue
+
+            if candidate is None:
+                try:
+                    return PooledConnection(self, self._connect())
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+
+            conn, idle_since = candidate
+            if self._expired(conn) or not self._healthy(conn, idle_since):
+                self._discard(conn)
+                with self._cond:
+                    self._size -= 1
+                continue
+            return PooledConnection(self, conn)
+
+    def putconn(self, conn):
+        """Devuelve una conexión al pool, restableciendo su estado de sesión."""
+        reusable = not conn.closed and not self._expired(conn) and self._pid == os.getpid()
+        if reusable:
+            try:
+                if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+                conn.reset()
+            except psycopg2.Error as e:
+                self._log(f"Conexión descartada al devolverla al pool: {e}")
+                reusable = False
+
+        with self._cond:
+            if reusable and not self._closed:
+                self._idle.append((conn, time.monotonic()))
+            else:
+                self._discard(conn)
+                self._size -= 1
+            self._cond.notify()
+
+    def closeall(self):
+        """Cierra todas las conexiones ociosas y rechaza nuevas peticiones."""
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                conn, _ = self._idle.pop()
+                self._discard(conn)
+                self._size -= 1
+            self._cond.notify_all()
+
+    def clear_idle(self):
+        """Cierra las conexiones ociosas (p. ej. tras detectar que el servidor se reinició)."""
+        with self._cond:
+            while self._idle:
+                conn, _ = self._idle.pop()
+                self._discard(conn)
+                self._size -= 1
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {'abiertas': self._size, 'libres': len(self._idle), 'maximo': self.maxconn}
+
+
+class ReplicaSet:
+    """
+    Conjunto de pools de réplicas de lectura con reparto round-robin.
+
+    Si una réplica no acepta conexiones queda marcada como caída durante retry_seconds y
+    se prueba la siguiente; getconn() devuelve None cuando no hay ninguna disponible, para
+    que el llamador recurra al primario.
+    """
+
+    def __init__(self, pools, retry_seconds=30.0, logger=None):
+        self._pools = list(pools)
+        self.retry_seconds = retry_seconds
+        self._logger = logger
+        self._lock = threading.Lock()
+        self._siguiente = 0
+        self._caida_hasta = [0.0] * len(self._pools)
+
+    def getconn(self):
+        with self._lock:
+            inicio = self._siguiente
+            self._siguiente = (self._siguiente + 1) % len(self._pools)
+        ahora = time.monotonic()
+        for desplazamiento in range(len(self._pools)):
+            indice = (inicio + desplazamiento) % len(self._pools)
+            if self._caida_hasta[indice] > ahora:
+                continue
+            try:
+                return self._pools[indice].getconn()
+            except PoolError:
+                # Pool agotado: la réplica funciona, solo está ocupada.
+                continue
+            except psycopg2.OperationalError as e:
+                self._marcar_caida(indice, e)
+        return None
+
+    def _marcar_caida(self, indice, error):
+        self._caida_hasta[indice] = time.monotonic() + self.retry_seconds
+        self._pools[indice].clear_idle()
+        if self._logger:
+            self._logger.warning(f"Réplica de lectura {indice} no disponible durante "
+                                 f"{self.retry_seconds}s: {error}".strip())
+
+    def report_failure(self, conn, error):
+        """Marca como caída la réplica de 'conn' cuando una consulta falla por la conexión."""
+        for indice, pool in enumerate(self._pools):
+            if pool is conn._pool:
+                self._marcar_caida(indice, error)
+                return
+
+    def closeall(self):
+        for pool in self._pools:
+            pool.closeall()
+
+    def stats(self):
+        ahora = time.monotonic()
+        return [
+            {**pool.stats(), 'disponible': self._caida_hasta[i] <= ahora}
+            for i, pool in enumerate(self._pools)
+        ]
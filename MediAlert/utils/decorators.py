@@ -1,7 +1,11 @@
 # medialert/utils/decorators.py
 
+import hashlib
+from datetime import date
 from functools import wraps
-from flask import session, jsonify
+from flask import session, jsonify, request, current_app, make_response
+
+from database import obtener_versiones_tablas
 
 def login_required(f):
     @wraps(f)
@@ -18,4 +22,45 @@ def admin_required(f):
         if session.get('rol') != 'admin':
             return jsonify({'error': 'Acceso denegado. Se requiere rol de administrador.'}), 403
         return f(*args, **kwargs)
-    return decorated_function
\ No newline at end of file
+    return decorated_function
+
+def etag_por_version(*tablas, por_fecha=False):
+    """
+    GET condicional para listados: el ETag (fuerte) se calcula con la versión de cambios de
+    las tablas de las que depende la respuesta y la ruta con sus parámetros. Si coincide con
+    If-None-Match se responde 304 sin ejecutar la consulta del listado.
+    La versión se lee antes que los datos, así que una respuesta nunca lleva un ETag más
+    nuevo que su contenido. Se lee con el mismo enrutamiento que las consultas @solo_lectura
+    del listado: en la conexión de réplica de la petición, que esas consultas reutilizan. Si la
+    sesión escribió hace poco o no hay réplica disponible, la versión abre la conexión del
+    primario y el listado se lee también de ella.
+    Con por_fecha=True la fecha actual también forma parte del ETag, para respuestas que
+    dependen del día (p. ej. ventanas "últimos N días") aunque las tablas no cambien.
+    """
+    def decorador(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if request.method != 'GET':
+                return f(*args, **kwargs)
+            try:
+                versiones = obtener_versiones_tablas(tablas)
+            except Exception as e:
+                current_app.logger.warning(f"ETag desactivado para {request.path}: {e}")
+                return f(*args, **kwargs)
+
+            firma = request.full_path + '|' + ','.join(f"{t}:{versiones[t]}" for t in tablas)
+            if por_fecha:
+                firma += '|' + date.today().isoformat()
+            etag = hashlib.sha1(firma.encode('utf-8')).hexdigest()[:20]
+            if etag in request.if_none_match:
+                respuesta = current_app.response_class(status=304)
+            else:
+                respuesta = make_response(f(*args, **kwargs))
+                if respuesta.status_code != 200:
+                    return respuesta
+            respuesta.set_etag(etag)
+            # El navegador guarda la respuesta pero la revalida siempre con If-None-Match.
+            respuesta.headers['Cache-Control'] = 'private, no-cache'
+            return respuesta
+        return decorated_function
+    return decorador
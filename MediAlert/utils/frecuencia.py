@@ -0,0 +1,262 @@
+# medialert/utils/frecuencia.py
+# Interpretación del texto libre de alertas.frecuencia ("Cada 8 horas", "Una vez al día",
+# "Lunes y jueves", ...) y cálculo de la próxima toma y del calendario de tomas a partir de ella.
+
+import re
+import unicodedata
+from collections import namedtuple
+from datetime import date, datetime, time, timedelta, timezone
+from functools import lru_cache
+
+try:
+    import numpy as np
+except ImportError:  # numpy es opcional: sin él el calendario se expande toma a toma.
+    np = None
+
+# intervalo_minutos: minutos entre tomas.
+# veces_dia: tomas por día cuando la pauta se repite cada día a partir de la hora preferida
+#            (intervalo_minutos * veces_dia <= 1440); None si es un intervalo de más de un día
+#            o que no divide el día, que se cuenta desde la primera toma.
+# dias_semana: máscara de días en que hay tomas (bit 0 = lunes ... bit 6 = domingo); solo se
+#            aplica a las pautas diarias.
+Frecuencia = namedtuple('Frecuencia', 'intervalo_minutos veces_dia dias_semana')
+
+TODOS_LOS_DIAS = 0b1111111
+MINUTOS_DIA = 24 * 60
+HORA_POR_DEFECTO = time(8, 0)
+
+_NUMEROS = {
+    'un': 1, 'una': 1, 'uno': 1, 'dos': 2, 'tres': 3, 'cuatro': 4, 'cinco': 5, 'seis': 6,
+    'siete': 7, 'ocho': 8, 'nueve': 9, 'diez': 10, 'once': 11, 'doce': 12, 'veinticuatro': 24,
+    'treinta': 30, 'cuarenta y ocho': 48, 'setenta y dos': 72
+}
+_DIAS = {'lunes': 0, 'martes': 1, 'miercoles': 2, 'jueves': 3, 'viernes': 4, 'sabado': 5, 'domingo': 6}
+_UNIDADES = {'minuto': 1, 'hora': 60, 'dia': MINUTOS_DIA, 'semana': 7 * MINUTOS_DIA}
+
+_RE_NUMERO = re.compile(r'\b(' + '|'.join(sorted(_NUMEROS, key=len, reverse=True)) + r')\b')
+_RE_VECES_DIA = re.compile(r'\b(\d+) (?:vez|veces) (?:al|por|cada|en el) dia\b')
+_RE_VECES_SEMANA = re.compile(r'\b1 vez (?:a|por|cada|en) (?:la )?semana\b')
+_RE_CADA = re.compile(r'\bcada (\d+ )?(minuto|hora|dia|semana)s?\b')
+_RE_DIARIO = re.compile(r'\b(diari[oa]|diariamente|todos los dias|cada (?:manana|tarde|noche)|'
+                        r'en la (?:manana|tarde|noche)|por la (?:manana|tarde|noche)|al acostarse|en ayunas|'
+                        r'(?:antes|despues) (?:de|del) (?:desayuno|almuerzo|cena|comer|dormir|acostarse)|'
+                        r'con (?:el )?(?:desayuno|almuerzo|cena))\b')
+# "Con cada comida": tres tomas separadas 6 horas desde la hora preferida (desayuno).
+_RE_COMIDAS = re.compile(r'\b(?:con|en|antes de|despues de) (?:cada|las) comidas?\b')
+_RE_SEMANAL = re.compile(r'\bsemanal(?:mente)?\b')
+_RE_QUINCENAL = re.compile(r'\bquincenal(?:mente)?\b')
+
+
+def _normalizar(texto):
+    texto = unicodedata.normalize('NFKD', texto.lower())
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    texto = re.sub(r'[^a-z0-9]+', ' ', texto).strip()
+    return _RE_NUMERO.sub(lambda m: str(_NUMEROS[m.group(1)]), texto)
+
+
+def _dias_semana(texto):
+    mascara = 0
+    for nombre, dia in _DIAS.items():
+        if re.search(rf'\b{nombre}s?\b', texto):
+            mascara |= 1 << dia
+    if re.search(r'\b(fines? de semana)\b', texto):
+        mascara |= 0b1100000
+    if re.search(r'\b(entre semana|dias habiles)\b', texto):
+        mascara |= 0b0011111
+    return mascara
+
+
+def _por_intervalo(minutos):
+    """Pauta de 'cada N minutos': diaria si el intervalo divide el día, por intervalo si no."""
+    if minutos <= 0:
+        return None
+    if minutos <= MINUTOS_DIA and MINUTOS_DIA % minutos == 0:
+        return Frecuencia(minutos, MINUTOS_DIA // minutos, TODOS_LOS_DIAS)
+    return Frecuencia(minutos, None, TODOS_LOS_DIAS)
+
+
+@lru_cache(maxsize=4096)
+def parse_frecuencia(texto):
+    """
+    Convierte el texto de una frecuencia en una Frecuencia, o None si no se reconoce
+    ("Según necesidad", texto vacío, ...). Las alertas sin frecuencia reconocida no generan
+    recordatorios.
+    """
+    if not texto:
+        return None
+    texto = _normalizar(texto)
+    mascara = _dias_semana(texto)
+
+    frecuencia = None
+    if m := _RE_VECES_DIA.search(texto):
+        veces = int(m.group(1))
+        if 0 < veces <= MINUTOS_DIA:
+            frecuencia = Frecuencia(MINUTOS_DIA // veces, veces, TODOS_LOS_DIAS)
+    elif m := _RE_CADA.search(texto):
+        frecuencia = _por_intervalo(int(m.group(1) or 1) * _UNIDADES[m.group(2)])
+    elif _RE_COMIDAS.search(texto):
+        frecuencia = Frecuencia(6 * 60, 3, TODOS_LOS_DIAS)
+    elif _RE_DIARIO.search(texto):
+        frecuencia = Frecuencia(MINUTOS_DIA, 1, TODOS_LOS_DIAS)
+    elif _RE_SEMANAL.search(texto) or _RE_VECES_SEMANA.search(texto):
+        frecuencia = Frecuencia(7 * MINUTOS_DIA, None, TODOS_LOS_DIAS)
+    elif _RE_QUINCENAL.search(texto):
+        frecuencia = Frecuencia(14 * MINUTOS_DIA, None, TODOS_LOS_DIAS)
+
+    if mascara:
+        # "Lunes y jueves", "Dos veces al día los lunes": tomas diarias limitadas a esos días.
+        # Un intervalo de varios días con días concretos ("cada semana, los lunes") se toma
+        # como una toma diaria en esos días.
+        if frecuencia is None or frecuencia.veces_dia is None:
+            frecuencia = Frecuencia(MINUTOS_DIA, 1, mascara)
+        else:
+            frecuencia = frecuencia._replace(dias_semana=mascara)
+    return frecuencia
+
+
+def proxima_toma(frecuencia, hora_preferida, fecha_inicio, fecha_fin, despues_de, zona):
+    """
+    Primera toma estrictamente posterior a despues_de (datetime con zona), o None si la pauta
+    ya terminó. Las tomas empiezan el día fecha_inicio a hora_preferida (HORA_POR_DEFECTO si no
+    hay) en la zona horaria 'zona', y se cuentan hasta el final del día fecha_fin. El resultado
+    está en UTC.
+    """
+    hora = hora_preferida or HORA_POR_DEFECTO
+    ancla = datetime.combine(fecha_inicio, hora, tzinfo=zona).astimezone(timezone.utc)
+    despues_de = despues_de.astimezone(timezone.utc)
+    intervalo = timedelta(minutes=frecuencia.intervalo_minutos)
+
+    if frecuencia.veces_dia is None:
+        if despues_de < ancla:
+            candidata = ancla
+        else:
+            candidata = ancla + ((despues_de - ancla) // intervalo + 1) * intervalo
+    else:
+        # Se empieza el día anterior: las tomas de ese día pueden pasar de la medianoche.
+        dia = max(fecha_inicio, despues_de.astimezone(zona).date() - timedelta(days=1))
+        candidata = None
+        for _ in range(9):
+            if frecuencia.dias_semana >> dia.weekday() & 1:
+                base = datetime.combine(dia, hora, tzinfo=zona).astimezone(timezone.utc)
+                i = 0 if despues_de < base else (despues_de - base) // intervalo + 1
+                if i < frecuencia.veces_dia:
+                    candidata = base + i * intervalo
+                    break
+            dia += timedelta(days=1)
+        if candidata is None:
+            return None
+
+    if fecha_fin is not None:
+        limite = datetime.combine(fecha_fin + timedelta(days=1), time(0), tzinfo=zona)
+        if candidata >= limite:
+            return None
+    return candidata
+
+
+def _minutos_hora(hora):
+    hora = hora or HORA_POR_DEFECTO
+    return hora.hour * 60 + hora.minute
+
+
+def _expandir_python(pautas, dia_desde, dia_hasta):
+    resultado = []
+    for intervalo, veces, dias_semana, hora, inicio, fin in pautas:
+        h = _minutos_hora(hora)
+        inicio = inicio.toordinal()
+        limite = (min(fin.toordinal(), dia_hasta) + 1) * MINUTOS_DIA if fin else (dia_hasta + 1) * MINUTOS_DIA
+        minimo = dia_desde * MINUTOS_DIA
+        tomas = []
+        if veces:
+            for dia in range(max(inicio, dia_desde - 1), dia_hasta + 1):
+                if (dias_semana or TODOS_LOS_DIAS) >> date.fromordinal(dia).weekday() & 1:
+                    for k in range(veces):
+                        t = dia * MINUTOS_DIA + h + k * intervalo
+                        if minimo <= t < limite:
+                            tomas.append(t)
+        else:
+            t = inicio * MINUTOS_DIA + h
+            if t < minimo:
+                t += -(-(minimo - t) // intervalo) * intervalo
+            while t < limite:
+                tomas.append(t)
+                t += intervalo
+        resultado.append([
+            (datetime.min + timedelta(days=t // MINUTOS_DIA - 1, minutes=t % MINUTOS_DIA)).strftime('%Y-%m-%dT%H:%M')
+            for t in tomas
+        ])
+    return resultado
+
+
+# Día 0 de numpy (1970-01-01) en ordinales de date.toordinal(); fue jueves.
+_ORDINAL_EPOCH = date(1970, 1, 1).toordinal()
+_DIA_SEMANA_EPOCH = 3
+
+
+def _expandir_numpy(pautas, dia_desde, dia_hasta):
+    columnas = list(zip(*pautas))
+    intervalo = np.array(columnas[0], dtype=np.int64)
+    veces = np.array([v or 0 for v in columnas[1]], dtype=np.int64)
+    mascara = np.array([m or TODOS_LOS_DIAS for m in columnas[2]], dtype=np.int64)
+    hora = np.array([_minutos_hora(h) for h in columnas[3]], dtype=np.int64)
+    inicio = np.array([f.toordinal() for f in columnas[4]], dtype=np.int64) - _ORDINAL_EPOCH
+    fin = np.array([f.toordinal() if f else dia_hasta for f in columnas[5]], dtype=np.int64) - _ORDINAL_EPOCH
+    dia_desde, dia_hasta = dia_desde - _ORDINAL_EPOCH, dia_hasta - _ORDINAL_EPOCH
+    # Minutos "de pared" en hora local desde 1970-01-01: [minimo, limite) por pauta.
+    minimo = dia_desde * MINUTOS_DIA
+    limite = (np.minimum(fin, dia_hasta) + 1) * MINUTOS_DIA
+
+    indices, tomas = [], []
+
+    # Pautas diarias: una matriz (pauta, día, toma del día) por cada número de tomas al día. Se
+    # empieza el día anterior porque sus últimas tomas pueden caer pasada la medianoche.
+    dias = np.arange(dia_desde - 1, dia_hasta + 1, dtype=np.int64)
+    activos_dia = (mascara[:, None] >> ((dias + _DIA_SEMANA_EPOCH) % 7)[None, :]) & 1
+    for v in np.unique(veces[veces > 0]):
+        filas = np.flatnonzero(veces == v)
+        t = (dias[None, :, None] * MINUTOS_DIA + hora[filas, None, None]
+             + np.arange(v, dtype=np.int64)[None, None, :] * intervalo[filas, None, None])
+        validas = ((activos_dia[filas, :, None] == 1) & (dias[None, :, None] >= inicio[filas, None, None])
+                   & (t >= minimo) & (t < limite[filas, None, None]))
+        fila, _, _ = np.nonzero(validas)
+        indices.append(filas[fila])
+        tomas.append(t[validas])
+
+    # Pautas por intervalo: n tomas desde la primera dentro del rango, con repeat + arange.
+    filas = np.flatnonzero(veces == 0)
+    if filas.size:
+        ancla = inicio[filas] * MINUTOS_DIA + hora[filas]
+        paso = intervalo[filas]
+        primera = np.maximum(0, -(-(minimo - ancla) // paso))
+        cantidad = np.maximum(0, -(-(limite[filas] - ancla) // paso) - primera)
+        total = int(cantidad.sum())
+        desplazamiento = np.arange(total, dtype=np.int64) - np.repeat(np.cumsum(cantidad) - cantidad, cantidad)
+        indices.append(np.repeat(filas, cantidad))
+        tomas.append(np.repeat(ancla + primera * paso, cantidad) + desplazamiento * np.repeat(paso, cantidad))
+
+    indices = np.concatenate(indices) if indices else np.empty(0, dtype=np.int64)
+    tomas = np.concatenate(tomas) if tomas else np.empty(0, dtype=np.int64)
+    # Cada pauta sale de un solo grupo y ya en orden, así que basta ordenar (estable) por pauta.
+    orden = np.argsort(indices, kind='stable')
+    # Los textos salen de una tabla con todos los minutos del rango, no de convertir cada toma.
+    tabla = np.datetime_as_string(np.arange(minimo, (dia_hasta + 1) * MINUTOS_DIA).astype('datetime64[m]'), unit='m')
+    textos = tabla[tomas[orden] - minimo]
+    cortes = np.cumsum(np.bincount(indices, minlength=len(pautas)))[:-1]
+    return [parte.tolist() for parte in np.split(textos, cortes)]
+
+
+def expandir_tomas(pautas, desde, hasta):
+    """
+    Calendario de tomas de varias pautas entre las fechas desde y hasta (incluidas). pautas es
+    una secuencia de (intervalo_minutos, veces_dia, dias_semana, hora_preferida, fecha_inicio,
+    fecha_fin); devuelve, en el mismo orden, la lista de tomas de cada una como texto
+    'AAAA-MM-DDTHH:MM' en hora local, con las mismas reglas que proxima_toma.
+
+    Las horas son de reloj: en un cambio de horario las tomas de ese día conservan su hora
+    nominal, sin el desplazamiento de una hora que aplica proxima_toma. Con numpy disponible se
+    calcula con aritmética de arrays sobre todas las pautas a la vez.
+    """
+    if not pautas:
+        return []
+    if np is None:
+        return _expandir_python(pautas, desde.toordinal(), hasta.toordinal())
+    return _expandir_numpy(pautas, desde.toordinal(), hasta.toordinal())
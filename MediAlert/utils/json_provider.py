@@ -0,0 +1,60 @@
+# medialert/utils/json_provider.py
+# Serialización JSON central de las respuestas: fechas y horas en ISO 8601, Decimal como texto.
+
+import decimal
+import json
+import uuid
+from datetime import date, datetime, time
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # orjson es opcional: sin él se usa el módulo json estándar.
+    orjson = None
+
+
+def serializar_valor(obj):
+    """
+    Convierte los tipos que devuelve psycopg2 y que JSON no admite.
+    date -> 'AAAA-MM-DD', time -> 'HH:MM:SS', datetime -> ISO 8601 con zona horaria.
+    """
+    if isinstance(obj, (datetime, date, time)):
+        return obj.isoformat()
+    if isinstance(obj, (decimal.Decimal, uuid.UUID)):
+        return str(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f'Objeto de tipo {type(obj).__name__} no serializable a JSON')
+
+
+class MediAlertJSONProvider(DefaultJSONProvider):
+    """
+    Proveedor JSON de la aplicación (app.json). Sustituye las conversiones de fechas fila por
+    fila que hacían los servicios: las filas de RealDictCursor se pasan tal cual a jsonify().
+    Usa orjson si está instalado; la salida es la misma que con json estándar.
+    """
+
+    sort_keys = False
+    ensure_ascii = False
+
+    def dumps(self, obj, **kwargs):
+        if orjson is not None and not kwargs.get('indent'):
+            opciones = orjson.OPT_NON_STR_KEYS
+            if kwargs.get('sort_keys', self.sort_keys):
+                opciones |= orjson.OPT_SORT_KEYS
+            return orjson.dumps(obj, default=serializar_valor, option=opciones).decode('utf-8')
+        kwargs.setdefault('default', serializar_valor)
+        kwargs.setdefault('ensure_ascii', self.ensure_ascii)
+        kwargs.setdefault('sort_keys', self.sort_keys)
+        return json.dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.loads(s)
+        return json.loads(s, **kwargs)
+
+
+def respuesta_json_texto(app, texto, status=200):
+    """Respuesta HTTP con un cuerpo que ya es JSON (p. ej. generado por PostgreSQL)."""
+    return app.response_class(texto, status=status, mimetype=app.json.mimetype)
@@ -0,0 +1,84 @@
+# medialert/utils/notification_channels.py
+# Canales de entrega de los recordatorios de la outbox (services/notification_service.py).
+# Un canal recibe una lista de notificaciones (dict con id, email, nombre, asunto y mensaje) y
+# devuelve {id: excepción} con las que no pudo entregar; el resto se dan por enviadas. Si el canal
+# lanza una excepción, todo el lote cuenta como fallido.
+
+import json
+import os
+import smtplib
+import threading
+from datetime import datetime, timezone
+from email.message import EmailMessage
+
+
+class NotificacionRechazada(Exception):
+    """Error permanente (destinatario inválido, sin email, ...): no se reintenta."""
+
+
+class FileChannel:
+    """
+    Escribe cada notificación como una línea JSON en <directorio>/notificaciones_AAAA-MM-DD.jsonl.
+    Sustituto local del correo para desarrollo y pruebas.
+    """
+
+    nombre = 'archivo'
+
+    def __init__(self, directorio):
+        self.directorio = directorio
+        self._lock = threading.Lock()
+        os.makedirs(directorio, exist_ok=True)
+
+    def enviar(self, notificaciones):
+        ahora = datetime.now(timezone.utc)
+        ruta = os.path.join(self.directorio, f"notificaciones_{ahora.date().isoformat()}.jsonl")
+        lineas = ''.join(
+            json.dumps({'id': n['id'], 'alerta_id': n['alerta_id'], 'para': n['email'], 'asunto': n['asunto'],
+                        'mensaje': n['mensaje'], 'enviada_en': ahora.isoformat()}, ensure_ascii=False) + '\n'
+            for n in notificaciones
+        )
+        # Una sola escritura en modo append: las líneas de varios procesos no se mezclan.
+        with self._lock, open(ruta, 'a', encoding='utf-8') as f:
+            f.write(lineas)
+        return {}
+
+
+class SMTPChannel:
+    """Envía un correo por notificación, usando una sola conexión SMTP para todo el lote."""
+
+    nombre = 'smtp'
+
+    def __init__(self, host, port=25, remitente='MediAlert <no-responder@medialert.co>', usuario=None,
+                 contrasena=None, starttls=False, timeout=10):
+        self.host = host
+        self.port = port
+        self.remitente = remitente
+        self.usuario = usuario
+        self.contrasena = contrasena
+        self.starttls = starttls
+        self.timeout = timeout
+
+    def enviar(self, notificaciones):
+        errores = {}
+        with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+            if self.starttls:
+                smtp.starttls()
+            if self.usuario:
+                smtp.login(self.usuario, self.contrasena)
+            for n in notificaciones:
+                if not n.get('email'):
+                    errores[n['id']] = NotificacionRechazada('El cliente no tiene email.')
+                    continue
+                mensaje = EmailMessage()
+                mensaje['From'] = self.remitente
+                mensaje['To'] = n['email']
+                mensaje['Subject'] = n['asunto']
+                mensaje.set_content(n['mensaje'])
+                try:
+                    smtp.send_message(mensaje)
+                except smtplib.SMTPRecipientsRefused as e:
+                    errores[n['id']] = NotificacionRechazada(f'Destinatario rechazado: {e.recipients}')
+                except smtplib.SMTPResponseException as e:
+                    # 5xx es definitivo; 4xx es temporal y se reintenta.
+                    errores[n['id']] = NotificacionRechazada(str(e)) if e.smtp_code >= 500 else e
+        return errores
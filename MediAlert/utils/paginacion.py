@@ -0,0 +1,84 @@
+# medialert/utils/paginacion.py
+# Cursores opacos para paginación por conjunto de claves (keyset).
+
+import base64
+import json
+from datetime import date, datetime
+
+def codificar_cursor(valores):
+    """Codifica la tupla de claves de ordenación de la última fila en un cursor opaco."""
+    serializables = [v.isoformat() if isinstance(v, (datetime, date)) else v for v in valores]
+    crudo = json.dumps(serializables, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(crudo).decode('ascii').rstrip('=')
+
+def decodificar_cursor(cursor, tipos):
+    """
+    Decodifica un cursor generado por codificar_cursor.
+    'tipos' indica cómo reconstruir cada clave (datetime, date, int, str).
+    """
+    try:
+        relleno = '=' * (-len(cursor) % 4)
+        valores = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+        if not isinstance(valores, list) or len(valores) != len(tipos):
+            raise ValueError
+        return tuple(
+            None if v is None else
+            tipo.fromisoformat(v) if tipo in (datetime, date) else tipo(v)
+            for tipo, v in zip(tipos, valores)
+        )
+    except (ValueError, TypeError):
+        raise ValueError('Cursor de paginación no válido.')
+
+def cursor_siguiente(filas, limit, claves):
+    """Devuelve el cursor de la página siguiente, o None si esta es la última."""
+    if not limit or len(filas) < limit:
+        return None
+    ultima = filas[-1]
+    return codificar_cursor([ultima[c] for c in claves])
+
+def condicion_keyset(columnas, descendente=False):
+    """Condición '(c1, c2) > (%s, %s)' ('<' si el orden es descendente) para continuar tras el cursor."""
+    marcadores = ', '.join(['%s'] * len(columnas))
+    return f"({', '.join(columnas)}) {'<' if descendente else '>'} ({marcadores})"
+
+def cursor_siguiente_orden(filas, limit, orden, claves):
+    """Como cursor_siguiente, pero el cursor lleva el nombre del orden con el que se generó."""
+    if not limit or len(filas) < limit:
+        return None
+    ultima = filas[-1]
+    return codificar_cursor([orden] + [ultima[c] for c in claves])
+
+def decodificar_cursor_orden(cursor, orden, tipos):
+    """Decodifica un cursor de cursor_siguiente_orden y verifica que sea del mismo orden."""
+    valores = decodificar_cursor(cursor, (str,) + tuple(tipos))
+    if valores[0] != orden:
+        raise ValueError('El cursor de paginación corresponde a otro orden.')
+    return valores[1:]
+
+def parse_campos(texto, permitidos):
+    """Convierte 'fields=a,b' en una tupla validada contra 'permitidos' (None si no se pidió)."""
+    if not texto:
+        return None
+    campos = tuple(dict.fromkeys(c.strip() for c in texto.split(',') if c.strip()))
+    desconocidos = [c for c in campos if c not in permitidos]
+    if desconocidos:
+        raise ValueError(f"Campos no válidos: {', '.join(desconocidos)}. Permitidos: {', '.join(permitidos)}.")
+    return campos
+
+LISTADO_LIMITE_POR_DEFECTO = 100
+LISTADO_LIMITE_MAXIMO = 500
+
+def normalizar_limite(limit, cursor=None):
+    """Límite efectivo de una página: None sin paginación, o entre 1 y LISTADO_LIMITE_MAXIMO."""
+    if not limit and not cursor:
+        return None
+    return max(1, min(int(limit or LISTADO_LIMITE_POR_DEFECTO), LISTADO_LIMITE_MAXIMO))
+
+def cabeceras_paginacion(response, filas, limit, orden, claves, total=None, total_exacto=False):
+    """Añade X-Next-Cursor y, si se pidió, X-Total-Count (exacto) o X-Total-Estimate."""
+    siguiente = cursor_siguiente_orden(filas, limit, orden, claves)
+    if siguiente:
+        response.headers['X-Next-Cursor'] = siguiente
+    if total is not None:
+        response.headers['X-Total-Count' if total_exacto else 'X-Total-Estimate'] = str(total)
+    return response
@@ -0,0 +1,69 @@
+# medialert/utils/scheduler.py
+
+import heapq
+import itertools
+
+
+class HeapScheduler:
+    """
+    Cola de vencimientos (clave -> instante) sobre un heap binario: programar y extraer cuestan
+    O(log n) y consultar el próximo vencimiento O(1), así que quien la usa puede dormir hasta ese
+    instante en lugar de revisar todas las claves en cada ciclo.
+
+    Reprogramar o cancelar una clave no busca su entrada en el heap: la marca como obsoleta
+    (cada entrada lleva un número de generación) y se descarta al llegar a la cima. Cuando las
+    obsoletas superan a las vigentes el heap se reconstruye.
+
+    No es seguro entre hilos: debe usarse desde un único hilo.
+    """
+
+    def __init__(self):
+        self._heap = []                   # (vence_en, generación, clave)
+        self._vigentes = {}               # clave -> generación
+        self._generaciones = itertools.count()
+
+    def __len__(self):
+        return len(self._vigentes)
+
+    def __contains__(self, clave):
+        return clave in self._vigentes
+
+    def programar(self, clave, vence_en):
+        """Programa (o reprograma) la clave para el instante vence_en (segundos epoch)."""
+        generacion = next(self._generaciones)
+        self._vigentes[clave] = generacion
+        heapq.heappush(self._heap, (vence_en, generacion, clave))
+        if len(self._heap) > 2 * len(self._vigentes) + 1000:
+            self._compactar()
+
+    def cancelar(self, clave):
+        self._vigentes.pop(clave, None)
+
+    def limpiar(self):
+        self._heap.clear()
+        self._vigentes.clear()
+
+    def _descartar_obsoletas(self):
+        while self._heap and self._vigentes.get(self._heap[0][2]) != self._heap[0][1]:
+            heapq.heappop(self._heap)
+
+    def proximo(self):
+        """Instante del próximo vencimiento, o None si no hay nada programado."""
+        self._descartar_obsoletas()
+        return self._heap[0][0] if self._heap else None
+
+    def extraer_vencidos(self, ahora, limite=None):
+        """Quita y devuelve [(clave, vence_en), ...] con vence_en <= ahora, en orden."""
+        vencidos = []
+        while limite is None or len(vencidos) < limite:
+            self._descartar_obsoletas()
+            if not self._heap or self._heap[0][0] > ahora:
+                break
+            vence_en, _, clave = heapq.heappop(self._heap)
+            del self._vigentes[clave]
+            vencidos.append((clave, vence_en))
+        return vencidos
+
+    def _compactar(self):
+        self._heap = [e for e in self._heap if self._vigentes.get(e[2]) == e[1]]
+        heapq.heapify(self._heap)
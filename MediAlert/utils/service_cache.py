@@ -0,0 +1,225 @@
+# medialert/utils/service_cache.py
+# Almacenes para la caché de lecturas de servicios (services/cache.py): memoria del proceso,
+# archivos locales compartidos entre procesos y Redis (opcional).
+
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time as reloj
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:  # redis es opcional: solo hace falta con SERVICE_CACHE_BACKEND = 'redis'.
+    redis = None
+
+AUSENTE = object()
+
+
+class _Metricas:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._valores = {'aciertos': 0, 'fallos': 0, 'expulsiones': 0, 'expiradas': 0, 'errores': 0}
+
+    def sumar(self, nombre, cantidad=1):
+        with self._lock:
+            self._valores[nombre] += cantidad
+
+    def copia(self):
+        with self._lock:
+            return dict(self._valores)
+
+
+class MemoryBackend:
+    """
+    LRU en memoria del proceso con caducidad por entrada. Los valores se guardan tal cual y se
+    comparten entre peticiones: quien los recibe no debe modificarlos.
+    """
+
+    nombre = 'memoria'
+
+    def __init__(self, max_entradas=1000):
+        self.max_entradas = max_entradas
+        self._lock = threading.Lock()
+        self._entradas = OrderedDict()   # clave -> (expira_en, valor)
+        self.metricas = _Metricas()
+
+    def get(self, clave):
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                self.metricas.sumar('fallos')
+                return AUSENTE
+            if entrada[0] is not None and entrada[0] <= reloj.monotonic():
+                del self._entradas[clave]
+                self.metricas.sumar('expiradas')
+                self.metricas.sumar('fallos')
+                return AUSENTE
+            self._entradas.move_to_end(clave)
+            self.metricas.sumar('aciertos')
+            return entrada[1]
+
+    def set(self, clave, valor, ttl=None):
+        expira_en = reloj.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._entradas[clave] = (expira_en, valor)
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+                self.metricas.sumar('expulsiones')
+
+    def clear(self):
+        with self._lock:
+            self._entradas.clear()
+
+    def stats(self):
+        with self._lock:
+            entradas = len(self._entradas)
+        return {'backend': self.nombre, 'entradas': entradas, 'max_entradas': self.max_entradas,
+                **self.metricas.copia()}
+
+
+class FileBackend:
+    """
+    Un archivo pickle por entrada en un directorio local, compartido por todos los procesos del
+    mismo servidor. La escritura es atómica (archivo temporal + os.replace). Cada acierto
+    actualiza la fecha de modificación del archivo, y al superar max_entradas se borran los
+    archivos usados hace más tiempo.
+    Solo debe apuntar a un directorio propio de la aplicación: se leen con pickle.
+    """
+
+    nombre = 'archivo'
+    _SUFIJO = '.cache'
+
+    def __init__(self, directorio, max_entradas=1000, revisar_cada=50):
+        self.directorio = directorio
+        self.max_entradas = max_entradas
+        self.revisar_cada = revisar_cada
+        self._escrituras = 0
+        self._lock = threading.Lock()
+        self.metricas = _Metricas()
+        os.makedirs(directorio, exist_ok=True)
+
+    def _ruta(self, clave):
+        return os.path.join(self.directorio, hashlib.sha256(clave.encode('utf-8')).hexdigest() + self._SUFIJO)
+
+    def get(self, clave):
+        ruta = self._ruta(clave)
+        try:
+            with open(ruta, 'rb') as f:
+                clave_guardada, expira_en, valor = pickle.load(f)
+        except FileNotFoundError:
+            self.metricas.sumar('fallos')
+            return AUSENTE
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+            self.metricas.sumar('errores')
+            self.metricas.sumar('fallos')
+            return AUSENTE
+        if clave_guardada != clave:
+            self.metricas.sumar('fallos')
+            return AUSENTE
+        if expira_en is not None and expira_en <= reloj.time():
+            self._borrar(ruta)
+            self.metricas.sumar('expiradas')
+            self.metricas.sumar('fallos')
+            return AUSENTE
+        try:
+            os.utime(ruta)
+        except OSError:
+            pass
+        self.metricas.sumar('aciertos')
+        return valor
+
+    def set(self, clave, valor, ttl=None):
+        expira_en = reloj.time() + ttl if ttl else None
+        descriptor, temporal = tempfile.mkstemp(dir=self.directorio, suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'wb') as f:
+                pickle.dump((clave, expira_en, valor), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporal, self._ruta(clave))
+        except Exception:
+            self._borrar(temporal)
+            raise
+        with self._lock:
+            self._escrituras += 1
+            revisar = self._escrituras % self.revisar_cada == 0
+        if revisar:
+            self._recortar()
+
+    def _archivos(self):
+        with os.scandir(self.directorio) as it:
+            return [e for e in it if e.name.endswith(self._SUFIJO)]
+
+    def _recortar(self):
+        archivos = self._archivos()
+        sobrantes = len(archivos) - self.max_entradas
+        if sobrantes <= 0:
+            return
+        def usado_en(entrada):
+            try:
+                return entrada.stat().st_mtime
+            except OSError:
+                return 0
+        for entrada in sorted(archivos, key=usado_en)[:sobrantes]:
+            self._borrar(entrada.path)
+            self.metricas.sumar('expulsiones')
+
+    @staticmethod
+    def _borrar(ruta):
+        try:
+            os.remove(ruta)
+        except OSError:
+            pass
+
+    def clear(self):
+        for entrada in self._archivos():
+            self._borrar(entrada.path)
+
+    def stats(self):
+        return {'backend': self.nombre, 'entradas': len(self._archivos()), 'max_entradas': self.max_entradas,
+                'directorio': self.directorio, **self.metricas.copia()}
+
+
+class RedisBackend:
+    """
+    Entradas en Redis (o un servidor compatible) compartidas por todos los servidores. La
+    caducidad la aplica Redis (SET ... EX) y el límite de tamaño su política maxmemory
+    (se recomienda allkeys-lru).
+    """
+
+    nombre = 'redis'
+
+    def __init__(self, url, prefijo='medialert:cache:'):
+        if redis is None:
+            raise RuntimeError("SERVICE_CACHE_BACKEND = 'redis' requiere el paquete 'redis'.")
+        self._cliente = redis.Redis.from_url(url)
+        self.prefijo = prefijo
+        self.metricas = _Metricas()
+
+    def _clave(self, clave):
+        return self.prefijo + hashlib.sha256(clave.encode('utf-8')).hexdigest()
+
+    def get(self, clave):
+        datos = self._cliente.get(self._clave(clave))
+        if datos is None:
+            self.metricas.sumar('fallos')
+            return AUSENTE
+        clave_guardada, valor = pickle.loads(datos)
+        if clave_guardada != clave:
+            self.metricas.sumar('fallos')
+            return AUSENTE
+        self.metricas.sumar('aciertos')
+        return valor
+
+    def set(self, clave, valor, ttl=None):
+        datos = pickle.dumps((clave, valor), protocol=pickle.HIGHEST_PROTOCOL)
+        self._cliente.set(self._clave(clave), datos, ex=int(ttl) if ttl else None)
+
+    def clear(self):
+        for clave in self._cliente.scan_iter(match=self.prefijo + '*'):
+            self._cliente.delete(clave)
+
+    def stats(self):
+        return {'backend': self.nombre, **self.metricas.copia()}
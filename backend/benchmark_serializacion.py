@@ -0,0 +1,144 @@
+# backend/benchmark_serializacion.py
+# Micro-benchmark de la serialización JSON de respuestas (MediAlert/utils/json_provider.py).
+#
+# Compara, sobre 10.000 filas con la forma de las recetas consolidadas:
+#   1. El bucle anterior (isoformat/str fila por fila) + el proveedor JSON por defecto de Flask.
+#   2. MediAlertJSONProvider con el módulo json estándar.
+#   3. MediAlertJSONProvider con orjson (si está instalado).
+# Con --bd además mide la consulta completa contra PostgreSQL: RealDictCursor + bucle + json
+# frente a row_to_json (JSON generado por la BD, sin dicts en Python).
+#
+# Uso: python benchmark_serializacion.py [--filas 10000] [--repeticiones 5] [--bd]
+
+import argparse
+import copy
+import os
+import sys
+import time as reloj
+from datetime import date, datetime, time, timedelta, timezone
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'MediAlert'))
+from utils import json_provider  # noqa: E402
+from utils.json_provider import MediAlertJSONProvider  # noqa: E402
+
+
+def generar_filas(n):
+    base = date(2024, 1, 1)
+    return [{
+        'alerta_id': i, 'dosis': '1 tableta', 'frecuencia': 'Cada 8 horas',
+        'fecha_inicio': base + timedelta(days=i % 365), 'fecha_fin': base + timedelta(days=i % 365 + 30),
+        'hora_preferida': time(8 + i % 12, 30), 'estado_alerta': 'activa',
+        'cliente_nombre': f'Cliente {i}', 'cliente_cedula': str(10000000 + i),
+        'cliente_fecha_nacimiento': date(1960 + i % 40, 1 + i % 12, 1 + i % 28),
+        'cliente_telefono': '3001234567', 'cliente_ciudad': 'Cúcuta',
+        'medicamento_nombre': 'Paracetamol 500mg', 'medicamento_descripcion': 'Analgésico y antipirético.',
+        'eps_nombre': 'Nueva EPS', 'eps_nit': '8301086054',
+        'asignador_nombre': 'Administrador', 'asignador_cedula': '1092526700', 'asignador_rol': 'admin',
+        'creado_en': datetime(2024, 1, 1, tzinfo=timezone.utc) + timedelta(minutes=i),
+    } for i in range(n)]
+
+
+def bucle_anterior(filas):
+    # Copia del código que tenían los servicios antes del proveedor central.
+    for receta in filas:
+        if receta.get('fecha_inicio'):
+            receta['fecha_inicio'] = receta['fecha_inicio'].isoformat()
+        if receta.get('fecha_fin'):
+            receta['fecha_fin'] = receta['fecha_fin'].isoformat()
+        if receta.get('hora_preferida'):
+            receta['hora_preferida'] = str(receta['hora_preferida'])
+        if receta.get('cliente_fecha_nacimiento'):
+            receta['cliente_fecha_nacimiento'] = receta['cliente_fecha_nacimiento'].isoformat()
+    return filas
+
+
+def medir(nombre, funcion, preparar, repeticiones):
+    tiempos, tamano = [], 0
+    for _ in range(repeticiones):
+        datos = preparar()
+        inicio = reloj.perf_counter()
+        salida = funcion(datos)
+        tiempos.append(reloj.perf_counter() - inicio)
+        tamano = len(salida)
+    print(f"{nombre:<48} mejor {min(tiempos) * 1000:8.2f} ms   media "
+          f"{sum(tiempos) / len(tiempos) * 1000:8.2f} ms   {tamano / 1024:8.1f} KiB")
+
+
+def benchmark_memoria(n, repeticiones):
+    app = Flask(__name__)
+    flask_por_defecto = DefaultJSONProvider(app)
+    proveedor = MediAlertJSONProvider(app)
+    filas = generar_filas(n)
+    preparar = lambda: copy.deepcopy(filas)  # noqa: E731
+
+    print(f"\n== Serialización en memoria ({n} filas, {repeticiones} repeticiones) ==")
+    medir('Bucle anterior + proveedor Flask por defecto',
+          lambda d: flask_por_defecto.dumps(bucle_anterior(d), separators=(',', ':')), preparar, repeticiones)
+
+    orjson = json_provider.orjson
+    json_provider.orjson = None
+    try:
+        medir('MediAlertJSONProvider (json estándar)',
+              lambda d: proveedor.dumps(d, separators=(',', ':')), preparar, repeticiones)
+    finally:
+        json_provider.orjson = orjson
+
+    if orjson is not None:
+        medir('MediAlertJSONProvider (orjson)', lambda d: proveedor.dumps(d), preparar, repeticiones)
+    else:
+        print('MediAlertJSONProvider (orjson)                   omitido: orjson no está instalado')
+
+
+def benchmark_bd(n, repeticiones):
+    import psycopg2
+    from psycopg2.extras import RealDictCursor
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    conn = psycopg2.connect(
+        host=os.getenv('PG_HOST'), database=os.getenv('PG_DB'), user=os.getenv('PG_USER'),
+        password=os.getenv('PG_PASS'), port=os.getenv('PG_PORT')
+    )
+    consulta = f"""
+        SELECT g AS alerta_id, '1 tableta' AS dosis, 'Cada 8 horas' AS frecuencia,
+               DATE '2024-01-01' + (g % 365) AS fecha_inicio, DATE '2024-01-31' + (g % 365) AS fecha_fin,
+               TIME '08:30' + (g % 12) * INTERVAL '1 hour' AS hora_preferida, 'activa' AS estado_alerta,
+               'Cliente ' || g AS cliente_nombre, (10000000 + g)::TEXT AS cliente_cedula,
+               DATE '1960-01-01' + (g % 14000) AS cliente_fecha_nacimiento,
+               'Paracetamol 500mg' AS medicamento_nombre, 'Nueva EPS' AS eps_nombre
+        FROM generate_series(1, {int(n)}) g
+    """
+    app = Flask(__name__)
+    flask_por_defecto = DefaultJSONProvider(app)
+
+    def via_dicts(_):
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(consulta)
+            return flask_por_defecto.dumps(bucle_anterior(cur.fetchall()), separators=(',', ':'))
+
+    def via_row_to_json(_):
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT row_to_json(q)::text FROM ({consulta}) q")
+            return '[' + ','.join(fila[0] for fila in cur) + ']'
+
+    print(f"\n== Consulta + serialización contra PostgreSQL ({n} filas) ==")
+    try:
+        medir('RealDictCursor + bucle anterior + json', via_dicts, lambda: None, repeticiones)
+        medir('row_to_json (fetch_rows_as_json)', via_row_to_json, lambda: None, repeticiones)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--filas', type=int, default=10000)
+    parser.add_argument('--repeticiones', type=int, default=5)
+    parser.add_argument('--bd', action='store_true', help='Medir también contra PostgreSQL (usa .env).')
+    args = parser.parse_args()
+
+    benchmark_memoria(args.filas, args.repeticiones)
+    if args.bd:
+        benchmark_bd(args.filas, args.repeticiones)
@@ -10,14 +10,72 @@ DROP TRIGGER IF EXISTS trg_usuarios_prevenir_delete_cliente ON usuarios;
 DROP TRIGGER IF EXISTS trg_medicamentos_prevenir_delete ON medicamentos;
 DROP TRIGGER IF EXISTS trg_desactivar_alertas_usuario_inactivo ON usuarios;
 DROP TRIGGER IF EXISTS trg_desactivar_alertas_medicamento_discontinuado ON medicamentos;
+DROP TRIGGER IF EXISTS trg_medicamentos_notificar_catalogo ON medicamentos;
+DROP TRIGGER IF EXISTS trg_eps_notificar_catalogo ON eps;
+DROP TRIGGER IF EXISTS trg_eps_version ON eps;
+DROP TRIGGER IF EXISTS trg_usuarios_version ON usuarios;
+DROP TRIGGER IF EXISTS trg_medicamentos_version ON medicamentos;
+DROP TRIGGER IF EXISTS trg_alertas_version ON alertas;
+DROP TRIGGER IF EXISTS trg_alertas_version_update ON alertas;
+DROP TRIGGER IF EXISTS trg_alertas_receta_snapshot_insert ON alertas;
+DROP TRIGGER IF EXISTS trg_alertas_receta_snapshot_update ON alertas;
+DROP TRIGGER IF EXISTS trg_usuarios_receta_snapshot ON usuarios;
+DROP TRIGGER IF EXISTS trg_medicamentos_receta_snapshot ON medicamentos;
+DROP TRIGGER IF EXISTS trg_eps_receta_snapshot ON eps;
+DROP TRIGGER IF EXISTS trg_alertas_contadores_insert ON alertas;
+DROP TRIGGER IF EXISTS trg_alertas_contadores_update ON alertas;
+DROP TRIGGER IF EXISTS trg_alertas_contadores_delete ON alertas;
+DROP TRIGGER IF EXISTS trg_alertas_estadisticas_insert ON alertas;
+DROP TRIGGER IF EXISTS trg_alertas_estadisticas_update ON alertas;
+DROP TRIGGER IF EXISTS trg_alertas_estadisticas_delete ON alertas;
+DROP TRIGGER IF EXISTS trg_usuarios_estadisticas_mover ON usuarios;
+DROP TRIGGER IF EXISTS trg_usuarios_estadisticas_insert ON usuarios;
+DROP TRIGGER IF EXISTS trg_usuarios_estadisticas_update ON usuarios;
+DROP TRIGGER IF EXISTS trg_usuarios_estadisticas_delete ON usuarios;
+DROP TRIGGER IF EXISTS trg_alertas_programacion_insert ON alertas;
+DROP TRIGGER IF EXISTS trg_alertas_programacion_update ON alertas;
+DROP TRIGGER IF EXISTS trg_alertas_programacion_delete ON alertas;
+DROP TRIGGER IF EXISTS trg_alertas_proxima_toma ON alertas;
+DROP TRIGGER IF EXISTS trg_eventos_toma_solo_insercion ON eventos_toma;
+DROP TRIGGER IF EXISTS trg_eventos_toma_sin_borrado ON eventos_toma;
+DROP TRIGGER IF EXISTS trg_eventos_toma_sin_truncate ON eventos_toma;
 
 DROP FUNCTION IF EXISTS sp_registrar_evento_auditoria(INTEGER, TEXT, NAME, TEXT, JSONB, JSONB, JSONB);
+DROP FUNCTION IF EXISTS sp_registrar_evento_auditoria(INTEGER, TEXT, NAME, TEXT, JSONB, JSONB, JSONB, TEXT);
 DROP FUNCTION IF EXISTS func_disparador_auditoria_generico();
+DROP FUNCTION IF EXISTS fn_crear_particiones_auditoria(INTEGER, DATE);
+DROP FUNCTION IF EXISTS fn_reconstruir_snapshot_auditoria(INTEGER);
+DROP FUNCTION IF EXISTS fn_jsonb_delta(JSONB, JSONB);
 DROP FUNCTION IF EXISTS func_prevenir_borrado_fisico_cliente();
 DROP FUNCTION IF EXISTS func_prevenir_borrado_fisico_medicamento();
+DROP FUNCTION IF EXISTS func_eventos_toma_solo_insercion();
 DROP FUNCTION IF EXISTS func_desactivar_alertas_usuario_inactivo();
 DROP FUNCTION IF EXISTS func_desactivar_alertas_medicamento_discontinuado();
+DROP FUNCTION IF EXISTS func_notificar_cambio_catalogo();
+DROP FUNCTION IF EXISTS func_notificar_cambio_alerta();
+DROP FUNCTION IF EXISTS func_alertas_proxima_toma();
+DROP FUNCTION IF EXISTS fn_proxima_toma(INTEGER, SMALLINT, SMALLINT, TIME, DATE, DATE, TIMESTAMPTZ, TEXT);
+DROP FUNCTION IF EXISTS func_incrementar_version_tabla();
+DROP FUNCTION IF EXISTS func_incrementar_version_alertas_update();
+DROP FUNCTION IF EXISTS fn_refrescar_receta_snapshot(INTEGER[]);
+DROP FUNCTION IF EXISTS func_receta_snapshot_alertas();
+DROP FUNCTION IF EXISTS func_receta_snapshot_dependencias();
+DROP FUNCTION IF EXISTS func_contadores_alertas_cliente();
+DROP FUNCTION IF EXISTS fn_recalcular_contadores_alertas_cliente();
+DROP FUNCTION IF EXISTS func_estadisticas_alertas();
+DROP FUNCTION IF EXISTS func_estadisticas_usuario_mover();
+DROP FUNCTION IF EXISTS func_estadisticas_clientes();
+DROP FUNCTION IF EXISTS fn_recalcular_estadisticas();
 
+DROP VIEW IF EXISTS vista_receta;
+DROP VIEW IF EXISTS vista_estadisticas;
+
+DROP TABLE IF EXISTS eventos_toma CASCADE;
+DROP TABLE IF EXISTS notificaciones_outbox CASCADE;
+DROP TABLE IF EXISTS estadisticas_rollup CASCADE;
+DROP TABLE IF EXISTS contadores_alertas_cliente CASCADE;
+DROP TABLE IF EXISTS receta_snapshot CASCADE;
+DROP TABLE IF EXISTS versiones_tabla CASCADE;
 DROP TABLE IF EXISTS reportes_log CASCADE;
 DROP TABLE IF EXISTS auditoria CASCADE;
 DROP TABLE IF EXISTS alertas CASCADE;
@@ -26,10 +84,12 @@ DROP TABLE IF EXISTS usuarios CASCADE;
 DROP TABLE IF EXISTS eps CASCADE;
 
 DROP SEQUENCE IF EXISTS eps_id_seq;
+DROP SEQUENCE IF EXISTS versiones_tabla_seq;
 DROP SEQUENCE IF EXISTS usuarios_id_seq;
 DROP SEQUENCE IF EXISTS medicamentos_id_seq;
 DROP SEQUENCE IF EXISTS alertas_id_seq;
 DROP SEQUENCE IF EXISTS reportes_log_id_seq;
+DROP SEQUENCE IF EXISTS notificaciones_outbox_id_seq;
 DROP SEQUENCE IF EXISTS auditoria_id_seq;
 
 
@@ -40,6 +100,12 @@ CREATE SEQUENCE medicamentos_id_seq START WITH 1 INCREMENT BY 1;
 CREATE SEQUENCE alertas_id_seq START WITH 1 INCREMENT BY 1;
 CREATE SEQUENCE auditoria_id_seq START WITH 1 INCREMENT BY 1;
 CREATE SEQUENCE reportes_log_id_seq START WITH 1 INCREMENT BY 1;
+CREATE SEQUENCE notificaciones_outbox_id_seq START WITH 1 INCREMENT BY 1;
+-- Valores de versiones_tabla. Arranca en el instante de creación (ms) para que al recrear la BD
+-- no se repitan versiones antiguas; nextval no se deshace con ROLLBACK, así que una versión
+-- nunca se reutiliza para otro estado de los datos.
+CREATE SEQUENCE versiones_tabla_seq;
+SELECT setval('versiones_tabla_seq', (extract(epoch FROM clock_timestamp()) * 1000)::BIGINT);
 
 
 -- ** SECCIÓN 3: CREACIÓN DE TABLAS **
@@ -92,23 +158,44 @@ CREATE TABLE alertas (
     ultima_notificacion_enviada TIMESTAMP WITH TIME ZONE,
     estado VARCHAR(20) DEFAULT 'activa' NOT NULL CHECK (estado IN ('activa', 'inactiva', 'completada', 'fallida')),
     asignado_por_usuario_id INTEGER,
+    -- frecuencia interpretada por la aplicación (utils/frecuencia.py). NULL si no se reconoce o si
+    -- se cambió frecuencia sin ellos; 'flask frecuencias-normalizar' rellena los pendientes.
+    frecuencia_intervalo_min INTEGER CHECK (frecuencia_intervalo_min > 0),
+    frecuencia_veces_dia SMALLINT CHECK (frecuencia_veces_dia > 0),
+    frecuencia_dias_semana SMALLINT CHECK (frecuencia_dias_semana BETWEEN 1 AND 127),
+    -- Próxima toma aún no notificada; la mantiene trg_alertas_proxima_toma (NULL si no aplica).
+    proxima_toma TIMESTAMP WITH TIME ZONE,
+    -- Última toma que el programador de recordatorios dejó en notificaciones_outbox.
+    ultima_toma_encolada TIMESTAMP WITH TIME ZONE,
     CONSTRAINT fk_alertas_usuario FOREIGN KEY (usuario_id) REFERENCES usuarios(id) ON DELETE CASCADE,
     CONSTRAINT fk_alertas_medicamento FOREIGN KEY (medicamento_id) REFERENCES medicamentos(id) ON DELETE CASCADE,
     CONSTRAINT fk_alertas_asignador FOREIGN KEY (asignado_por_usuario_id) REFERENCES usuarios(id) ON DELETE SET NULL
 );
 
+-- Tabla particionada por mes (RANGE sobre fecha_hora, meses en UTC). Las particiones se llaman
+-- auditoria_AAAA_MM y se crean por adelantado con fn_crear_particiones_auditoria(); el comando
+-- 'flask auditoria-mantenimiento' crea las futuras y archiva/separa las que superan la retención.
+-- Si el mantenimiento no creó a tiempo la partición de un mes, las filas caen en auditoria_default
+-- y la siguiente ejecución las mueve a su partición.
 CREATE TABLE auditoria (
-    id INTEGER PRIMARY KEY DEFAULT nextval('auditoria_id_seq'),
+    id INTEGER NOT NULL DEFAULT nextval('auditoria_id_seq'),
     usuario_id_app INTEGER,
     usuario_db NAME DEFAULT current_user,
     accion TEXT NOT NULL,
     tabla_afectada NAME,
     registro_id_afectado TEXT,
+    -- Filas de trigger: INSERT guarda la fila nueva completa y DELETE la anterior completa;
+    -- UPDATE guarda solo las columnas modificadas (valores antes/después).
+    -- fn_reconstruir_snapshot_auditoria() rehace las filas completas cuando se necesitan.
     datos_anteriores JSONB,
     datos_nuevos JSONB,
     detalles_adicionales JSONB,
-    fecha_hora TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
-);
+    operacion TEXT, -- INSERT/UPDATE/DELETE en filas generadas por trigger; NULL en eventos de aplicación
+    fecha_hora TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, fecha_hora)
+) PARTITION BY RANGE (fecha_hora);
+
+CREATE TABLE auditoria_default PARTITION OF auditoria DEFAULT;
 
 CREATE TABLE reportes_log (
     id INTEGER PRIMARY KEY DEFAULT nextval('reportes_log_id_seq'),
@@ -120,30 +207,210 @@ CREATE TABLE reportes_log (
     CONSTRAINT fk_reportes_log_usuario FOREIGN KEY (generado_por_usuario_id) REFERENCES usuarios(id) ON DELETE SET NULL
 );
 
+-- Recordatorios pendientes de entregar, uno por toma y canal. El programador los inserta y los
+-- procesos 'flask notificaciones-worker' los reclaman por lotes con FOR UPDATE SKIP LOCKED.
+-- estado: 'pendiente' (en cola o esperando reintento hasta disponible_en), 'enviada',
+-- 'fallida' (agotó los intentos o el canal la rechazó: cola de fallidas) o 'cancelada'
+-- (la alerta dejó de estar activa antes del envío).
+CREATE TABLE notificaciones_outbox (
+    id BIGINT PRIMARY KEY DEFAULT nextval('notificaciones_outbox_id_seq'),
+    alerta_id INTEGER NOT NULL,
+    canal VARCHAR(20) NOT NULL,
+    programada_para TIMESTAMP WITH TIME ZONE NOT NULL,
+    estado VARCHAR(15) DEFAULT 'pendiente' NOT NULL CHECK (estado IN ('pendiente', 'enviada', 'fallida', 'cancelada')),
+    intentos SMALLINT DEFAULT 0 NOT NULL,
+    disponible_en TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP NOT NULL,
+    creada_en TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP NOT NULL,
+    procesada_en TIMESTAMP WITH TIME ZONE,
+    ultimo_error TEXT,
+    CONSTRAINT fk_notificaciones_outbox_alerta FOREIGN KEY (alerta_id) REFERENCES alertas(id) ON DELETE CASCADE,
+    CONSTRAINT uq_notificaciones_outbox_toma UNIQUE (alerta_id, programada_para, canal)
+);
+
+-- Confirmaciones del paciente: tomó (tipo 1) u omitió (tipo 2) la toma programada_para de una
+-- alerta; registrado_en es cuándo lo indicó. Solo se insertan filas (func_eventos_toma_solo_insercion):
+-- una corrección es un evento nuevo y vale el último de cada toma. Sin id ni columnas de texto para
+-- que la fila sea pequeña; las columnas de 8 bytes van primero para no desperdiciar alineación.
+-- La API las escribe por lotes (services/dose_event_service.py). Un mismo evento (alerta, toma,
+-- tipo e instante de registro) se guarda una sola vez: los reenvíos del cliente no lo duplican.
+CREATE TABLE eventos_toma (
+    programada_para TIMESTAMP WITH TIME ZONE NOT NULL,
+    registrado_en TIMESTAMP WITH TIME ZONE NOT NULL,
+    alerta_id INTEGER NOT NULL,
+    tipo SMALLINT NOT NULL CHECK (tipo IN (1, 2)),
+    CONSTRAINT fk_eventos_toma_alerta FOREIGN KEY (alerta_id) REFERENCES alertas(id) ON DELETE CASCADE,
+    CONSTRAINT uq_eventos_toma_evento UNIQUE (alerta_id, programada_para, tipo, registrado_en)
+);
+
+-- Versión de cambios por tabla, incrementada por func_incrementar_version_tabla() en cada sentencia
+-- que modifica la tabla. La API la usa para los ETag de los listados (utils/decorators.py) y
+-- como parte de la clave de la caché de servicios (services/cache.py).
+CREATE TABLE versiones_tabla (
+    tabla NAME PRIMARY KEY,
+    version BIGINT NOT NULL
+);
+INSERT INTO versiones_tabla (tabla, version)
+SELECT t, nextval('versiones_tabla_seq')
+FROM unnest(ARRAY['eps', 'usuarios', 'medicamentos', 'alertas']::NAME[]) AS t;
+
+-- Copia desnormalizada de los datos de la receta de cada alerta (alerta, cliente, medicamento, EPS
+-- y quién la asignó), para servir las recetas con una lectura por clave primaria. La mantienen
+-- los triggers *_receta_snapshot a partir de vista_receta; 'flask receta-snapshot-verificar'
+-- detecta (y con --reparar corrige) diferencias entre ambas.
+CREATE TABLE receta_snapshot (
+    alerta_id INTEGER PRIMARY KEY,
+    usuario_id INTEGER NOT NULL,
+    medicamento_id INTEGER NOT NULL,
+    asignado_por_usuario_id INTEGER,
+    eps_id INTEGER,
+    estado_alerta VARCHAR(20) NOT NULL,
+    medicamento_estado VARCHAR(15) NOT NULL,
+    medicamento_nombre VARCHAR(150) NOT NULL,
+    datos JSONB NOT NULL,
+    actualizado_en TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT fk_receta_snapshot_alerta FOREIGN KEY (alerta_id) REFERENCES alertas(id) ON DELETE CASCADE
+);
+
+-- Alertas activas y totales de cada cliente, mantenidas por los triggers *_contadores de alertas
+-- (vista agrupada por cliente de la administración). Un cliente sin alertas puede no tener fila.
+CREATE TABLE contadores_alertas_cliente (
+    usuario_id INTEGER PRIMARY KEY,
+    alertas_activas INTEGER NOT NULL DEFAULT 0,
+    alertas_total INTEGER NOT NULL DEFAULT 0,
+    CONSTRAINT fk_contadores_alertas_usuario FOREIGN KEY (usuario_id) REFERENCES usuarios(id) ON DELETE CASCADE
+);
+
+-- Conteos agregados para /api/admin/estadisticas, mantenidos por los triggers *_estadisticas.
+-- dimension: 'alertas_estado' (clave = estado), 'alertas_medicamento' (medicamento_id),
+-- 'alertas_eps' (eps_id del cliente), 'alertas_ciudad' (ciudad del cliente) y
+-- 'clientes_registro_dia' (fecha_registro de los clientes; activas = clientes activos).
+-- Una clave '' representa NULL. La definición en vivo está en vista_estadisticas.
+CREATE TABLE estadisticas_rollup (
+    dimension VARCHAR(30) NOT NULL,
+    clave TEXT NOT NULL,
+    total BIGINT NOT NULL DEFAULT 0,
+    activas BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (dimension, clave)
+);
+
 
 -- ** SECCIÓN 4: ÍNDICES **
 CREATE INDEX idx_usuarios_eps_id ON usuarios(eps_id);
-CREATE INDEX idx_alertas_usuario_id ON alertas(usuario_id);
+-- También cubre el orden 'fecha_inicio' del listado paginado de alertas de un cliente.
+CREATE INDEX idx_alertas_usuario_id ON alertas(usuario_id, fecha_inicio, id);
 CREATE INDEX idx_alertas_medicamento_id ON alertas(medicamento_id);
 CREATE INDEX idx_alertas_asignado_por_id ON alertas(asignado_por_usuario_id);
 CREATE INDEX idx_reportes_log_generado_por_id ON reportes_log(generado_por_usuario_id);
 CREATE INDEX idx_usuarios_email ON usuarios(email);
+-- Búsqueda de usuarios (services/search_service.py): prefijos de cédula y nombre sin pg_trgm,
+-- y subcadenas/similitud con índices GIN de trigramas cuando la extensión está disponible.
+CREATE INDEX idx_usuarios_cedula_prefijo ON usuarios(cedula varchar_pattern_ops);
+CREATE INDEX idx_usuarios_nombre_prefijo ON usuarios(lower(nombre) text_pattern_ops);
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm') THEN
+        CREATE EXTENSION IF NOT EXISTS pg_trgm;
+        CREATE INDEX idx_usuarios_nombre_trgm ON usuarios USING gin (nombre gin_trgm_ops);
+        CREATE INDEX idx_usuarios_cedula_trgm ON usuarios USING gin (cedula gin_trgm_ops);
+    ELSE
+        RAISE NOTICE 'pg_trgm no está instalado: la búsqueda de usuarios usará solo índices de prefijo.';
+    END IF;
+END;
+$$;
 CREATE INDEX idx_alertas_estado ON alertas(estado);
+-- Órdenes de la paginación de usuarios y alertas (ORDENES_USUARIOS / ORDENES_ALERTAS).
+CREATE INDEX idx_usuarios_rol_nombre ON usuarios(rol, nombre, id);
+CREATE INDEX idx_usuarios_rol_cedula ON usuarios(rol, cedula);
+CREATE INDEX idx_usuarios_rol_id ON usuarios(rol, id);
+CREATE INDEX idx_alertas_fecha_inicio_id ON alertas(fecha_inicio, id);
+-- Alertas que vencen en una ventana de tiempo (programador de recordatorios, /admin/alertas/proximas).
+CREATE INDEX idx_alertas_proxima_toma ON alertas(proxima_toma, id) WHERE proxima_toma IS NOT NULL;
+-- Cola de la outbox: solo las pendientes, en el orden en que los workers las reclaman.
+CREATE INDEX idx_notificaciones_outbox_pendientes ON notificaciones_outbox(disponible_en, id) WHERE estado = 'pendiente';
+CREATE INDEX idx_notificaciones_outbox_procesada ON notificaciones_outbox(procesada_en) WHERE procesada_en IS NOT NULL;
+-- Eventos de toma por fecha de registro: al solo insertarse en orden aproximado de registrado_en,
+-- un índice BRIN ocupa unas pocas páginas. Las búsquedas por alerta (adherencia, borrado en
+-- cascada) usan el índice de uq_eventos_toma_evento.
+CREATE INDEX idx_eventos_toma_registrado_brin ON eventos_toma USING BRIN (registrado_en);
+-- Recetas consolidadas de un cliente y propagación de cambios de usuarios/EPS a sus recetas.
+CREATE INDEX idx_receta_snapshot_usuario ON receta_snapshot(usuario_id, medicamento_nombre)
+    WHERE estado_alerta = 'activa' AND medicamento_estado = 'disponible';
+CREATE INDEX idx_receta_snapshot_usuario_id ON receta_snapshot(usuario_id);
+CREATE INDEX idx_receta_snapshot_eps_id ON receta_snapshot(eps_id);
+-- Índices de la auditoría alineados con la paginación por (fecha_hora, id) y sus filtros.
+CREATE INDEX idx_auditoria_fecha_hora_id ON auditoria(fecha_hora, id);
+CREATE INDEX idx_auditoria_accion_fecha_hora ON auditoria(accion, fecha_hora, id);
+CREATE INDEX idx_auditoria_registro_fecha_hora ON auditoria(tabla_afectada, registro_id_afectado, fecha_hora, id);
+CREATE INDEX idx_auditoria_usuario_fecha_hora ON auditoria(usuario_id_app, fecha_hora, id);
 
 
 -- ** SECCIÓN 5: FUNCIONES Y LÓGICA DE NEGOCIO **
+CREATE OR REPLACE FUNCTION fn_crear_particiones_auditoria(
+    p_meses_adelante INTEGER DEFAULT 3,
+    p_desde DATE DEFAULT (CURRENT_TIMESTAMP AT TIME ZONE 'UTC')::DATE
+) RETURNS INTEGER LANGUAGE plpgsql SECURITY DEFINER AS $$
+DECLARE
+    v_inicio DATE := date_trunc('month', p_desde)::DATE;
+    v_fin DATE;
+    v_nombre TEXT;
+    v_creadas INTEGER := 0;
+BEGIN
+    FOR i IN 0..p_meses_adelante LOOP
+        v_fin := (v_inicio + INTERVAL '1 month')::DATE;
+        v_nombre := 'auditoria_' || to_char(v_inicio, 'YYYY_MM');
+        IF to_regclass(v_nombre) IS NULL THEN
+            IF EXISTS (SELECT 1 FROM auditoria_default
+                       WHERE fecha_hora >= v_inicio::TIMESTAMP AT TIME ZONE 'UTC'
+                         AND fecha_hora < v_fin::TIMESTAMP AT TIME ZONE 'UTC') THEN
+                -- El mes ya tiene filas en la partición por defecto: se crea la tabla suelta, se
+                -- mueven las filas y se adjunta (crearla como partición fallaría).
+                EXECUTE format('CREATE TABLE %I (LIKE auditoria INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', v_nombre);
+                EXECUTE format(
+                    'WITH movidas AS (DELETE FROM auditoria_default WHERE fecha_hora >= %L AND fecha_hora < %L RETURNING *) '
+                    'INSERT INTO %I SELECT * FROM movidas',
+                    v_inicio::TIMESTAMP AT TIME ZONE 'UTC', v_fin::TIMESTAMP AT TIME ZONE 'UTC', v_nombre
+                );
+                EXECUTE format(
+                    'ALTER TABLE auditoria ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                    v_nombre, v_inicio::TIMESTAMP AT TIME ZONE 'UTC', v_fin::TIMESTAMP AT TIME ZONE 'UTC'
+                );
+            ELSE
+                EXECUTE format(
+                    'CREATE TABLE %I PARTITION OF auditoria FOR VALUES FROM (%L) TO (%L)',
+                    v_nombre,
+                    v_inicio::TIMESTAMP AT TIME ZONE 'UTC',
+                    v_fin::TIMESTAMP AT TIME ZONE 'UTC'
+                );
+            END IF;
+            v_creadas := v_creadas + 1;
+        END IF;
+        v_inicio := v_fin;
+    END LOOP;
+    RETURN v_creadas;
+END;
+$$;
+
+-- Claves de p_b cuyo valor difiere del de p_a (o que p_a no tiene), con los valores de p_b.
+CREATE OR REPLACE FUNCTION fn_jsonb_delta(p_a JSONB, p_b JSONB)
+RETURNS JSONB LANGUAGE sql IMMUTABLE AS $$
+    SELECT COALESCE(jsonb_object_agg(n.key, n.value), '{}'::JSONB)
+    FROM jsonb_each(p_b) AS n
+    WHERE p_a -> n.key IS DISTINCT FROM n.value;
+$$;
+
 CREATE OR REPLACE FUNCTION sp_registrar_evento_auditoria(
     p_usuario_id_app INTEGER, p_accion TEXT, p_tabla_afectada NAME DEFAULT NULL,
     p_registro_id_afectado TEXT DEFAULT NULL, p_datos_anteriores JSONB DEFAULT NULL,
-    p_datos_nuevos JSONB DEFAULT NULL, p_detalles_adicionales JSONB DEFAULT NULL
+    p_datos_nuevos JSONB DEFAULT NULL, p_detalles_adicionales JSONB DEFAULT NULL,
+    p_operacion TEXT DEFAULT NULL
 ) RETURNS VOID LANGUAGE plpgsql SECURITY DEFINER AS $$
 BEGIN
     INSERT INTO auditoria (
         usuario_id_app, accion, tabla_afectada, registro_id_afectado,
-        datos_anteriores, datos_nuevos, detalles_adicionales
+        datos_anteriores, datos_nuevos, detalles_adicionales, operacion
     ) VALUES (
         p_usuario_id_app, p_accion, p_tabla_afectada, p_registro_id_afectado,
-        p_datos_anteriores, p_datos_nuevos, p_detalles_adicionales
+        p_datos_anteriores, p_datos_nuevos, p_detalles_adicionales, p_operacion
     );
 END;
 $$;
@@ -155,6 +422,8 @@ DECLARE
     v_registro_id_afectado TEXT;
     v_datos_anteriores JSONB := NULL;
     v_datos_nuevos JSONB := NULL;
+    v_accion TEXT := TG_OP::TEXT;
+    v_detalles_adicionales JSONB := NULL;
 BEGIN
     BEGIN
         v_usuario_id_app := current_setting('medialert.app_user_id', true)::INTEGER;
@@ -162,13 +431,28 @@ BEGIN
         v_usuario_id_app := NULL;
     END;
 
+    -- Modo de auditoría unificado: la aplicación anota en la transacción la acción semántica
+    -- (p. ej. 'EDICION_ALERTA') y sus detalles para la tabla que va a modificar, y este trigger
+    -- los registra en su propia fila en lugar de que la aplicación escriba una segunda.
+    IF current_setting('medialert.app_tabla', true) = TG_TABLE_NAME::TEXT THEN
+        v_accion := COALESCE(NULLIF(current_setting('medialert.app_accion', true), ''), v_accion);
+        v_detalles_adicionales := NULLIF(current_setting('medialert.app_detalles', true), '')::JSONB;
+    END IF;
+
     IF (TG_OP = 'INSERT') THEN
         v_datos_nuevos := to_jsonb(NEW);
         v_registro_id_afectado := NEW.id::TEXT;
     ELSIF (TG_OP = 'UPDATE') THEN
-        v_datos_anteriores := to_jsonb(OLD);
-        v_datos_nuevos := to_jsonb(NEW);
+        -- Formato delta: solo las columnas que cambiaron.
+        v_datos_anteriores := fn_jsonb_delta(to_jsonb(NEW), to_jsonb(OLD));
+        v_datos_nuevos := fn_jsonb_delta(to_jsonb(OLD), to_jsonb(NEW));
         v_registro_id_afectado := NEW.id::TEXT;
+        -- Las columnas derivadas de alertas (marcas del programador de recordatorios y de los envíos,
+        -- próxima toma y frecuencia estructurada) no son cambios de datos y solo ellas no se auditan.
+        IF v_datos_nuevos <> '{}'::JSONB AND v_datos_nuevos - ARRAY['ultima_notificacion_enviada', 'ultima_toma_encolada',
+               'proxima_toma', 'frecuencia_intervalo_min', 'frecuencia_veces_dia', 'frecuencia_dias_semana'] = '{}'::JSONB THEN
+            RETURN NEW;
+        END IF;
     ELSIF (TG_OP = 'DELETE') THEN
         v_datos_anteriores := to_jsonb(OLD);
         v_registro_id_afectado := OLD.id::TEXT;
@@ -176,16 +460,75 @@ BEGIN
 
     PERFORM sp_registrar_evento_auditoria(
         p_usuario_id_app       := v_usuario_id_app,
-        p_accion               := TG_OP::TEXT,
+        p_accion               := v_accion,
         p_tabla_afectada       := TG_TABLE_NAME::NAME,
         p_registro_id_afectado := v_registro_id_afectado,
         p_datos_anteriores     := v_datos_anteriores,
-        p_datos_nuevos         := v_datos_nuevos
+        p_datos_nuevos         := v_datos_nuevos,
+        p_detalles_adicionales := v_detalles_adicionales,
+        p_operacion            := TG_OP::TEXT
     );
     RETURN COALESCE(NEW, OLD);
 END;
 $$;
 
+-- Reconstruye las filas completas antes/después de una entrada de auditoría generada por trigger.
+-- Parte del estado actual de la fila (o de la copia completa de su DELETE) y deshace hacia atrás,
+-- en orden de id (fecha_hora es el inicio de la transacción y no siempre refleja el orden de
+-- escritura), los UPDATE posteriores a la entrada pedida. Así funciona aunque el INSERT
+-- original ya se haya archivado con su partición.
+-- Nunca devuelve el hash de contrasena. Las columnas derivadas de alertas (ultima_notificacion_enviada,
+-- ultima_toma_encolada, proxima_toma y la frecuencia estructurada) no se auditan cuando cambian
+-- solas, así que su historia no se puede rehacer: en una fila reconstruida solo aparecen si la
+-- propia entrada las registró, con el valor guardado en ella.
+CREATE OR REPLACE FUNCTION fn_reconstruir_snapshot_auditoria(p_auditoria_id INTEGER)
+RETURNS TABLE (datos_anteriores JSONB, datos_nuevos JSONB)
+LANGUAGE plpgsql STABLE SECURITY DEFINER AS $$
+DECLARE
+    v_entrada auditoria%ROWTYPE;
+    v_posterior RECORD;
+    v_estado JSONB;
+    v_excluidas TEXT[] := ARRAY['contrasena', 'ultima_notificacion_enviada', 'ultima_toma_encolada', 'proxima_toma',
+                                'frecuencia_intervalo_min', 'frecuencia_veces_dia', 'frecuencia_dias_semana'];
+BEGIN
+    SELECT * INTO v_entrada FROM auditoria WHERE id = p_auditoria_id;
+    IF NOT FOUND THEN
+        RETURN;
+    END IF;
+
+    -- Eventos de aplicación y filas completas (INSERT/DELETE) se devuelven tal cual.
+    IF v_entrada.operacion IS DISTINCT FROM 'UPDATE' THEN
+        RETURN QUERY SELECT v_entrada.datos_anteriores - 'contrasena', v_entrada.datos_nuevos - 'contrasena';
+        RETURN;
+    END IF;
+
+    EXECUTE format('SELECT to_jsonb(t) FROM %I t WHERE t.id = $1::INTEGER', v_entrada.tabla_afectada)
+        INTO v_estado USING v_entrada.registro_id_afectado;
+
+    FOR v_posterior IN
+        SELECT a.operacion, a.datos_anteriores FROM auditoria a
+        WHERE a.tabla_afectada = v_entrada.tabla_afectada
+          AND a.registro_id_afectado = v_entrada.registro_id_afectado
+          AND a.id > v_entrada.id
+          AND a.operacion IS NOT NULL
+        ORDER BY a.id DESC
+    LOOP
+        IF v_posterior.operacion = 'DELETE' THEN
+            v_estado := v_posterior.datos_anteriores;
+        ELSIF v_posterior.operacion = 'UPDATE' THEN
+            v_estado := v_estado || v_posterior.datos_anteriores;
+        ELSE
+            -- Un INSERT posterior con el mismo id implica que el registro se recreó.
+            v_estado := NULL;
+        END IF;
+    END LOOP;
+
+    v_estado := v_estado - v_excluidas;
+    RETURN QUERY SELECT v_estado || v_entrada.datos_anteriores - 'contrasena',
+                        v_estado || v_entrada.datos_nuevos - 'contrasena';
+END;
+$$;
+
 CREATE OR REPLACE FUNCTION func_prevenir_borrado_fisico_cliente()
 RETURNS TRIGGER LANGUAGE plpgsql SECURITY DEFINER AS $$
 BEGIN
@@ -205,6 +548,20 @@ BEGIN
 END;
 $$;
 
+-- eventos_toma es de solo inserción: un evento equivocado se corrige registrando otro. Rechaza
+-- UPDATE, TRUNCATE y los DELETE directos; solo se borran filas junto con su alerta (el borrado en
+-- cascada de la clave foránea lo ejecuta un trigger de alertas, así que llega con
+-- pg_trigger_depth() > 1).
+CREATE OR REPLACE FUNCTION func_eventos_toma_solo_insercion()
+RETURNS TRIGGER LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'DELETE' AND pg_trigger_depth() > 1 THEN
+        RETURN OLD;
+    END IF;
+    RAISE EXCEPTION 'Los eventos de toma no se modifican ni se borran: registre un evento nuevo.';
+END;
+$$;
+
 CREATE OR REPLACE FUNCTION func_desactivar_alertas_usuario_inactivo()
 RETURNS TRIGGER LANGUAGE plpgsql SECURITY DEFINER AS $$
 BEGIN
@@ -225,6 +582,529 @@ BEGIN
 END;
 $$;
 
+-- Avisa a las cachés de catálogos de la aplicación (canal 'medialert_catalogos', carga = tabla).
+-- NOTIFY se entrega solo al confirmar la transacción y los avisos repetidos se agrupan.
+CREATE OR REPLACE FUNCTION func_notificar_cambio_catalogo()
+RETURNS TRIGGER LANGUAGE plpgsql AS $$
+BEGIN
+    PERFORM pg_notify('medialert_catalogos', TG_TABLE_NAME::TEXT);
+    RETURN NULL;
+END;
+$$;
+
+-- Primera toma estrictamente posterior a p_despues_de según la frecuencia estructurada, o NULL
+-- si la pauta ya terminó. Es la misma regla que proxima_toma() de utils/frecuencia.py: tomas desde
+-- fecha_inicio a la hora preferida (08:00 si no hay) en la zona p_zona y hasta el final de
+-- fecha_fin; con veces_dia se repiten cada día permitido por la máscara (bit 0 = lunes) y sin
+-- él cada intervalo desde la primera toma.
+CREATE OR REPLACE FUNCTION fn_proxima_toma(
+    p_intervalo_min INTEGER, p_veces_dia SMALLINT, p_dias_semana SMALLINT, p_hora TIME,
+    p_fecha_inicio DATE, p_fecha_fin DATE, p_despues_de TIMESTAMPTZ, p_zona TEXT
+)
+RETURNS TIMESTAMPTZ LANGUAGE plpgsql STABLE AS $$
+DECLARE
+    v_hora TIME := COALESCE(p_hora, TIME '08:00');
+    v_ancla TIMESTAMPTZ := (p_fecha_inicio + v_hora) AT TIME ZONE p_zona;
+    v_dia DATE;
+    v_base TIMESTAMPTZ;
+    v_i BIGINT;
+    v_candidata TIMESTAMPTZ;
+BEGIN
+    IF p_intervalo_min IS NULL OR p_fecha_inicio IS NULL OR p_despues_de IS NULL THEN
+        RETURN NULL;
+    END IF;
+
+    IF p_veces_dia IS NULL THEN
+        IF p_despues_de < v_ancla THEN
+            v_candidata := v_ancla;
+        ELSE
+            v_i := floor(extract(epoch FROM p_despues_de - v_ancla) / (p_intervalo_min * 60)) + 1;
+            v_candidata := v_ancla + make_interval(mins => (v_i * p_intervalo_min)::INTEGER);
+        END IF;
+    ELSE
+        -- Se empieza el día anterior: las tomas de ese día pueden pasar de la medianoche.
+        v_dia := GREATEST(p_fecha_inicio, (p_despues_de AT TIME ZONE p_zona)::DATE - 1);
+        FOR v_n IN 1..9 LOOP
+            IF (COALESCE(p_dias_semana, 127)::INTEGER >> (EXTRACT(ISODOW FROM v_dia)::INTEGER - 1)) & 1 = 1 THEN
+                v_base := (v_dia + v_hora) AT TIME ZONE p_zona;
+                v_i := CASE WHEN p_despues_de < v_base THEN 0
+                            ELSE floor(extract(epoch FROM p_despues_de - v_base) / (p_intervalo_min * 60)) + 1 END;
+                IF v_i < p_veces_dia THEN
+                    v_candidata := v_base + make_interval(mins => (v_i * p_intervalo_min)::INTEGER);
+                    EXIT;
+                END IF;
+            END IF;
+            v_dia := v_dia + 1;
+        END LOOP;
+    END IF;
+
+    IF v_candidata IS NULL OR (p_fecha_fin IS NOT NULL AND v_candidata >= (p_fecha_fin + 1)::TIMESTAMP AT TIME ZONE p_zona) THEN
+        RETURN NULL;
+    END IF;
+    RETURN v_candidata;
+END;
+$$;
+
+-- Mantiene alertas.proxima_toma: la próxima toma posterior a la última encolada o enviada y al
+-- momento de la escritura (una alerta editada no reclama tomas ya pasadas). Solo se recalcula si
+-- cambia algo de la programación, ultima_toma_encolada o ultima_notificacion_enviada. La zona horaria es la de la configuración
+-- 'medialert.zona_horaria' (ALTER DATABASE ... SET medialert.zona_horaria = '...'), que debe
+-- coincidir con RECORDATORIOS_ZONA_HORARIA de la aplicación; por defecto America/Bogota.
+CREATE OR REPLACE FUNCTION func_alertas_proxima_toma()
+RETURNS TRIGGER LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' THEN
+        IF NEW.frecuencia IS DISTINCT FROM OLD.frecuencia
+           AND COALESCE(current_setting('medialert.frecuencia_normalizada', true), '') <> '1' THEN
+            -- frecuencia cambió en una escritura que no calculó sus campos estructurados (fuera de
+            -- la aplicación, que marca las suyas con medialert.frecuencia_normalizada): se anulan
+            -- para no programar con la pauta anterior y quedan pendientes de normalizar.
+            NEW.frecuencia_intervalo_min := NULL;
+            NEW.frecuencia_veces_dia := NULL;
+            NEW.frecuencia_dias_semana := NULL;
+        ELSIF (NEW.frecuencia_intervalo_min, NEW.frecuencia_veces_dia, NEW.frecuencia_dias_semana, NEW.hora_preferida,
+               NEW.fecha_inicio, NEW.fecha_fin, NEW.estado, NEW.ultima_notificacion_enviada, NEW.ultima_toma_encolada)
+              IS NOT DISTINCT FROM
+              (OLD.frecuencia_intervalo_min, OLD.frecuencia_veces_dia, OLD.frecuencia_dias_semana, OLD.hora_preferida,
+               OLD.fecha_inicio, OLD.fecha_fin, OLD.estado, OLD.ultima_notificacion_enviada, OLD.ultima_toma_encolada) THEN
+            NEW.proxima_toma := OLD.proxima_toma;
+            RETURN NEW;
+        END IF;
+    END IF;
+
+    IF NEW.estado = 'activa' AND NEW.frecuencia_intervalo_min IS NOT NULL THEN
+        NEW.proxima_toma := fn_proxima_toma(
+            NEW.frecuencia_intervalo_min, NEW.frecuencia_veces_dia, NEW.frecuencia_dias_semana, NEW.hora_preferida,
+            NEW.fecha_inicio, NEW.fecha_fin,
+            GREATEST(NEW.ultima_notificacion_enviada, NEW.ultima_toma_encolada, statement_timestamp()),
+            COALESCE(NULLIF(current_setting('medialert.zona_horaria', true), ''), 'America/Bogota')
+        );
+    ELSE
+        NEW.proxima_toma := NULL;
+    END IF;
+    RETURN NEW;
+END;
+$$;
+
+-- Avisa al programador de recordatorios (canal 'medialert_alertas') de las alertas cuya
+-- programación cambió. La carga son ids separados por comas, en grupos de 500 para no superar
+-- el límite de 8000 bytes de NOTIFY. En UPDATE solo cuentan las columnas que definen la
+-- programación: las marcas de encolado y envío no generan avisos.
+CREATE OR REPLACE FUNCTION func_notificar_cambio_alerta()
+RETURNS TRIGGER LANGUAGE plpgsql AS $$
+DECLARE
+    v_ids TEXT;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        FOR v_ids IN
+            SELECT string_agg(id::TEXT, ',') FROM (SELECT id, (row_number() OVER (ORDER BY id) - 1) / 500 AS grupo FROM nuevas) t GROUP BY grupo
+        LOOP
+            PERFORM pg_notify('medialert_alertas', v_ids);
+        END LOOP;
+    ELSIF TG_OP = 'DELETE' THEN
+        FOR v_ids IN
+            SELECT string_agg(id::TEXT, ',') FROM (SELECT id, (row_number() OVER (ORDER BY id) - 1) / 500 AS grupo FROM viejas) t GROUP BY grupo
+        LOOP
+            PERFORM pg_notify('medialert_alertas', v_ids);
+        END LOOP;
+    ELSE
+        FOR v_ids IN
+            SELECT string_agg(id::TEXT, ',') FROM (
+                SELECT n.id, (row_number() OVER (ORDER BY n.id) - 1) / 500 AS grupo
+                FROM nuevas n JOIN viejas v ON v.id = n.id
+                WHERE (n.frecuencia_intervalo_min, n.frecuencia_veces_dia, n.frecuencia_dias_semana,
+                       n.hora_preferida, n.fecha_inicio, n.fecha_fin, n.estado)
+                      IS DISTINCT FROM
+                      (v.frecuencia_intervalo_min, v.frecuencia_veces_dia, v.frecuencia_dias_semana,
+                       v.hora_preferida, v.fecha_inicio, v.fecha_fin, v.estado)
+            ) t GROUP BY grupo
+        LOOP
+            PERFORM pg_notify('medialert_alertas', v_ids);
+        END LOOP;
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+-- Incrementa la versión de la tabla modificada (trigger FOR EACH STATEMENT: una vez por sentencia,
+-- no por fila). La fila de versiones_tabla queda bloqueada hasta el fin de la transacción, así que
+-- las escrituras concurrentes sobre una misma tabla se serializan en ese punto; con el volumen de
+-- escritura de la administración es aceptable y garantiza que la versión sea transaccional.
+CREATE OR REPLACE FUNCTION func_incrementar_version_tabla()
+RETURNS TRIGGER LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO versiones_tabla (tabla, version)
+    VALUES (TG_TABLE_NAME, nextval('versiones_tabla_seq'))
+    ON CONFLICT (tabla) DO UPDATE SET version = EXCLUDED.version;
+    RETURN NULL;
+END;
+$$;
+
+-- Versión de alertas en UPDATE: solo cambia si alguna fila cambió columnas distintas de las
+-- derivadas (las que excluye también la auditoría). Las marcas del programador y de los workers
+-- de notificaciones y la proxima_toma que recalcula el trigger no invalidan los ETag ni la caché
+-- de /admin/alertas y /estadisticas, ni se serializan con la administración en versiones_tabla.
+-- Por eso ninguna respuesta versionada por alertas incluye columnas derivadas: proxima_toma
+-- solo se sirve sin caché (/admin/alertas/proximas).
+CREATE OR REPLACE FUNCTION func_incrementar_version_alertas_update()
+RETURNS TRIGGER LANGUAGE plpgsql AS $$
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM nuevas n JOIN viejas v ON v.id = n.id
+        WHERE to_jsonb(n) - ARRAY['ultima_notificacion_enviada', 'ultima_toma_encolada', 'proxima_toma',
+                                  'frecuencia_intervalo_min', 'frecuencia_veces_dia', 'frecuencia_dias_semana']
+              IS DISTINCT FROM
+              to_jsonb(v) - ARRAY['ultima_notificacion_enviada', 'ultima_toma_encolada', 'proxima_toma',
+                                  'frecuencia_intervalo_min', 'frecuencia_veces_dia', 'frecuencia_dias_semana']
+    ) THEN
+        INSERT INTO versiones_tabla (tabla, version)
+        VALUES (TG_TABLE_NAME, nextval('versiones_tabla_seq'))
+        ON CONFLICT (tabla) DO UPDATE SET version = EXCLUDED.version;
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+-- Datos de la receta de cada alerta, calculados en vivo. Es la definición de receta_snapshot:
+-- 'datos' tiene las claves que devuelve services/alert_service.get_recipe_data().
+CREATE VIEW vista_receta AS
+SELECT
+    a.id AS alerta_id, a.usuario_id, a.medicamento_id, a.asignado_por_usuario_id, u.eps_id,
+    a.estado AS estado_alerta, m.estado_medicamento AS medicamento_estado, m.nombre AS medicamento_nombre,
+    jsonb_build_object(
+        'alerta_id', a.id, 'dosis', a.dosis, 'frecuencia', a.frecuencia,
+        'fecha_inicio', a.fecha_inicio, 'fecha_fin', a.fecha_fin, 'hora_preferida', a.hora_preferida,
+        'estado_alerta', a.estado,
+        'cliente_nombre', u.nombre, 'cliente_cedula', u.cedula, 'cliente_fecha_nacimiento', u.fecha_nacimiento,
+        'cliente_telefono', u.telefono, 'cliente_ciudad', u.ciudad,
+        'medicamento_nombre', m.nombre, 'medicamento_descripcion', m.descripcion,
+        'medicamento_composicion', m.composicion, 'medicamento_indicaciones', m.indicaciones,
+        'medicamento_sintomas_secundarios', m.sintomas_secundarios, 'medicamento_rango_edad', m.rango_edad,
+        'eps_nombre', e.nombre, 'eps_nit', e.nit, 'eps_logo_url', e.logo_url, 'eps_tipo_regimen', u.tipo_regimen,
+        'asignador_nombre', ap.nombre, 'asignador_cedula', ap.cedula, 'asignador_rol', ap.rol,
+        'usuario_id', a.usuario_id
+    ) AS datos
+FROM alertas a
+JOIN usuarios u ON a.usuario_id = u.id
+JOIN medicamentos m ON a.medicamento_id = m.id
+LEFT JOIN eps e ON u.eps_id = e.id
+LEFT JOIN usuarios ap ON a.asignado_por_usuario_id = ap.id;
+
+-- Recalcula el snapshot de las alertas indicadas; no reescribe las filas que no cambiaron.
+-- Devuelve cuántas filas insertó o actualizó.
+CREATE OR REPLACE FUNCTION fn_refrescar_receta_snapshot(p_alerta_ids INTEGER[])
+RETURNS INTEGER LANGUAGE plpgsql SECURITY DEFINER AS $$
+DECLARE
+    v_filas INTEGER;
+BEGIN
+    INSERT INTO receta_snapshot AS rs (
+        alerta_id, usuario_id, medicamento_id, asignado_por_usuario_id, eps_id,
+        estado_alerta, medicamento_estado, medicamento_nombre, datos
+    )
+    SELECT v.alerta_id, v.usuario_id, v.medicamento_id, v.asignado_por_usuario_id, v.eps_id,
+           v.estado_alerta, v.medicamento_estado, v.medicamento_nombre, v.datos
+    FROM vista_receta v
+    WHERE v.alerta_id = ANY(p_alerta_ids)
+    ON CONFLICT (alerta_id) DO UPDATE SET
+        usuario_id = EXCLUDED.usuario_id,
+        medicamento_id = EXCLUDED.medicamento_id,
+        asignado_por_usuario_id = EXCLUDED.asignado_por_usuario_id,
+        eps_id = EXCLUDED.eps_id,
+        estado_alerta = EXCLUDED.estado_alerta,
+        medicamento_estado = EXCLUDED.medicamento_estado,
+        medicamento_nombre = EXCLUDED.medicamento_nombre,
+        datos = EXCLUDED.datos,
+        actualizado_en = CURRENT_TIMESTAMP
+    WHERE (rs.datos, rs.medicamento_estado, rs.eps_id, rs.asignado_por_usuario_id)
+          IS DISTINCT FROM (EXCLUDED.datos, EXCLUDED.medicamento_estado, EXCLUDED.eps_id, EXCLUDED.asignado_por_usuario_id);
+    GET DIAGNOSTICS v_filas = ROW_COUNT;
+    RETURN v_filas;
+END;
+$$;
+
+-- Triggers de sentencia sobre alertas (INSERT y UPDATE, con tablas de transición): un solo
+-- refresco por sentencia. Los DELETE se propagan con ON DELETE CASCADE.
+CREATE OR REPLACE FUNCTION func_receta_snapshot_alertas()
+RETURNS TRIGGER LANGUAGE plpgsql SECURITY DEFINER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM fn_refrescar_receta_snapshot(ARRAY(SELECT id FROM nuevas));
+    ELSE
+        -- Solo las alertas con cambios en columnas que aparecen en la receta
+        -- (p. ej. no las que solo actualizan ultima_notificacion_enviada).
+        PERFORM fn_refrescar_receta_snapshot(ARRAY(
+            SELECT n.id FROM nuevas n JOIN viejas o ON o.id = n.id
+            WHERE (n.usuario_id, n.medicamento_id, n.asignado_por_usuario_id, n.dosis, n.frecuencia,
+                   n.fecha_inicio, n.fecha_fin, n.hora_preferida, n.estado)
+                  IS DISTINCT FROM
+                  (o.usuario_id, o.medicamento_id, o.asignado_por_usuario_id, o.dosis, o.frecuencia,
+                   o.fecha_inicio, o.fecha_fin, o.hora_preferida, o.estado)
+        ));
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+-- Propaga a receta_snapshot los cambios de usuarios (cliente o asignador), medicamentos y EPS.
+CREATE OR REPLACE FUNCTION func_receta_snapshot_dependencias()
+RETURNS TRIGGER LANGUAGE plpgsql SECURITY DEFINER AS $$
+DECLARE
+    v_ids INTEGER[];
+BEGIN
+    IF TG_TABLE_NAME = 'usuarios' THEN
+        v_ids := ARRAY(
+            SELECT n.id FROM nuevas n JOIN viejas o ON o.id = n.id
+            WHERE (n.nombre, n.cedula, n.fecha_nacimiento, n.telefono, n.ciudad, n.eps_id, n.tipo_regimen, n.rol)
+                  IS DISTINCT FROM
+                  (o.nombre, o.cedula, o.fecha_nacimiento, o.telefono, o.ciudad, o.eps_id, o.tipo_regimen, o.rol)
+        );
+        IF cardinality(v_ids) > 0 THEN
+            PERFORM fn_refrescar_receta_snapshot(ARRAY(
+                SELECT id FROM alertas WHERE usuario_id = ANY(v_ids)
+                UNION
+                SELECT id FROM alertas WHERE asignado_por_usuario_id = ANY(v_ids)
+            ));
+        END IF;
+    ELSIF TG_TABLE_NAME = 'medicamentos' THEN
+        v_ids := ARRAY(
+            SELECT n.id FROM nuevas n JOIN viejas o ON o.id = n.id
+            WHERE (n.nombre, n.descripcion, n.composicion, n.indicaciones, n.sintomas_secundarios,
+                   n.rango_edad, n.estado_medicamento)
+                  IS DISTINCT FROM
+                  (o.nombre, o.descripcion, o.composicion, o.indicaciones, o.sintomas_secundarios,
+                   o.rango_edad, o.estado_medicamento)
+        );
+        IF cardinality(v_ids) > 0 THEN
+            PERFORM fn_refrescar_receta_snapshot(ARRAY(SELECT id FROM alertas WHERE medicamento_id = ANY(v_ids)));
+        END IF;
+    ELSIF TG_TABLE_NAME = 'eps' THEN
+        v_ids := ARRAY(
+            SELECT n.id FROM nuevas n JOIN viejas o ON o.id = n.id
+            WHERE (n.nombre, n.nit, n.logo_url) IS DISTINCT FROM (o.nombre, o.nit, o.logo_url)
+        );
+        IF cardinality(v_ids) > 0 THEN
+            PERFORM fn_refrescar_receta_snapshot(ARRAY(SELECT alerta_id FROM receta_snapshot WHERE eps_id = ANY(v_ids)));
+        END IF;
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+-- Mantiene contadores_alertas_cliente con triggers de sentencia (INSERT, UPDATE y DELETE, cada
+-- uno con sus tablas de transición): suma por cliente las filas nuevas y resta las anteriores.
+-- Las filas se actualizan en orden de usuario_id para que dos sentencias concurrentes no se
+-- bloqueen mutuamente.
+CREATE OR REPLACE FUNCTION func_contadores_alertas_cliente()
+RETURNS TRIGGER LANGUAGE plpgsql SECURITY DEFINER AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        -- Sin INSERT: si se está borrando el cliente, su fila de contadores ya no existe.
+        UPDATE contadores_alertas_cliente c
+        SET alertas_activas = c.alertas_activas - d.activas,
+            alertas_total = c.alertas_total - d.total
+        FROM (
+            SELECT usuario_id, count(*) FILTER (WHERE estado = 'activa') AS activas, count(*) AS total
+            FROM viejas GROUP BY usuario_id
+        ) d
+        WHERE c.usuario_id = d.usuario_id;
+    ELSIF TG_OP = 'INSERT' THEN
+        INSERT INTO contadores_alertas_cliente AS c (usuario_id, alertas_activas, alertas_total)
+        SELECT usuario_id, count(*) FILTER (WHERE estado = 'activa'), count(*)
+        FROM nuevas GROUP BY usuario_id ORDER BY usuario_id
+        ON CONFLICT (usuario_id) DO UPDATE SET
+            alertas_activas = c.alertas_activas + EXCLUDED.alertas_activas,
+            alertas_total = c.alertas_total + EXCLUDED.alertas_total;
+    ELSE
+        -- UPDATE: cambios de estado o de cliente; el resto de columnas no altera los contadores.
+        INSERT INTO contadores_alertas_cliente AS c (usuario_id, alertas_activas, alertas_total)
+        SELECT usuario_id, sum(activas), sum(total)
+        FROM (
+            SELECT usuario_id, (estado = 'activa')::INTEGER AS activas, 1 AS total FROM nuevas
+            UNION ALL
+            SELECT usuario_id, -(estado = 'activa')::INTEGER, -1 FROM viejas
+        ) cambios
+        GROUP BY usuario_id
+        HAVING sum(activas) <> 0 OR sum(total) <> 0
+        ORDER BY usuario_id
+        ON CONFLICT (usuario_id) DO UPDATE SET
+            alertas_activas = c.alertas_activas + EXCLUDED.alertas_activas,
+            alertas_total = c.alertas_total + EXCLUDED.alertas_total;
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+-- Recalcula contadores_alertas_cliente desde alertas (carga inicial o corrección de diferencias).
+CREATE OR REPLACE FUNCTION fn_recalcular_contadores_alertas_cliente()
+RETURNS INTEGER LANGUAGE plpgsql SECURITY DEFINER AS $$
+DECLARE
+    v_filas INTEGER;
+BEGIN
+    LOCK TABLE alertas IN SHARE MODE;
+    DELETE FROM contadores_alertas_cliente;
+    INSERT INTO contadores_alertas_cliente (usuario_id, alertas_activas, alertas_total)
+    SELECT usuario_id, count(*) FILTER (WHERE estado = 'activa'), count(*)
+    FROM alertas GROUP BY usuario_id;
+    GET DIAGNOSTICS v_filas = ROW_COUNT;
+    RETURN v_filas;
+END;
+$$;
+
+-- Conteos de estadisticas_rollup calculados en vivo (recálculo y verificación).
+CREATE VIEW vista_estadisticas AS
+SELECT 'alertas_estado'::VARCHAR(30) AS dimension, a.estado::TEXT AS clave,
+       count(*) AS total, count(*) FILTER (WHERE a.estado = 'activa') AS activas
+FROM alertas a GROUP BY a.estado
+UNION ALL
+SELECT 'alertas_medicamento', a.medicamento_id::TEXT, count(*), count(*) FILTER (WHERE a.estado = 'activa')
+FROM alertas a GROUP BY a.medicamento_id
+UNION ALL
+SELECT 'alertas_eps', COALESCE(u.eps_id::TEXT, ''), count(*), count(*) FILTER (WHERE a.estado = 'activa')
+FROM alertas a JOIN usuarios u ON u.id = a.usuario_id GROUP BY COALESCE(u.eps_id::TEXT, '')
+UNION ALL
+SELECT 'alertas_ciudad', COALESCE(u.ciudad, ''), count(*), count(*) FILTER (WHERE a.estado = 'activa')
+FROM alertas a JOIN usuarios u ON u.id = a.usuario_id GROUP BY COALESCE(u.ciudad, '')
+UNION ALL
+SELECT 'clientes_registro_dia', COALESCE(u.fecha_registro::TEXT, ''), count(*),
+       count(*) FILTER (WHERE u.estado_usuario = 'activo')
+FROM usuarios u WHERE u.rol = 'cliente' GROUP BY COALESCE(u.fecha_registro::TEXT, '');
+
+-- Aplica a estadisticas_rollup los cambios de una sentencia sobre alertas. Las filas nuevas
+-- suman y las anteriores restan; EPS y ciudad se toman del cliente en ese momento (si cambian,
+-- func_estadisticas_usuario_mover traslada sus conteos antes de la actualización).
+-- Las claves se actualizan ordenadas para que dos sentencias concurrentes no se bloqueen
+-- mutuamente. Las filas de 'alertas_estado' son pocas y las escrituras concurrentes de alertas
+-- se serializan en ellas, igual que en versiones_tabla.
+CREATE OR REPLACE FUNCTION func_estadisticas_alertas()
+RETURNS TRIGGER LANGUAGE plpgsql SECURITY DEFINER AS $$
+DECLARE
+    v_cambios TEXT;
+BEGIN
+    v_cambios := CASE TG_OP
+        WHEN 'INSERT' THEN 'SELECT usuario_id, medicamento_id, estado, 1 AS signo FROM nuevas'
+        WHEN 'DELETE' THEN 'SELECT usuario_id, medicamento_id, estado, -1 AS signo FROM viejas'
+        ELSE 'SELECT usuario_id, medicamento_id, estado, 1 AS signo FROM nuevas
+              UNION ALL SELECT usuario_id, medicamento_id, estado, -1 FROM viejas'
+    END;
+    EXECUTE format($sql$
+        WITH c AS (%s),
+        cu AS (
+            -- Si el cliente se está borrando ya no aparece aquí: func_estadisticas_usuario_mover
+            -- descontó sus conteos de EPS y ciudad antes del borrado.
+            SELECT c.estado, c.signo, u.eps_id, u.ciudad FROM c JOIN usuarios u ON u.id = c.usuario_id
+        ),
+        d AS (
+            SELECT 'alertas_estado' AS dimension, estado::TEXT AS clave, estado, signo FROM c
+            UNION ALL SELECT 'alertas_medicamento', medicamento_id::TEXT, estado, signo FROM c
+            UNION ALL SELECT 'alertas_eps', COALESCE(eps_id::TEXT, ''), estado, signo FROM cu
+            UNION ALL SELECT 'alertas_ciudad', COALESCE(ciudad, ''), estado, signo FROM cu
+        )
+        INSERT INTO estadisticas_rollup AS r (dimension, clave, total, activas)
+        SELECT dimension, clave, sum(signo), COALESCE(sum(signo) FILTER (WHERE estado = 'activa'), 0)
+        FROM d
+        GROUP BY dimension, clave
+        HAVING sum(signo) <> 0 OR COALESCE(sum(signo) FILTER (WHERE estado = 'activa'), 0) <> 0
+        ORDER BY dimension, clave
+        ON CONFLICT (dimension, clave) DO UPDATE SET
+            total = r.total + EXCLUDED.total,
+            activas = r.activas + EXCLUDED.activas
+    $sql$, v_cambios);
+    RETURN NULL;
+END;
+$$;
+
+-- Antes de cambiar la EPS o la ciudad de un usuario (o de borrarlo) traslada (o descuenta) sus
+-- conteos de alertas en estadisticas_rollup, usando contadores_alertas_cliente. Se hace antes de
+-- la actualización para que las alertas que la propia sentencia modifique después (p. ej. al
+-- desactivar el cliente) ya se sumen a la EPS y ciudad nuevas. La fila del contador se bloquea
+-- (FOR UPDATE) para que una escritura concurrente de alertas del cliente no cambie los conteos
+-- entre la lectura y el traslado; el orden (contador y luego estadisticas_rollup) es el mismo
+-- que siguen los triggers de alertas.
+CREATE OR REPLACE FUNCTION func_estadisticas_usuario_mover()
+RETURNS TRIGGER LANGUAGE plpgsql SECURITY DEFINER AS $$
+DECLARE
+    v_activas INTEGER;
+    v_total INTEGER;
+BEGIN
+    IF TG_OP = 'UPDATE' AND OLD.eps_id IS NOT DISTINCT FROM NEW.eps_id
+                        AND OLD.ciudad IS NOT DISTINCT FROM NEW.ciudad THEN
+        RETURN NEW;
+    END IF;
+
+    SELECT alertas_activas, alertas_total INTO v_activas, v_total
+    FROM contadores_alertas_cliente WHERE usuario_id = OLD.id
+    FOR UPDATE;
+
+    IF v_total IS NOT NULL AND (v_total <> 0 OR v_activas <> 0) THEN
+        INSERT INTO estadisticas_rollup AS r (dimension, clave, total, activas)
+        SELECT dimension, clave, sum(total), sum(activas)
+        FROM (
+            VALUES ('alertas_eps', COALESCE(OLD.eps_id::TEXT, ''), -v_total, -v_activas),
+                   ('alertas_ciudad', COALESCE(OLD.ciudad, ''), -v_total, -v_activas)
+            UNION ALL
+            SELECT * FROM (
+                VALUES ('alertas_eps', COALESCE(NEW.eps_id::TEXT, ''), v_total, v_activas),
+                       ('alertas_ciudad', COALESCE(NEW.ciudad, ''), v_total, v_activas)
+            ) nuevos WHERE TG_OP = 'UPDATE'
+        ) AS d(dimension, clave, total, activas)
+        GROUP BY dimension, clave
+        HAVING sum(total) <> 0 OR sum(activas) <> 0
+        ORDER BY dimension, clave
+        ON CONFLICT (dimension, clave) DO UPDATE SET
+            total = r.total + EXCLUDED.total,
+            activas = r.activas + EXCLUDED.activas;
+    END IF;
+    RETURN COALESCE(NEW, OLD);
+END;
+$$;
+
+-- Clientes registrados por día (y cuántos siguen activos), con triggers de sentencia sobre usuarios.
+CREATE OR REPLACE FUNCTION func_estadisticas_clientes()
+RETURNS TRIGGER LANGUAGE plpgsql SECURITY DEFINER AS $$
+DECLARE
+    v_cambios TEXT;
+BEGIN
+    v_cambios := CASE TG_OP
+        WHEN 'INSERT' THEN 'SELECT rol, fecha_registro, estado_usuario, 1 AS signo FROM nuevas'
+        WHEN 'DELETE' THEN 'SELECT rol, fecha_registro, estado_usuario, -1 AS signo FROM viejas'
+        ELSE 'SELECT rol, fecha_registro, estado_usuario, 1 AS signo FROM nuevas
+              UNION ALL SELECT rol, fecha_registro, estado_usuario, -1 FROM viejas'
+    END;
+    EXECUTE format($sql$
+        INSERT INTO estadisticas_rollup AS r (dimension, clave, total, activas)
+        SELECT 'clientes_registro_dia', COALESCE(fecha_registro::TEXT, ''), sum(signo),
+               COALESCE(sum(signo) FILTER (WHERE estado_usuario = 'activo'), 0)
+        FROM (%s) c
+        WHERE rol = 'cliente'
+        GROUP BY COALESCE(fecha_registro::TEXT, '')
+        HAVING sum(signo) <> 0 OR COALESCE(sum(signo) FILTER (WHERE estado_usuario = 'activo'), 0) <> 0
+        ORDER BY 2
+        ON CONFLICT (dimension, clave) DO UPDATE SET
+            total = r.total + EXCLUDED.total,
+            activas = r.activas + EXCLUDED.activas
+    $sql$, v_cambios);
+    RETURN NULL;
+END;
+$$;
+
+-- Recalcula estadisticas_rollup desde vista_estadisticas (carga inicial o corrección).
+CREATE OR REPLACE FUNCTION fn_recalcular_estadisticas()
+RETURNS INTEGER LANGUAGE plpgsql SECURITY DEFINER AS $$
+DECLARE
+    v_filas INTEGER;
+BEGIN
+    LOCK TABLE alertas, usuarios IN SHARE MODE;
+    DELETE FROM estadisticas_rollup;
+    INSERT INTO estadisticas_rollup (dimension, clave, total, activas)
+    SELECT dimension, clave, total, activas FROM vista_estadisticas;
+    GET DIAGNOSTICS v_filas = ROW_COUNT;
+    RETURN v_filas;
+END;
+$$;
+
+-- Particiones iniciales: mes en curso y los tres siguientes.
+SELECT fn_crear_particiones_auditoria(3);
+
 -- ** SECCIÓN 6: DISPARADORES (TRIGGERS) **
 CREATE TRIGGER trg_usuarios_auditoria
 AFTER INSERT OR UPDATE OR DELETE ON usuarios
@@ -238,6 +1118,110 @@ CREATE TRIGGER trg_alertas_auditoria
 AFTER INSERT OR UPDATE OR DELETE ON alertas
 FOR EACH ROW EXECUTE FUNCTION func_disparador_auditoria_generico();
 
+CREATE TRIGGER trg_medicamentos_notificar_catalogo
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON medicamentos
+FOR EACH STATEMENT EXECUTE FUNCTION func_notificar_cambio_catalogo();
+
+CREATE TRIGGER trg_eps_notificar_catalogo
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON eps
+FOR EACH STATEMENT EXECUTE FUNCTION func_notificar_cambio_catalogo();
+
+CREATE TRIGGER trg_eps_version
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON eps
+FOR EACH STATEMENT EXECUTE FUNCTION func_incrementar_version_tabla();
+
+CREATE TRIGGER trg_usuarios_version
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON usuarios
+FOR EACH STATEMENT EXECUTE FUNCTION func_incrementar_version_tabla();
+
+CREATE TRIGGER trg_medicamentos_version
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON medicamentos
+FOR EACH STATEMENT EXECUTE FUNCTION func_incrementar_version_tabla();
+
+CREATE TRIGGER trg_alertas_version
+AFTER INSERT OR DELETE OR TRUNCATE ON alertas
+FOR EACH STATEMENT EXECUTE FUNCTION func_incrementar_version_tabla();
+
+CREATE TRIGGER trg_alertas_version_update
+AFTER UPDATE ON alertas REFERENCING OLD TABLE AS viejas NEW TABLE AS nuevas
+FOR EACH STATEMENT EXECUTE FUNCTION func_incrementar_version_alertas_update();
+
+CREATE TRIGGER trg_alertas_receta_snapshot_insert
+AFTER INSERT ON alertas REFERENCING NEW TABLE AS nuevas
+FOR EACH STATEMENT EXECUTE FUNCTION func_receta_snapshot_alertas();
+
+CREATE TRIGGER trg_alertas_receta_snapshot_update
+AFTER UPDATE ON alertas REFERENCING OLD TABLE AS viejas NEW TABLE AS nuevas
+FOR EACH STATEMENT EXECUTE FUNCTION func_receta_snapshot_alertas();
+
+CREATE TRIGGER trg_usuarios_receta_snapshot
+AFTER UPDATE ON usuarios REFERENCING OLD TABLE AS viejas NEW TABLE AS nuevas
+FOR EACH STATEMENT EXECUTE FUNCTION func_receta_snapshot_dependencias();
+
+CREATE TRIGGER trg_medicamentos_receta_snapshot
+AFTER UPDATE ON medicamentos REFERENCING OLD TABLE AS viejas NEW TABLE AS nuevas
+FOR EACH STATEMENT EXECUTE FUNCTION func_receta_snapshot_dependencias();
+
+CREATE TRIGGER trg_eps_receta_snapshot
+AFTER UPDATE ON eps REFERENCING OLD TABLE AS viejas NEW TABLE AS nuevas
+FOR EACH STATEMENT EXECUTE FUNCTION func_receta_snapshot_dependencias();
+
+CREATE TRIGGER trg_alertas_contadores_insert
+AFTER INSERT ON alertas REFERENCING NEW TABLE AS nuevas
+FOR EACH STATEMENT EXECUTE FUNCTION func_contadores_alertas_cliente();
+
+CREATE TRIGGER trg_alertas_contadores_update
+AFTER UPDATE ON alertas REFERENCING OLD TABLE AS viejas NEW TABLE AS nuevas
+FOR EACH STATEMENT EXECUTE FUNCTION func_contadores_alertas_cliente();
+
+CREATE TRIGGER trg_alertas_contadores_delete
+AFTER DELETE ON alertas REFERENCING OLD TABLE AS viejas
+FOR EACH STATEMENT EXECUTE FUNCTION func_contadores_alertas_cliente();
+
+CREATE TRIGGER trg_alertas_estadisticas_insert
+AFTER INSERT ON alertas REFERENCING NEW TABLE AS nuevas
+FOR EACH STATEMENT EXECUTE FUNCTION func_estadisticas_alertas();
+
+CREATE TRIGGER trg_alertas_estadisticas_update
+AFTER UPDATE ON alertas REFERENCING OLD TABLE AS viejas NEW TABLE AS nuevas
+FOR EACH STATEMENT EXECUTE FUNCTION func_estadisticas_alertas();
+
+CREATE TRIGGER trg_alertas_estadisticas_delete
+AFTER DELETE ON alertas REFERENCING OLD TABLE AS viejas
+FOR EACH STATEMENT EXECUTE FUNCTION func_estadisticas_alertas();
+
+CREATE TRIGGER trg_alertas_proxima_toma
+BEFORE INSERT OR UPDATE ON alertas
+FOR EACH ROW EXECUTE FUNCTION func_alertas_proxima_toma();
+
+CREATE TRIGGER trg_alertas_programacion_insert
+AFTER INSERT ON alertas REFERENCING NEW TABLE AS nuevas
+FOR EACH STATEMENT EXECUTE FUNCTION func_notificar_cambio_alerta();
+
+CREATE TRIGGER trg_alertas_programacion_update
+AFTER UPDATE ON alertas REFERENCING OLD TABLE AS viejas NEW TABLE AS nuevas
+FOR EACH STATEMENT EXECUTE FUNCTION func_notificar_cambio_alerta();
+
+CREATE TRIGGER trg_alertas_programacion_delete
+AFTER DELETE ON alertas REFERENCING OLD TABLE AS viejas
+FOR EACH STATEMENT EXECUTE FUNCTION func_notificar_cambio_alerta();
+
+CREATE TRIGGER trg_usuarios_estadisticas_mover
+BEFORE UPDATE OF eps_id, ciudad OR DELETE ON usuarios
+FOR EACH ROW EXECUTE FUNCTION func_estadisticas_usuario_mover();
+
+CREATE TRIGGER trg_usuarios_estadisticas_insert
+AFTER INSERT ON usuarios REFERENCING NEW TABLE AS nuevas
+FOR EACH STATEMENT EXECUTE FUNCTION func_estadisticas_clientes();
+
+CREATE TRIGGER trg_usuarios_estadisticas_update
+AFTER UPDATE ON usuarios REFERENCING OLD TABLE AS viejas NEW TABLE AS nuevas
+FOR EACH STATEMENT EXECUTE FUNCTION func_estadisticas_clientes();
+
+CREATE TRIGGER trg_usuarios_estadisticas_delete
+AFTER DELETE ON usuarios REFERENCING OLD TABLE AS viejas
+FOR EACH STATEMENT EXECUTE FUNCTION func_estadisticas_clientes();
+
 CREATE TRIGGER trg_usuarios_prevenir_delete_cliente
 BEFORE DELETE ON usuarios
 FOR EACH ROW EXECUTE FUNCTION func_prevenir_borrado_fisico_cliente();
@@ -246,6 +1230,18 @@ CREATE TRIGGER trg_medicamentos_prevenir_delete
 BEFORE DELETE ON medicamentos
 FOR EACH ROW EXECUTE FUNCTION func_prevenir_borrado_fisico_medicamento();
 
+CREATE TRIGGER trg_eventos_toma_solo_insercion
+BEFORE UPDATE ON eventos_toma
+FOR EACH STATEMENT EXECUTE FUNCTION func_eventos_toma_solo_insercion();
+
+CREATE TRIGGER trg_eventos_toma_sin_borrado
+BEFORE DELETE ON eventos_toma
+FOR EACH ROW EXECUTE FUNCTION func_eventos_toma_solo_insercion();
+
+CREATE TRIGGER trg_eventos_toma_sin_truncate
+BEFORE TRUNCATE ON eventos_toma
+FOR EACH STATEMENT EXECUTE FUNCTION func_eventos_toma_solo_insercion();
+
 CREATE TRIGGER trg_desactivar_alertas_usuario_inactivo
 AFTER UPDATE OF estado_usuario ON usuarios
 FOR EACH ROW EXECUTE FUNCTION func_desactivar_alertas_usuario_inactivo();